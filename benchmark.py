@@ -0,0 +1,232 @@
+"""Benchmark suite for the locator.
+
+Runs every solver over synthetic layouts (grid, random and collinear
+placements, 6 to 10000 receivers) and several batch sizes, and reports
+fixes/sec, p50/p99 latency, the peak traced memory of a solve and the
+blocks it leaves allocated. Each run is appended as one JSON line to the
+output file (bench_results.jsonl next to this script unless --out says
+otherwise) so runs can be compared over time.
+
+    python benchmark.py                 # full matrix
+    python benchmark.py --quick         # small layouts, a few seconds
+    python benchmark.py --solvers batch lsq --receivers 100 1000
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from layouts import LAYOUTS, random_points
+from local_tracker import Tracker, distance_matrix, locate_batch, locate_lsq, receiver_table
+from receiver_index import ReceiverIndex
+
+RECEIVER_COUNTS = [6, 100, 1000, 10000]
+BATCH_SIZES = [1, 100, 10000]
+SCALAR_SOLVERS = ["scalar", "indexed"]
+BATCH_SOLVERS = ["batch", "lsq", "parallel"]
+DEFAULT_SOLVERS = ["scalar", "indexed", "batch", "lsq"]
+MAX_MATRIX_CELLS = 20_000_000  # skip batches whose distance matrix is larger
+ALLOC_SAMPLES = 20             # solves traced by tracemalloc per case
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results.jsonl")
+# Traces of the snapshots themselves
+SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),)
+
+
+def run_scalar(solver, receivers, points, budget):
+    """Time Tracker.locate one fix at a time. Returns (latencies_ns, statuses)."""
+    if solver == "indexed":
+        receivers = ReceiverIndex(receivers)
+    tracker = Tracker("bench")
+    latencies = []
+    statuses = []
+    deadline = time.perf_counter() + budget
+    for x, y in points:
+        tracker.move_to(x, y)
+        start = time.perf_counter_ns()
+        fix = tracker.locate(receivers)
+        latencies.append(time.perf_counter_ns() - start)
+        statuses.append(fix.status)
+        if time.perf_counter() > deadline:
+            break
+    return latencies, statuses
+
+
+def batch_solver(solver, receivers):
+    """Return (solve, close) for a batch solver; solve(rows) returns the statuses."""
+    _, receiver_xy = receiver_table(receivers)
+    if solver == "batch":
+        return (lambda rows: locate_batch(rows, receiver_xy)[1]), (lambda: None)
+    if solver == "lsq":
+        return (lambda rows: locate_lsq(rows, receiver_xy)[1]), (lambda: None)
+    from parallel_locator import ParallelLocator
+    locator = ParallelLocator(receivers)
+    return (lambda rows: locator.locate(rows)[1]), locator.close
+
+
+def run_batch(solve, distances, batch, budget):
+    """Time `solve` over `batch` rows per call. Returns (latencies_ns, statuses)."""
+    latencies = []
+    statuses = []
+    deadline = time.perf_counter() + budget
+    for start in range(0, len(distances) - batch + 1, batch):
+        rows = distances[start:start + batch]
+        begin = time.perf_counter_ns()
+        status = solve(rows)
+        latencies.append(time.perf_counter_ns() - begin)
+        statuses.extend(status.tolist())
+        if time.perf_counter() > deadline:
+            break
+    return latencies, statuses
+
+
+def simulated_readings(receivers, points):
+    trackers = [Tracker(i, x, y) for i, (x, y) in enumerate(points)]
+    return distance_matrix(trackers, receivers)
+
+
+def traced_call(call):
+    """Run `call` under tracemalloc. Returns (peak bytes, blocks still allocated)."""
+    # A full collection also empties the free lists of floats and tuples,
+    # whose blocks would otherwise count as still allocated
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = call()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    gc.collect()
+    after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    tracemalloc.stop()
+    del result
+    return peak, sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+
+def measure_allocations(solver, receivers, points, batch):
+    # Peak traced memory and blocks left allocated per call, over a few calls
+    # (tracemalloc slows everything down, so this is a separate pass). Only
+    # the solve is traced: the index, tracker and rows are built beforehand
+    if solver in SCALAR_SOLVERS:
+        if solver == "indexed":
+            receivers = ReceiverIndex(receivers)
+        tracker = Tracker("bench")
+        tracker.locate(receivers)  # warm up, e.g. the cells of the index
+        samples = []
+        for x, y in points[:ALLOC_SAMPLES]:
+            tracker.move_to(x, y)
+            samples.append(traced_call(lambda: tracker.locate(receivers)))
+    else:
+        distances = simulated_readings(receivers, points[:ALLOC_SAMPLES * batch])
+        solve, close = batch_solver(solver, receivers)
+        try:
+            solve(distances[:batch])  # warm up, e.g. the pool of the parallel solver
+            samples = [traced_call(lambda: solve(distances[start:start + batch]))
+                       for start in range(0, len(distances) - batch + 1, batch)]
+        finally:
+            close()
+    peaks, blocks = zip(*samples)
+    return max(peaks), sum(blocks) / len(blocks)
+
+
+def run_case(solver, layout, count, batch, fixes, budget):
+    receivers = LAYOUTS[layout](count)
+    if solver in SCALAR_SOLVERS:
+        points = random_points(fixes, seed=count)
+        latencies, statuses = run_scalar(solver, receivers, points, budget)
+    else:
+        calls = max(1, fixes // batch)
+        points = random_points(calls * batch, seed=count)
+        solve, close = batch_solver(solver, receivers)
+        try:
+            latencies, statuses = run_batch(solve, simulated_readings(receivers, points), batch, budget)
+        finally:
+            close()
+
+    latencies = np.array(latencies, dtype=float)
+    solved = len(statuses)
+    peak, blocks = measure_allocations(solver, receivers, points, batch)
+    return {
+        "solver": solver,
+        "layout": layout,
+        "receivers": count,
+        "batch": batch,
+        "fixes": solved,
+        "fixes_per_sec": solved / (latencies.sum() / 1e9),
+        "p50_us": float(np.percentile(latencies, 50)) / 1e3,
+        "p99_us": float(np.percentile(latencies, 99)) / 1e3,
+        "alloc_peak_kib": peak / 1024,
+        "alloc_retained_blocks_per_call": blocks,
+        "status": {int(code): int(n) for code, n in zip(*np.unique(statuses, return_counts=True))},
+    }
+
+
+def cases(solvers, layouts, counts, batches):
+    for solver in solvers:
+        for layout in layouts:
+            for count in counts:
+                if solver in SCALAR_SOLVERS:
+                    yield solver, layout, count, 1
+                    continue
+                for batch in batches:
+                    if batch * count <= MAX_MATRIX_CELLS:
+                        yield solver, layout, count, batch
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local tracker solvers.")
+    parser.add_argument("--solvers", nargs="+", default=DEFAULT_SOLVERS,
+                        choices=SCALAR_SOLVERS + BATCH_SOLVERS)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument("--receivers", nargs="+", type=int, default=RECEIVER_COUNTS)
+    parser.add_argument("--batches", nargs="+", type=int, default=BATCH_SIZES)
+    parser.add_argument("--fixes", type=int, default=20000, help="fixes per case (upper bound)")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per case (upper bound)")
+    parser.add_argument("--quick", action="store_true", help="small layouts and budget")
+    parser.add_argument("--out", default=RESULTS_FILE, help="JSON lines file to append to")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.receivers = [6, 100]
+        args.batches = [1, 100]
+        args.fixes = 2000
+        args.budget = 0.5
+
+    results = []
+    print(f"{'solver':<9}{'layout':<10}{'recv':>6}{'batch':>7}{'fixes/s':>12}{'p50 us':>10}{'p99 us':>10}{'peak KiB':>10}")
+    for solver, layout, count, batch in cases(args.solvers, args.layouts, args.receivers, args.batches):
+        result = run_case(solver, layout, count, batch, args.fixes, args.budget)
+        results.append(result)
+        print(f"{solver:<9}{layout:<10}{count:>6}{batch:>7}{result['fixes_per_sec']:>12.0f}"
+              f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}{result['alloc_peak_kib']:>10.1f}")
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.out, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"Results appended to {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
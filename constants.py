@@ -4,4 +4,5 @@ SCREEN_NAME = "Local Tracker Tester"
 
 TRACKER_RADIUS = 10
 TRACKER_SPEED = 100
-RECEIVER_RADIUS = 8
\ No newline at end of file
+RECEIVER_RADIUS = 8
+READING_EPSILON = 0.01  # pixels a reading has to change to solve again
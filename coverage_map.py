@@ -0,0 +1,175 @@
+"""Offline ambiguity/coverage map of a receiver layout.
+
+Rasterizes the floor plan and records, per cell, which receiver resolves
+the two candidate points left by the two nearest receivers, and where no
+receiver can (dead zones). Tracker.locate can take the map to jump straight
+to the resolver instead of scanning the receivers one by one, and planners
+get a heatmap of the dead zones.
+
+    python coverage_map.py --cell 5 --out coverage.npz --heatmap coverage.png
+"""
+import argparse
+import struct
+
+import numpy as np
+
+from layouts import LAYOUT_WIDTH, LAYOUT_HEIGHT, sample_layout
+from local_tracker import Status, locate_batch, receiver_table
+
+LAYOUT_IMAGE = "images/sample_layout.png"
+DEFAULT_CELL_SIZE = 5
+CHUNK_CELLS = 4096  # cells solved per locate_batch call, bounds the memory
+
+# Values of the `resolver` array besides receiver columns
+DEAD = -1     # no receiver can tell the candidates apart
+TANGENT = -2  # the two nearest receivers are enough
+
+
+class CoverageMap():
+    """Per-cell nearest pair and resolver of a receiver layout.
+
+    `nearest` (2xHxW) holds the columns in `ids` of the two nearest
+    receivers of each cell, `resolver` (HxW) the column of the receiver
+    that resolves the candidates (or DEAD / TANGENT) and `depth` (HxW) how
+    many receivers the fallback loop has to skip to reach it.
+    """
+
+    def __init__(self, ids, cell_size, width, height, nearest, resolver, depth):
+        self.ids = list(ids)
+        self.cell_size = cell_size
+        self.width = width
+        self.height = height
+        self.nearest = nearest
+        self.resolver = resolver
+        self.depth = depth
+        self.__columns = {rec_id: i for i, rec_id in enumerate(self.ids)}
+
+    def resolver_id(self, x, y, id0, id1):
+        """Return the id of the receiver resolving a candidate at (x, y)
+        between receivers id0 and id1, None if the map doesn't know."""
+        resolver = self.__lookup(x, y, id0, id1)
+        if resolver is None or resolver < 0:
+            return None
+        return self.ids[resolver]
+
+    def is_dead(self, x, y, id0, id1):
+        """Whether no receiver of the layout can resolve a candidate at (x, y)
+        between receivers id0 and id1."""
+        return self.__lookup(x, y, id0, id1) == DEAD
+
+    def __lookup(self, x, y, id0, id1):
+        # Only cells with the same nearest pair are answered. Which receivers
+        # are aligned with a pair doesn't depend on the point, so the answer
+        # holds for the whole line between the candidates
+        col = int(x // self.cell_size)
+        row = int(y // self.cell_size)
+        if not (0 <= row < self.resolver.shape[0] and 0 <= col < self.resolver.shape[1]):
+            return None
+        pair = (self.nearest[0, row, col], self.nearest[1, row, col])
+        if pair != (self.__columns.get(id0), self.__columns.get(id1)):
+            return None
+        return self.resolver[row, col]
+
+    def dead_zones(self):
+        """Boolean HxW mask of the cells no receiver can resolve."""
+        return self.resolver == DEAD
+
+    def save(self, path):
+        np.savez_compressed(path, ids=np.array(self.ids, dtype=str),
+                            shape=np.array([self.cell_size, self.width, self.height]),
+                            nearest=self.nearest, resolver=self.resolver, depth=self.depth)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            cell_size, width, height = data["shape"].tolist()
+            return cls(data["ids"].tolist(), cell_size, width, height,
+                       data["nearest"], data["resolver"], data["depth"])
+
+    def save_heatmap(self, path, background=LAYOUT_IMAGE):
+        """Draw the map over the floor plan: green when the third receiver
+        resolves, yellow to red as the fallback goes deeper, dark red for
+        dead zones and blue where two receivers are enough."""
+        import pygame
+
+        rows, cols = self.resolver.shape
+        colors = np.zeros((rows, cols, 3), dtype=np.uint8)
+        depth = np.clip(self.depth, 0, 4) / 4
+        colors[..., 0] = (255 * np.minimum(1, 2 * depth)).astype(np.uint8)
+        colors[..., 1] = (255 * np.minimum(1, 2 - 2 * depth)).astype(np.uint8)
+        colors[self.resolver == DEAD] = (128, 0, 0)
+        colors[self.resolver == TANGENT] = (0, 0, 255)
+
+        overlay = pygame.surfarray.make_surface(colors.transpose(1, 0, 2))
+        overlay = pygame.transform.scale(overlay, (cols * self.cell_size, rows * self.cell_size))
+        overlay.set_alpha(110)
+        if background:
+            surface = pygame.image.load(background)
+        else:
+            surface = pygame.Surface((self.width, self.height))
+            surface.fill("white")
+        surface.blit(overlay, (0, 0))
+        pygame.image.save(surface, path)
+
+
+def build_coverage(receivers, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT, cell_size=DEFAULT_CELL_SIZE):
+    """Solve a tracker at the center of every cell and keep what resolved it."""
+    ids, receiver_xy = receiver_table(receivers)
+    cols = -(-width // cell_size)
+    rows = -(-height // cell_size)
+    centers_x = (np.arange(cols) + 0.5) * cell_size
+    centers_y = (np.arange(rows) + 0.5) * cell_size
+    cx, cy = np.meshgrid(centers_x, centers_y)
+    points = np.column_stack((cx.ravel(), cy.ravel()))
+
+    nearest = np.full((2, points.shape[0]), -1, dtype=np.int16)
+    resolver = np.full(points.shape[0], DEAD, dtype=np.int16)
+    depth = np.zeros(points.shape[0], dtype=np.int16)
+    for start in range(0, points.shape[0], CHUNK_CELLS):
+        chunk = slice(start, start + CHUNK_CELLS)
+        p = points[chunk]
+        distances = np.hypot(p[:, None, 0] - receiver_xy[None, :, 0], p[:, None, 1] - receiver_xy[None, :, 1])
+        _, status, used = locate_batch(distances, receiver_xy)
+
+        nearest[:, chunk] = used[:, :2].T
+        third = used[:, 2]
+        solved = (status == Status.OK) | (status == Status.NO_MATCH)
+        res = np.where(solved, third, DEAD)
+        res[status == Status.TANGENT] = TANGENT
+        resolver[chunk] = res
+        # Receivers closer than the resolver, besides the nearest pair
+        reach = np.take_along_axis(distances, np.maximum(third, 0)[:, None], axis=1)
+        depth[chunk] = np.where(solved, (distances < reach).sum(axis=1) - 2, 0)
+
+    shape = (rows, cols)
+    return CoverageMap(ids, cell_size, width, height, nearest.reshape((2,) + shape),
+                       resolver.reshape(shape), depth.reshape(shape))
+
+
+def png_size(path):
+    """Read (width, height) from the IHDR chunk of a PNG file."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+    return struct.unpack(">II", header[16:24])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the coverage map of the sample layout.")
+    parser.add_argument("--cell", type=int, default=DEFAULT_CELL_SIZE, help="cell size in pixels")
+    parser.add_argument("--image", default=LAYOUT_IMAGE, help="floor plan giving the map size")
+    parser.add_argument("--out", default="coverage.npz")
+    parser.add_argument("--heatmap", help="also save a PNG heatmap to this path")
+    args = parser.parse_args(argv)
+
+    width, height = png_size(args.image)
+    coverage = build_coverage(sample_layout(), width, height, args.cell)
+    coverage.save(args.out)
+    dead = coverage.dead_zones().mean() * 100
+    print(f"{coverage.resolver.size} cells, {dead:.1f}% dead zones, saved to {args.out}")
+    if args.heatmap:
+        coverage.save_heatmap(args.heatmap, args.image)
+        print(f"Heatmap saved to {args.heatmap}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Precomputed fingerprint solver for a fixed receiver layout.
+
+The floor plan is divided in cells and, for every receiver, the table keeps
+the cells it can be the nearest receiver of, with the distances from their
+centers to the FEATURES receivers around it. A fix picks the bucket of the
+nearest reading, narrows it with a binary search on the distance to that
+receiver and matches the rest of the readings against the remaining cells.
+The exact intersection of the two nearest circles then refines the cell
+center, if asked to.
+
+The table is a directory of .npy files that are memory-mapped when loaded,
+so a process starts without rebuilding it. It must be rebuilt when the
+receivers move.
+
+    python fingerprint.py --out fingerprint --cell 5
+"""
+import argparse
+import json
+import os
+from math import sqrt
+
+import numpy as np
+
+from layouts import LAYOUT_WIDTH, LAYOUT_HEIGHT, sample_layout
+from local_tracker import ABSOLUTE_TOLERANCE, Fix, Status, _candidate_points, _pair_geometry, receiver_table
+
+DEFAULT_CELL_SIZE = 5
+FEATURES = 6          # receivers compared per bucket, the bucket's own included
+MATCH_TOLERANCE = 2   # worst RMS mismatch accepted, in cell diagonals
+CHUNK_CELLS = 4096    # cells measured at once while building
+ARRAYS = ("features", "cells", "offsets", "neighbours", "aligned")
+
+
+class FingerprintTable():
+    """Memory-mapped fingerprint table, see build_fingerprint."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.ids = meta["ids"]
+        self.cell_size = meta["cell_size"]
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.receiver_xy = np.array(meta["receivers"], dtype=float).reshape(-1, 2)
+        self.cols = -(-self.width // self.cell_size)
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in ARRAYS}
+        self.features = arrays["features"]      # T x FEATURES distances, float32
+        self.cells = arrays["cells"]            # T flat cell indexes
+        self.offsets = arrays["offsets"]        # bucket i is rows offsets[i]:offsets[i+1]
+        self.neighbours = arrays["neighbours"]  # M x FEATURES receiver columns, -1 padded
+        self.aligned = arrays["aligned"]        # M, neighbours all on one line
+        self.__columns = {rec_id: i for i, rec_id in enumerate(self.ids)}
+        self.__tolerance = MATCH_TOLERANCE * self.cell_size * sqrt(2)
+
+    def matches(self, receivers):
+        """Whether the table was built for this receivers layout."""
+        ids, xy = receiver_table(receivers)
+        return ids == self.ids and np.array_equal(xy, self.receiver_xy)
+
+    def locate(self, readings, refine=True):
+        """Resolve a {receiver id: distance} mapping into a Fix.
+
+        Receivers missing from `readings` are not used. With `refine` the
+        position is the exact intersection point of the two nearest readings
+        on the side of the matched cell, otherwise the cell center.
+        """
+        columns = self.__columns
+        known = [(dist, columns[rec_id]) for rec_id, dist in readings.items() if rec_id in columns]
+        if len(known) < 2:
+            return Fix(Status.NOT_ENOUGH)
+        r0, col0 = min(known)
+        measured = dict((col, dist) for dist, col in known)
+
+        neighbours = self.neighbours[col0].tolist()
+        present = [i for i, col in enumerate(neighbours) if col >= 0 and col in measured]
+        used = tuple(self.ids[neighbours[i]] for i in present)
+        if len(present) < 3:
+            return Fix(Status.AMBIGUOUS, receivers=used)
+        if self.aligned[col0]:
+            return Fix(Status.ALIGNED, receivers=used)
+
+        # Cells whose distance to the nearest receiver agrees with the reading
+        # (within half a cell diagonal), found by bisection on the sorted bucket
+        start, stop = int(self.offsets[col0]), int(self.offsets[col0 + 1])
+        nearest = self.features[start:stop, 0]
+        half_diagonal = self.cell_size * sqrt(2) / 2
+        lo = start + int(nearest.searchsorted(r0 - half_diagonal, "left"))
+        hi = start + int(nearest.searchsorted(r0 + half_diagonal, "right"))
+        if lo == hi:
+            return Fix(Status.OUT_OF_RANGE, receivers=used)
+
+        window = self.features[lo:hi][:, present]
+        target = np.array([measured[neighbours[i]] for i in present], dtype=np.float32)
+        error = window - target
+        error = (error * error).sum(axis=1)
+        best = int(error.argmin())
+        if sqrt(error[best] / len(present)) > self.__tolerance:
+            return Fix(Status.NO_MATCH, receivers=used)
+
+        row, col = divmod(int(self.cells[lo + best]), self.cols)
+        x = (col + 0.5) * self.cell_size
+        y = (row + 0.5) * self.cell_size
+        if refine:
+            x, y = self.__refine(known, [neighbours[i] for i in present], target, x, y)
+        return Fix(Status.OK, x, y, used)
+
+    def locate_tracker(self, tracker, receivers, refine=True):
+        """locate() with the simulated readings of `tracker` to the live receivers."""
+        readings = {rec_id: tracker.report(rec) for rec_id, rec in receivers.items() if rec.is_alive}
+        fix = self.locate(readings, refine)
+        if fix.ok:
+            tracker.move_to(fix.x, fix.y)
+        return fix
+
+    def __refine(self, known, columns, target, x, y):
+        # Exact candidates of the two nearest circles, keep the one that best
+        # agrees with the compared readings. Near the line of the two
+        # receivers both candidates can fall in the matched cell, so the cell
+        # alone can't tell them apart. Readings that don't intersect keep it
+        (r0, col0), (r1, col1) = sorted(known)[:2]
+        x0, y0 = self.receiver_xy[col0].tolist()
+        x1, y1 = self.receiver_xy[col1].tolist()
+        dist, ux, uy, nx, ny = _pair_geometry(x0, y0, x1, y1)
+        if dist > r0 + r1 + ABSOLUTE_TOLERANCE:
+            return x, y
+        candidates = np.array(_candidate_points(r0, x0, y0, r1, dist, ux, uy, nx, ny))
+        gaps = candidates[:, None, :] - self.receiver_xy[columns][None, :, :]
+        error = np.sqrt((gaps * gaps).sum(axis=2)) - target
+        x, y = candidates[int((error * error).sum(axis=1).argmin())].tolist()
+        return x, y
+
+
+def build_fingerprint(receivers, path, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT,
+                      cell_size=DEFAULT_CELL_SIZE, features=FEATURES):
+    """Build the table of `receivers` into the directory `path` and load it."""
+    ids, receiver_xy = receiver_table(receivers)
+    m = len(ids)
+    k = min(features, m)
+
+    # The receivers compared in each bucket are the ones around its receiver
+    gaps = receiver_xy[:, None, :] - receiver_xy[None, :, :]
+    spacing = np.sqrt((gaps * gaps).sum(axis=2))
+    neighbours = np.full((m, features), -1, dtype=np.int32)
+    neighbours[:, :k] = np.argsort(spacing, axis=1, kind="stable")[:, :k]
+    aligned = np.array([_collinear(receiver_xy[row[row >= 0]]) for row in neighbours])
+
+    cols = -(-width // cell_size)
+    rows = -(-height // cell_size)
+    cy, cx = np.divmod(np.arange(rows * cols), cols)
+    centers = np.column_stack(((cx + 0.5) * cell_size, (cy + 0.5) * cell_size))
+
+    # A cell goes to every receiver within a cell diagonal of being its
+    # nearest, so trackers close to a bucket border still find their cell
+    margin = cell_size * sqrt(2)
+    buckets = [[] for _ in range(m)]
+    for start in range(0, len(centers), CHUNK_CELLS):
+        p = centers[start:start + CHUNK_CELLS]
+        gaps = p[:, None, :] - receiver_xy[None, :, :]
+        d = np.sqrt((gaps * gaps).sum(axis=2))
+        cell, rec = np.nonzero(d <= d.min(axis=1, keepdims=True) + margin)
+        for col in np.unique(rec):
+            buckets[col].append(start + cell[rec == col])
+
+    os.makedirs(path, exist_ok=True)
+    sizes = [sum(len(c) for c in bucket) for bucket in buckets]
+    offsets = np.zeros(m + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes)
+    table = np.lib.format.open_memmap(os.path.join(path, "features.npy"), mode="w+",
+                                      dtype=np.float32, shape=(int(offsets[-1]), features))
+    cells = np.lib.format.open_memmap(os.path.join(path, "cells.npy"), mode="w+",
+                                      dtype=np.int32, shape=(int(offsets[-1]),))
+    for col, bucket in enumerate(buckets):
+        if not bucket:
+            continue
+        members = np.concatenate(bucket)
+        gaps = centers[members][:, None, :] - receiver_xy[neighbours[col, :k]][None, :, :]
+        d = np.sqrt((gaps * gaps).sum(axis=2))
+        order = np.argsort(d[:, 0], kind="stable")
+        table[offsets[col]:offsets[col + 1], :k] = d[order]
+        table[offsets[col]:offsets[col + 1], k:] = np.nan
+        cells[offsets[col]:offsets[col + 1]] = members[order]
+    table.flush()
+    cells.flush()
+    del table, cells
+
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "neighbours.npy"), neighbours)
+    np.save(os.path.join(path, "aligned.npy"), aligned)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"ids": ids, "receivers": receiver_xy.tolist(), "cell_size": cell_size,
+                   "width": width, "height": height}, f)
+    return FingerprintTable(path)
+
+
+def _collinear(xy):
+    # Fewer than three points, or all of them on one line
+    if len(xy) < 3:
+        return True
+    centered = xy - xy.mean(axis=0)
+    return np.linalg.matrix_rank(centered, tol=ABSOLUTE_TOLERANCE) < 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the fingerprint table of the sample layout.")
+    parser.add_argument("--out", default="fingerprint", help="directory of the table")
+    parser.add_argument("--cell", type=int, default=DEFAULT_CELL_SIZE, help="cell size in pixels")
+    args = parser.parse_args(argv)
+
+    table = build_fingerprint(sample_layout(), args.out, cell_size=args.cell)
+    print(f"{len(table.cells)} cells over {len(table.ids)} receivers, saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
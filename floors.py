@@ -0,0 +1,170 @@
+"""Multi-floor buildings.
+
+Receivers and trackers have a `floor` and a height `z` next to x and y, and
+Tracker.report measures in 3D. A Building files the receivers by floor and
+solves a tracker with Tracker.locate_3d against the receivers of its
+candidate floor and the ADJACENT_FLOORS around it only. The cost of a solve
+then follows the receivers of a few floors, however many the building has.
+The candidate floor is the one of the tracker's last fix, so a tracker
+taking the stairs is followed from floor to floor. A unit spanning two
+floors just has receivers on both.
+
+    building = Building(stacked_layout(sample_layout, floors=4))
+    fix = building.locate(tracker)
+    fix.floor, fix.z
+
+    python floors.py --floors 1 4 16 --receivers 30
+"""
+import argparse
+import random
+import time
+from collections.abc import MutableMapping
+
+from layouts import LAYOUT_WIDTH, LAYOUT_HEIGHT, grid_layout
+from local_tracker import LSQ_RECEIVERS_3D, Receiver, Tracker
+
+FLOOR_HEIGHT = 40     # pixels between two floors, at the scale of the floor plans
+RECEIVER_HEIGHT = 30  # pixels over its floor a receiver is mounted at
+TRACKER_HEIGHT = 10   # pixels over its floor a tracker is carried at
+ADJACENT_FLOORS = 1   # floors above and below the candidate one that are searched
+
+
+class Building(MutableMapping):
+    """Receivers dict partitioned by floor, see the module docstring.
+
+    Like ReceiverIndex, a receiver moved to another floor through its
+    `floor` attribute is filed again.
+    """
+
+    def __init__(self, receivers=None, floor_height=FLOOR_HEIGHT, adjacent=ADJACENT_FLOORS,
+                 k=LSQ_RECEIVERS_3D):
+        self.floor_height = floor_height
+        self.adjacent = adjacent
+        self.k = k
+        self.floors = {}       # floor -> {receiver id: receiver}
+        self.__receivers = {}
+        self.__keys = {}       # id(receiver) -> key in this building
+        self.__floor_of = {}   # key -> floor it is filed in
+        self.__nearby = {}     # candidate floor -> receivers searched, dropped on changes
+        if receivers:
+            self.update(receivers)
+
+    def __getitem__(self, rec_id):
+        return self.__receivers[rec_id]
+
+    def __setitem__(self, rec_id, rec):
+        if rec_id in self.__receivers:
+            del self[rec_id]
+        self.__receivers[rec_id] = rec
+        self.__keys[id(rec)] = rec_id
+        rec._indexes = rec._indexes + (self,)
+        self.refresh(rec)
+
+    def __delitem__(self, rec_id):
+        rec = self.__receivers.pop(rec_id)
+        del self.__keys[id(rec)]
+        rec._indexes = tuple(index for index in rec._indexes if index is not self)
+        self.__unfile(rec_id)
+
+    def __iter__(self):
+        return iter(self.__receivers)
+
+    def __len__(self):
+        return len(self.__receivers)
+
+    def refresh(self, rec):
+        """File a receiver again after its floor changed."""
+        rec_id = self.__keys.get(id(rec))
+        if rec_id is None or self.__floor_of.get(rec_id) == rec.floor:
+            return
+        self.__unfile(rec_id)
+        self.floors.setdefault(rec.floor, {})[rec_id] = rec
+        self.__floor_of[rec_id] = rec.floor
+        self.__nearby.clear()
+
+    def floor_of(self, z):
+        return int(z // self.floor_height)
+
+    def nearby(self, floor):
+        """{id: receiver} of `floor` and the adjacent floors."""
+        receivers = self.__nearby.get(floor)
+        if receivers is None:
+            receivers = self.__nearby[floor] = {}
+            for near in range(floor - self.adjacent, floor + self.adjacent + 1):
+                receivers.update(self.floors.get(near, {}))
+        return receivers
+
+    def locate(self, tracker, floor=None):
+        """Solve a tracker in 3D around `floor`, the floor of its last fix by default."""
+        floor = tracker.floor if floor is None else floor
+        return tracker.locate_3d(self.nearby(floor), self.k,
+                                 z_hint=floor * self.floor_height + TRACKER_HEIGHT,
+                                 floor_height=self.floor_height)
+
+    def __unfile(self, rec_id):
+        floor = self.__floor_of.pop(rec_id, None)
+        if floor is None:
+            return
+        members = self.floors[floor]
+        del members[rec_id]
+        if not members:
+            del self.floors[floor]
+        self.__nearby.clear()
+
+
+def stacked_layout(layout, floors, floor_height=FLOOR_HEIGHT):
+    """The receivers of `layout()` (a layouts.py function) repeated on every
+    floor, named "F<floor>-<id>" and mounted RECEIVER_HEIGHT over it."""
+    receivers = {}
+    plan = [(rec_id, rec.x, rec.y) for rec_id, rec in layout().items()]
+    for floor in range(floors):
+        z = floor * floor_height + RECEIVER_HEIGHT
+        for rec_id, x, y in plan:
+            name = f"F{floor}-{rec_id}"
+            receivers[name] = Receiver(name, x, y, z=z, floor=floor)
+    return receivers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time 3D solves in buildings of growing height.")
+    parser.add_argument("--floors", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--receivers", type=int, default=30, help="receivers per floor, on a grid")
+    parser.add_argument("--solves", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'floors':>6} {'building us/solve':>18} {'flat us/solve':>14} {'right floor':>12} {'max error':>10}")
+    for floors in args.floors:
+        building = Building(stacked_layout(lambda: grid_layout(args.receivers), floors))
+        everything = dict(building)
+        rng = random.Random(args.seed)
+        points = [(rng.uniform(0, LAYOUT_WIDTH), rng.uniform(0, LAYOUT_HEIGHT), rng.randrange(floors))
+                  for _ in range(args.solves)]
+        tracker = Tracker("bench")
+
+        right = 0
+        worst = 0.0
+        start = time.perf_counter()
+        for x, y, floor in points:
+            tracker.move_to(x, y)
+            tracker.z = floor * FLOOR_HEIGHT + TRACKER_HEIGHT
+            fix = building.locate(tracker, floor)
+            if fix.ok:
+                right += fix.floor == floor
+                worst = max(worst, abs(fix.x - x), abs(fix.y - y))
+        building_time = time.perf_counter() - start
+
+        # The same solves over every receiver of the building
+        start = time.perf_counter()
+        for x, y, floor in points:
+            tracker.move_to(x, y)
+            tracker.z = floor * FLOOR_HEIGHT + TRACKER_HEIGHT
+            tracker.locate_3d(everything, building.k, z_hint=floor * FLOOR_HEIGHT + TRACKER_HEIGHT)
+        flat_time = time.perf_counter() - start
+
+        print(f"{floors:>6} {building_time / len(points) * 1e6:>18.1f} {flat_time / len(points) * 1e6:>14.1f} "
+              f"{right / len(points):>12.2%} {worst:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Receiver health monitoring.
+
+ReceiverHealth keeps, for every receiver, the residuals of its last readings
+against the solved positions (how far the reading is from the distance to
+the fix). A receiver whose share of bad residuals in the window goes over
+QUARANTINE_RATIO is quarantined: `is_quarantined` is set and the solvers
+stop selecting it. Quarantined receivers keep being scored against the fixes
+of the others and are restored once their share drops under RESTORE_RATIO.
+
+When a solve fails in a way a bad reading explains (OUT_OF_RANGE, NO_MATCH)
+the nearest readings are left out one at a time. The first one whose
+exclusion gives a fix it disagrees with is blamed and that fix is returned,
+so one broken receiver doesn't fail every solve around it until it is
+quarantined.
+"""
+from collections import deque
+
+import numpy as np
+
+from local_tracker import Status, batch_fixes, locate_batch, receiver_table
+
+HEALTH_WINDOW = 50        # residuals kept per receiver
+RESIDUAL_TOLERANCE = 2.0  # pixels, larger residuals count against the receiver
+QUARANTINE_RATIO = 0.5    # share of bad residuals that quarantines a receiver
+RESTORE_RATIO = 0.1       # share of bad residuals under which it is restored
+MIN_SAMPLES = 10          # residuals needed before a receiver is judged
+SUSPECTS = 3              # nearest readings left out in turn after a failed solve
+
+
+class ReceiverHealth():
+    """Residual windows, scores and quarantine of the receivers of a layout."""
+
+    def __init__(self, receivers, window=HEALTH_WINDOW, tolerance=RESIDUAL_TOLERANCE,
+                 min_samples=MIN_SAMPLES):
+        self.receivers = receivers
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.ids, self.receiver_xy = receiver_table(receivers)
+        self.quarantined = {rec_id for rec_id, rec in receivers.items() if rec.is_quarantined}
+        self.events = deque(maxlen=100)  # (receiver id, "quarantined" or "restored", score)
+        self.__columns = {rec_id: i for i, rec_id in enumerate(self.ids)}
+        self.__bad = {rec_id: deque(maxlen=window) for rec_id in self.ids}
+        self.__bad_count = dict.fromkeys(self.ids, 0)
+
+    def score(self, rec_id):
+        """Share of good residuals in the window, None until MIN_SAMPLES were seen."""
+        window = self.__bad[rec_id]
+        if len(window) < self.min_samples:
+            return None
+        return 1 - self.__bad_count[rec_id] / len(window)
+
+    def scores(self):
+        return {rec_id: self.score(rec_id) for rec_id in self.ids}
+
+    def record(self, rec_id, residual):
+        """Add a residual of a receiver and quarantine or restore it if needed."""
+        window = self.__bad[rec_id]
+        bad = abs(residual) > self.tolerance
+        if len(window) == window.maxlen:
+            self.__bad_count[rec_id] -= window[0]
+        window.append(bad)
+        self.__bad_count[rec_id] += bad
+
+        score = self.score(rec_id)
+        if score is None:
+            return
+        if rec_id not in self.quarantined and 1 - score >= QUARANTINE_RATIO:
+            self.__set_quarantine(rec_id, True, score)
+        elif rec_id in self.quarantined and 1 - score <= RESTORE_RATIO:
+            self.__set_quarantine(rec_id, False, score)
+
+    def observe(self, x, y, readings):
+        """Score the {receiver id: distance} readings against a position."""
+        for rec_id, dist in readings.items():
+            col = self.__columns.get(rec_id)
+            if col is None:
+                continue
+            rx, ry = self.receiver_xy[col].tolist()
+            dist_x = x - rx
+            dist_y = y - ry
+            self.record(rec_id, dist - (dist_x * dist_x + dist_y * dist_y) ** 0.5)
+
+    def locate(self, readings):
+        """Solve {receiver id: distance} readings without the quarantined receivers.
+
+        Every reading, quarantined or not, is scored against the fix. Returns
+        the Fix, the one left after blaming a reading when the full solve failed.
+        """
+        row = np.full((1, len(self.ids)), np.nan)
+        for rec_id, dist in readings.items():
+            col = self.__columns.get(rec_id)
+            if col is not None and rec_id not in self.quarantined:
+                row[0, col] = dist
+        fix = self.__solve(row)
+        if fix.ok:
+            self.observe(fix.x, fix.y, readings)
+            return fix
+        if fix.status not in (Status.OUT_OF_RANGE, Status.NO_MATCH):
+            return fix
+
+        # Leave out the nearest readings one at a time, a fix the left out
+        # reading disagrees with points at that receiver
+        for col in np.argsort(np.where(np.isnan(row[0]), np.inf, row[0]), kind="stable")[:SUSPECTS]:
+            trial = row.copy()
+            trial[0, col] = np.nan
+            retry = self.__solve(trial)
+            if not retry.ok:
+                continue
+            rx, ry = self.receiver_xy[col].tolist()
+            expected = ((retry.x - rx) * (retry.x - rx) + (retry.y - ry) * (retry.y - ry)) ** 0.5
+            if abs(row[0, col] - expected) > self.tolerance:
+                self.observe(retry.x, retry.y, readings)
+                return retry
+        return fix
+
+    def locate_tracker(self, tracker, receivers=None):
+        """locate() with the simulated readings of `tracker`, which is moved to the fix."""
+        receivers = self.receivers if receivers is None else receivers
+        fix = self.locate({rec_id: tracker.report(rec) for rec_id, rec in receivers.items()})
+        if fix.ok:
+            tracker.move_to(fix.x, fix.y)
+        return fix
+
+    def __solve(self, row):
+        return batch_fixes(self.ids, *locate_batch(row, self.receiver_xy))[0]
+
+    def __set_quarantine(self, rec_id, quarantined, score):
+        rec = self.receivers.get(rec_id)
+        if rec is not None:
+            rec.is_quarantined = quarantined
+        if quarantined:
+            self.quarantined.add(rec_id)
+        else:
+            self.quarantined.discard(rec_id)
+        self.events.append((rec_id, "quarantined" if quarantined else "restored", score))
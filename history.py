@@ -0,0 +1,400 @@
+"""Append-only position history.
+
+Every fix is a row (time, tracker, x, y, status, receivers used) appended to
+the active segment, a directory of preallocated memory-mapped column files.
+A full segment is sealed: its rows are rewritten sorted by tracker and time,
+with the offsets of each tracker's rows next to them, and a new segment is
+started. An append is a store into the memmaps, and only the active segment
+and the segments a query touches are mapped, so memory stays bounded however
+long the history gets. `max_segments` drops the oldest sealed segments.
+Rows name trackers and receivers by index; the ids behind them are
+appended to trackers.jsonl and receivers.jsonl, one line each, as they
+first show up. A row keeps up to `receiver_width` receivers, set when the
+store is created: the default fits the default k of every solver, a wider
+fix is refused rather than cut short.
+
+    history = HistoryStore("history")
+    history.attach()  # record every Tracker.locate/locate_lsq from now on
+    ...
+    rows = history.query("John", datetime(2024, 5, 3, 14, 0), datetime(2024, 5, 3, 14, 20), step=5)
+
+    python history.py history John 2024-05-03T14:00 2024-05-03T14:20 --step 5
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+
+from local_tracker import LSQ_RECEIVERS_3D, Status, add_fix_listener, remove_fix_listener
+
+SEGMENT_ROWS = 1 << 20  # rows per segment, about 64MB of columns
+RECEIVER_WIDTH = LSQ_RECEIVERS_3D  # receivers kept per row, the widest default solver
+LEGACY_RECEIVER_WIDTH = 3          # stores created before the width was configurable
+COLUMNS = ("time", "tracker", "x", "y", "status", "receivers")
+
+
+def column_dtypes(receiver_width):
+    # (dtype, shape) of each column of a segment
+    return {
+        "time": ("<f8", ()),
+        "tracker": ("<u4", ()),
+        "x": ("<f8", ()),
+        "y": ("<f8", ()),
+        "status": ("i1", ()),
+        "receivers": ("<i4", (receiver_width,)),  # indexes in HistoryStore.receivers, -1 when unused
+    }
+
+
+def record_dtype(receiver_width):
+    """dtype of the rows returned by HistoryStore.query."""
+    return np.dtype([("time", "<f8"), ("x", "<f8"), ("y", "<f8"),
+                     ("status", "i1"), ("receivers", "<i4", (receiver_width,))])
+
+
+class Segment():
+    """Column memmaps of one segment and its time span."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.sealed = meta["sealed"]
+        self.t_min = meta["t_min"]
+        self.t_max = meta["t_max"]
+        self.columns = None
+        self.tracker_start = None
+
+    @classmethod
+    def create(cls, path, capacity, receiver_width):
+        os.makedirs(path)
+        for name, (dtype, shape) in column_dtypes(receiver_width).items():
+            column = np.lib.format.open_memmap(os.path.join(path, name + ".npy"), mode="w+",
+                                               dtype=dtype, shape=(capacity,) + shape)
+            if name == "time":
+                # NaN marks the free rows, so the row count survives a crash
+                column[:] = np.nan
+            column.flush()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"rows": 0, "sealed": False, "t_min": None, "t_max": None}, f)
+        return cls(path)
+
+    def open(self):
+        if self.columns is None:
+            mode = "r" if self.sealed else "r+"
+            self.columns = {name: np.load(os.path.join(self.path, name + ".npy"), mmap_mode=mode)
+                            for name in COLUMNS}
+            if self.sealed:
+                self.tracker_start = np.load(os.path.join(self.path, "tracker_start.npy"))
+            else:
+                # Rows written since the last write_meta
+                free = np.isnan(self.columns["time"])
+                self.rows = int(free.argmax()) if free.any() else len(free)
+                self.__update_span()
+        return self.columns
+
+    def close(self):
+        if self.columns is not None and not self.sealed:
+            for column in self.columns.values():
+                column.flush()
+            self.write_meta()
+        self.columns = None
+        self.tracker_start = None
+
+    def overlaps(self, start, end):
+        return self.rows > 0 and self.t_min <= end and self.t_max >= start
+
+    def seal(self, tracker_count):
+        """Sort the rows by tracker and time, and index the trackers."""
+        columns = self.open()
+        rows = self.rows
+        order = np.lexsort((columns["time"][:rows], columns["tracker"][:rows]))
+        for column in columns.values():
+            column[:rows] = column[:rows][order]
+            column.flush()
+        tracker_start = np.searchsorted(columns["tracker"][:rows], np.arange(tracker_count + 1))
+        np.save(os.path.join(self.path, "tracker_start.npy"), tracker_start)
+        self.__update_span()
+        self.sealed = True
+        self.write_meta()
+        self.columns = None
+
+    def select(self, tracker, start, end):
+        """Rows of `tracker` between `start` and `end`, as a record_dtype array."""
+        columns = self.open()
+        dtype = record_dtype(columns["receivers"].shape[1])
+        if self.sealed:
+            if tracker + 1 >= len(self.tracker_start):
+                return np.zeros(0, dtype=dtype)
+            first, last = self.tracker_start[tracker:tracker + 2].tolist()
+            times = columns["time"][first:last]
+            rows = np.arange(first + np.searchsorted(times, start, "left"),
+                             first + np.searchsorted(times, end, "right"))
+        else:
+            times = columns["time"][:self.rows]
+            rows = np.flatnonzero((columns["tracker"][:self.rows] == tracker) & (times >= start) & (times <= end))
+            rows = rows[np.argsort(times[rows], kind="stable")]
+        records = np.zeros(len(rows), dtype=dtype)
+        for name in dtype.names:
+            records[name] = columns[name][rows]
+        return records
+
+    def write_meta(self):
+        meta = {"rows": self.rows, "sealed": self.sealed, "t_min": self.t_min, "t_max": self.t_max}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def __update_span(self):
+        times = self.columns["time"][:self.rows]
+        if self.rows:
+            self.t_min = float(times.min())
+            self.t_max = float(times.max())
+
+
+class HistoryStore():
+    """Segments of a history directory, appended to and queried by tracker.
+
+    `segment_rows` and `receiver_width` only apply to a new store, an
+    existing one keeps the values it was created with.
+    """
+
+    def __init__(self, path, segment_rows=SEGMENT_ROWS, max_segments=None, clock=time.time,
+                 receiver_width=RECEIVER_WIDTH):
+        self.path = path
+        self.max_segments = max_segments
+        self.clock = clock
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "history.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"segment_rows": segment_rows, "next_segment": 0, "receiver_width": receiver_width}
+        self.segment_rows = meta["segment_rows"]
+        self.receiver_width = meta.get("receiver_width", LEGACY_RECEIVER_WIDTH)
+        self.__next_segment = meta["next_segment"]
+        self.trackers = _read_ids(os.path.join(path, "trackers.jsonl"))    # tracker ids by index
+        self.receivers = _read_ids(os.path.join(path, "receivers.jsonl"))  # receiver ids by index
+        self.__tracker_index = {tracker_id: i for i, tracker_id in enumerate(self.trackers)}
+        self.__receiver_index = {rec_id: i for i, rec_id in enumerate(self.receivers)}
+        # Line buffered, a new id is on disk as soon as a row refers to it
+        self.__tracker_file = open(os.path.join(path, "trackers.jsonl"), "a", buffering=1)
+        self.__receiver_file = open(os.path.join(path, "receivers.jsonl"), "a", buffering=1)
+
+        self.segments = [Segment(os.path.join(path, name)) for name in sorted(os.listdir(path))
+                         if os.path.isfile(os.path.join(path, name, "meta.json"))]
+        if self.segments and not self.segments[-1].sealed:
+            self.__active = self.segments[-1]
+            self.__active.open()
+        else:
+            self.__active = self.__new_segment()
+        self.__columns = self.__active.columns
+        self.__row = self.__active.rows
+
+    def __len__(self):
+        return sum(segment.rows for segment in self.segments[:-1]) + self.__row
+
+    def append(self, timestamp, tracker_id, x, y, status, receivers=()):
+        """Add a fix, `receivers` being the ids of the receivers it used."""
+        if self.__row == self.segment_rows:
+            self.__rotate()
+        row = self.__row
+        columns = self.__columns
+        columns["time"][row] = _seconds(timestamp)
+        columns["tracker"][row] = self.__tracker(tracker_id)
+        columns["x"][row] = np.nan if x is None else x
+        columns["y"][row] = np.nan if y is None else y
+        columns["status"][row] = status
+        width = self.receiver_width
+        if len(receivers) > width:
+            raise ValueError(f"A fix of {len(receivers)} receivers doesn't fit a history "
+                             f"of receiver_width={width}.")
+        used = [self.__receiver(rec_id) for rec_id in receivers]
+        columns["receivers"][row] = used + [-1] * (width - len(used))
+        self.__row = row + 1
+
+    def append_many(self, timestamp, tracker_ids, positions, status, used, receiver_ids):
+        """Add the arrays of a locate_batch: the rows name the trackers in
+        `tracker_ids` and the columns of `used` the receivers in `receiver_ids`.
+        `used` may be narrower than the store, or wider if the extra columns
+        are only padding."""
+        n = len(tracker_ids)
+        used = np.asarray(used).reshape(n, -1)
+        width = self.receiver_width
+        if used.shape[1] > width:
+            if (used[:, width:] >= 0).any():
+                wide = int((used >= 0).sum(axis=1).max())
+                raise ValueError(f"A fix of {wide} receivers doesn't fit a history "
+                                 f"of receiver_width={width}.")
+            used = used[:, :width]
+        elif used.shape[1] < width:
+            used = np.pad(used, ((0, 0), (0, width - used.shape[1])), constant_values=-1)
+        times = np.broadcast_to(np.asarray(_seconds(timestamp), dtype=float), (n,))
+        trackers = np.fromiter((self.__tracker(tracker_id) for tracker_id in tracker_ids), dtype=np.uint32, count=n)
+        lookup = np.array([self.__receiver(rec_id) for rec_id in receiver_ids] + [-1], dtype=np.int32)
+        batch = {
+            "time": times,
+            "tracker": trackers,
+            "x": np.asarray(positions, dtype=float).reshape(-1, 2)[:, 0],
+            "y": np.asarray(positions, dtype=float).reshape(-1, 2)[:, 1],
+            "status": np.asarray(status),
+            "receivers": lookup[used],  # -1 picks the trailing -1
+        }
+        done = 0
+        while done < n:
+            if self.__row == self.segment_rows:
+                self.__rotate()
+            count = min(n - done, self.segment_rows - self.__row)
+            for name, values in batch.items():
+                self.__columns[name][self.__row:self.__row + count] = values[done:done + count]
+            self.__row += count
+            done += count
+
+    def query(self, tracker_id, start, end, step=None):
+        """Fixes of a tracker between `start` and `end` (datetimes or epoch
+        seconds), in time order, as a record_dtype array. With `step` (seconds)
+        only the first fix of every step is kept."""
+        dtype = record_dtype(self.receiver_width)
+        tracker = self.__tracker_index.get(tracker_id)
+        if tracker is None:
+            return np.zeros(0, dtype=dtype)
+        start = _seconds(start)
+        end = _seconds(end)
+        self.__sync()
+        parts = []
+        for segment in self.segments:
+            if not segment.overlaps(start, end):
+                continue
+            parts.append(segment.select(tracker, start, end))
+            if segment is not self.__active:
+                segment.close()
+        records = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        # Segments follow each other in time, but their spans may overlap
+        records = records[np.argsort(records["time"], kind="stable")]
+        if step and len(records):
+            buckets = np.floor(records["time"] / step)
+            records = records[np.concatenate(([True], buckets[1:] != buckets[:-1]))]
+        return records
+
+    def attach(self):
+        """Record the fix of every Tracker from now on, timed with `clock`."""
+        add_fix_listener(self.on_fix)
+
+    def detach(self):
+        remove_fix_listener(self.on_fix)
+
+    def on_fix(self, tracker, fix):
+        self.append(self.clock(), tracker.id, fix.x, fix.y, fix.status, fix.receivers)
+
+    def flush(self):
+        """Save the rows and the id tables, so a reopened store sees them."""
+        self.__sync()
+        for column in self.__columns.values():
+            column.flush()
+        self.__active.write_meta()
+        self.__write_meta()
+
+    def close(self):
+        self.flush()
+        self.__active.close()
+        self.__tracker_file.close()
+        self.__receiver_file.close()
+
+    def __sync(self):
+        # The active segment's row count and span, for queries
+        segment = self.__active
+        segment.rows = self.__row
+        if self.__row:
+            times = self.__columns["time"][:self.__row]
+            segment.t_min = float(times.min())
+            segment.t_max = float(times.max())
+
+    def __rotate(self):
+        self.__sync()
+        self.__active.seal(len(self.trackers))
+        self.__write_meta()
+        if self.max_segments is not None:
+            # The active segment doesn't count
+            while len(self.segments) > self.max_segments:
+                shutil.rmtree(self.segments.pop(0).path)
+        self.__active = self.__new_segment()
+        self.__columns = self.__active.columns
+        self.__row = 0
+
+    def __new_segment(self):
+        name = f"segment-{self.__next_segment:08d}"
+        self.__next_segment += 1
+        segment = Segment.create(os.path.join(self.path, name), self.segment_rows, self.receiver_width)
+        segment.open()
+        self.segments.append(segment)
+        self.__write_meta()
+        return segment
+
+    def __write_meta(self):
+        meta = {"segment_rows": self.segment_rows, "next_segment": self.__next_segment,
+                "receiver_width": self.receiver_width}
+        with open(os.path.join(self.path, "history.json"), "w") as f:
+            json.dump(meta, f)
+
+    def __tracker(self, tracker_id):
+        index = self.__tracker_index.get(tracker_id)
+        if index is None:
+            index = self.__tracker_index[tracker_id] = len(self.trackers)
+            self.trackers.append(tracker_id)
+            self.__tracker_file.write(json.dumps(tracker_id) + "\n")
+        return index
+
+    def __receiver(self, rec_id):
+        index = self.__receiver_index.get(rec_id)
+        if index is None:
+            index = self.__receiver_index[rec_id] = len(self.receivers)
+            self.receivers.append(rec_id)
+            self.__receiver_file.write(json.dumps(rec_id) + "\n")
+        return index
+
+
+def _read_ids(path):
+    # One JSON id per line. A line cut short by a crash is dropped, so the
+    # next id starts on a line of its own
+    if not os.path.exists(path):
+        return []
+    with open(path, "r+b") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    return [json.loads(line) for line in data[:end].splitlines()]
+
+
+def _seconds(timestamp):
+    # Epoch seconds of a datetime, numbers are taken as they are
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return timestamp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the fixes of a tracker from a history store.")
+    parser.add_argument("path")
+    parser.add_argument("tracker")
+    parser.add_argument("start", type=datetime.fromisoformat)
+    parser.add_argument("end", type=datetime.fromisoformat)
+    parser.add_argument("--step", type=float, help="seconds between the fixes printed")
+    args = parser.parse_args(argv)
+
+    history = HistoryStore(args.path)
+    records = history.query(args.tracker, args.start, args.end, args.step)
+    for record in records:
+        used = ", ".join(history.receivers[i] for i in record["receivers"].tolist() if i >= 0)
+        status = Status(int(record["status"]))
+        position = f"({record['x']:.2f}, {record['y']:.2f})" if status <= Status.TANGENT else "?"
+        print(f"{datetime.fromtimestamp(record['time']).isoformat(sep=' ')}  {position:<20} {status.name:<13}{used}")
+    print(f"{len(records)} fixes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import random
+
+from local_tracker import Receiver
+
+# Size of the floor plan in images/sample_layout.png
+LAYOUT_WIDTH = 800
+LAYOUT_HEIGHT = 600
+
+
+def sample_layout():
+    """The six receivers of the demos, over images/sample_layout.png."""
+    return {
+        "Rec1": Receiver("Rec1", 200, 200),
+        "Rec2": Receiver("Rec2", 200, 400),
+        "Rec3": Receiver("Rec3", 400, 200),
+        "Rec4": Receiver("Rec4", 400, 400),
+        "Rec5": Receiver("Rec5", 600, 200),
+        "Rec6": Receiver("Rec6", 600, 400),
+    }
+
+
+def grid_layout(count, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT):
+    """`count` receivers on a regular grid with the aspect ratio of the floor."""
+    cols = max(1, round((count * width / height) ** 0.5))
+    rows = -(-count // cols)
+    step_x = width / (cols + 1)
+    step_y = height / (rows + 1)
+    receivers = {}
+    for i in range(count):
+        row, col = divmod(i, cols)
+        rec_id = f"Rec{i + 1}"
+        receivers[rec_id] = Receiver(rec_id, step_x * (col + 1), step_y * (row + 1))
+    return receivers
+
+
+def random_layout(count, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT, seed=0):
+    """`count` receivers placed uniformly at random on the floor."""
+    rng = random.Random(seed)
+    receivers = {}
+    for i in range(count):
+        rec_id = f"Rec{i + 1}"
+        receivers[rec_id] = Receiver(rec_id, rng.uniform(0, width), rng.uniform(0, height))
+    return receivers
+
+
+def collinear_layout(count, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT):
+    """`count` receivers along one corridor.
+
+    No receiver can tell the two candidate points apart, so every solve goes
+    through the whole fallback loop of find_position.
+    """
+    step = width / (count + 1)
+    receivers = {}
+    for i in range(count):
+        rec_id = f"Rec{i + 1}"
+        receivers[rec_id] = Receiver(rec_id, step * (i + 1), height / 2)
+    return receivers
+
+
+LAYOUTS = {
+    "grid": grid_layout,
+    "random": random_layout,
+    "collinear": collinear_layout,
+}
+
+
+def random_points(count, width=LAYOUT_WIDTH, height=LAYOUT_HEIGHT, seed=0):
+    """`count` (x, y) tracker positions spread over the floor."""
+    rng = random.Random(seed)
+    return [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(count)]
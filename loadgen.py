@@ -0,0 +1,121 @@
+"""Load generator for position_server.py.
+
+Simulates trackers walking around the layout the server reports, sends
+their readings in READINGS frames as fast as the server takes them and
+counts the POSITIONS updates coming back on a subscription.
+
+    python loadgen.py --spawn                   # in-process server on loopback
+    python loadgen.py --tcp 127.0.0.1:7400 --trackers 2000 --duration 10
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from layouts import LAYOUT_WIDTH, LAYOUT_HEIGHT, sample_layout
+from local_tracker import Status
+from position_server import (LAYOUT, POSITIONS, READING_DTYPE, READINGS, SUBSCRIBE,
+                             PositionServer, encode_frame, read_frame)
+
+STEP = 2.0   # timestamp units between walk steps, more than the server window
+SPEED = 5.0  # pixels per step
+
+
+async def connect(args):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix)
+    host, port = args.tcp.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+async def subscribe(args, counts):
+    reader, writer = await connect(args)
+    writer.write(encode_frame(SUBSCRIBE))
+    await writer.drain()
+    try:
+        while True:
+            kind, records = await read_frame(reader)
+            if kind == POSITIONS:
+                counts["frames"] += 1
+                counts["updates"] += len(records)
+                counts["ok"] += int((records["status"] <= Status.TANGENT).sum())
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def send(args, counts):
+    reader, writer = await connect(args)
+    writer.write(encode_frame(LAYOUT))
+    await writer.drain()
+    _, layout = await read_frame(reader)
+    receiver_xy = np.column_stack((layout["x"], layout["y"]))
+
+    rng = np.random.default_rng(args.seed)
+    trackers = rng.uniform((0, 0), (LAYOUT_WIDTH, LAYOUT_HEIGHT), size=(args.trackers, 2))
+    records = np.empty(args.trackers * len(receiver_xy), dtype=READING_DTYPE)
+    records["tracker"] = np.repeat(np.arange(args.trackers), len(receiver_xy))
+    records["receiver"] = np.tile(np.arange(len(receiver_xy)), args.trackers)
+
+    step = 0
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        trackers += rng.uniform(-SPEED, SPEED, size=trackers.shape)
+        np.clip(trackers, (0, 0), (LAYOUT_WIDTH, LAYOUT_HEIGHT), out=trackers)
+        gaps = trackers[:, None, :] - receiver_xy[None, :, :]
+        records["distance"] = np.sqrt((gaps * gaps).sum(axis=2)).ravel()
+        records["timestamp"] = step * STEP
+        for start in range(0, len(records), args.frame):
+            chunk = records[start:start + args.frame]
+            writer.write(encode_frame(READINGS, chunk))
+            # Waits while the server isn't reading, that is its backpressure
+            await writer.drain()
+            counts["sent"] += 1
+            counts["readings"] += len(chunk)
+        step += 1
+    writer.close()
+
+
+async def run(args):
+    server = None
+    if args.spawn:
+        server = PositionServer(sample_layout())
+        host, port = await server.start_tcp("127.0.0.1", 0)
+        args.tcp = f"{host}:{port}"
+        args.unix = None
+
+    counts = dict.fromkeys(("sent", "readings", "frames", "updates", "ok"), 0)
+    subscriber = asyncio.create_task(subscribe(args, counts))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await send(args, counts)
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - start
+    subscriber.cancel()
+    if server is not None:
+        await server.close()
+
+    print(f"{counts['sent']} frames sent in {elapsed:.2f} s: {counts['sent'] / elapsed:.0f} frames/s, "
+          f"{counts['readings'] / elapsed:.0f} readings/s")
+    print(f"{counts['updates']} position updates in {counts['frames']} frames: "
+          f"{counts['updates'] / elapsed:.0f} updates/s, {counts['ok']} resolved")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the throughput of position_server.py.")
+    parser.add_argument("--tcp", default="127.0.0.1:7400", help="host:port of the server")
+    parser.add_argument("--unix", help="Unix socket path of the server instead of TCP")
+    parser.add_argument("--spawn", action="store_true", help="run a server in-process on loopback")
+    parser.add_argument("--trackers", type=int, default=500)
+    parser.add_argument("--frame", type=int, default=256, help="readings per frame")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=0.5, help="seconds to wait for the last updates")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
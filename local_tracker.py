@@ -1,78 +1,407 @@
+from array import array
+from collections import Counter
+from enum import IntEnum
+from heapq import heapify, heappop
+from itertools import islice
 from math import sqrt, isclose
+from operator import itemgetter
+from time import perf_counter_ns
+
+import numpy as np
 
 ABSOLUTE_TOLERANCE = 1e-6
+RELATIVE_TOLERANCE = 1e-9  # math.isclose default, mirrored by the batch path
+LSQ_RECEIVERS = 4          # readings used by the least-squares solver
+LSQ_CONDITION = 1e-9       # below this the least-squares receivers are aligned
+LSQ_RECEIVERS_3D = 8       # readings used by the 3D least-squares solver
+LSQ_PLANE_SLOPE = 0.5      # steeper planes of receivers can't be resolved by height
+PRIOR_MARGIN = 3.0         # gates between a prior and the candidate it rules out
+SORTED_READINGS = 32       # plain dicts up to this size are sorted, larger ones use a heap
+
+
+class Status(IntEnum):
+    # Outcome of a position solve, one value per exit of find_position
+    OK = 0            # resolved with the help of a third receiver
+    TANGENT = 1       # the two nearest circles touch at a single point
+    NOT_ENOUGH = 2    # less than two receivers reported
+    OUT_OF_RANGE = 3  # the two nearest circles do not intersect
+    AMBIGUOUS = 4     # two candidates and no third receiver to decide
+    ALIGNED = 5       # every other receiver is equidistant to both candidates
+    NO_MATCH = 6      # no candidate matches the third receiver reading
+
+
+class Registry():
+    """Struct-of-arrays storage behind Receiver and Tracker objects.
+
+    Coordinates live in the contiguous float arrays `x`, `y` and `z` (the
+    height, 0 for single floor layouts) next to the `floor` numbers, `alive`
+    is the active mask, `quarantined` flags the receivers excluded by the
+    health monitor and `ids` names the object of each row. Ids are only
+    unique within a layout, several layouts may share a registry. Receiver
+    and Tracker are thin views holding a row. The columns are
+    array.array buffers: the views index them as cheaply as a list, and
+    columns() exposes them to numpy without a copy for the batch solvers.
+    Rows released by collected objects are reused. `pairs` caches the
+    geometry of pairs of rows for find_position, and is cleared when a row is
+    released or a receiver moves (writes through columns() must call
+    moved() themselves).
+    """
+
+    def __init__(self, capacity=64):
+        self.x = array("d", bytes(8 * capacity))
+        self.y = array("d", bytes(8 * capacity))
+        self.z = array("d", bytes(8 * capacity))
+        self.floor = array("i", bytes(4 * capacity))
+        self.alive = array("b", bytes(capacity))
+        self.quarantined = array("b", bytes(capacity))
+        self.ids = [None] * capacity
+        self.size = 0  # rows handed out so far, used or released
+        self.pairs = PairGeometryCache()
+        self.__free = []
+
+    def add(self, id, x, y, alive=True, z=0.0, floor=0):
+        """Store a new entry and return its row."""
+        if self.__free:
+            row = self.__free.pop()
+        else:
+            if self.size == len(self.ids):
+                self.__grow()
+            row = self.size
+            self.size += 1
+        self.x[row] = x
+        self.y[row] = y
+        self.z[row] = z
+        self.floor[row] = floor
+        self.alive[row] = alive
+        self.quarantined[row] = False
+        self.ids[row] = id
+        return row
+
+    def release(self, row):
+        """Free a row so it can be reused."""
+        self.ids[row] = None
+        self.alive[row] = False
+        self.__free.append(row)
+        self.pairs.invalidate()
+
+    def moved(self):
+        """Forget the cached geometry after coordinates were changed."""
+        self.pairs.invalidate()
+
+    def columns(self):
+        """Return numpy views (x, y, alive) of the rows handed out so far.
+
+        The views share memory with the registry, writing to them moves the
+        objects. They go stale (but stay valid) when the registry grows.
+        """
+        x = np.frombuffer(self.x, dtype=np.float64, count=self.size)
+        y = np.frombuffer(self.y, dtype=np.float64, count=self.size)
+        alive = np.frombuffer(self.alive, dtype=np.int8, count=self.size).view(bool)
+        return x, y, alive
+
+    def rows(self, objects):
+        """Return the rows of some views of this registry as an array."""
+        return np.fromiter((obj._row for obj in objects), dtype=np.intp)
+
+    def xy(self, rows=None):
+        """Return the coordinates of the given rows (all by default) as Nx2."""
+        x, y, _ = self.columns()
+        if rows is None:
+            return np.column_stack((x, y))
+        return np.column_stack((x[rows], y[rows]))
+
+    def xyz(self, rows=None):
+        """Return the coordinates of the given rows (all by default) as Nx3."""
+        x, y, _ = self.columns()
+        z = np.frombuffer(self.z, dtype=np.float64, count=self.size)
+        if rows is None:
+            return np.column_stack((x, y, z))
+        return np.column_stack((x[rows], y[rows], z[rows]))
+
+    def __len__(self):
+        return self.size - len(self.__free)
+
+    def __grow(self):
+        # New buffers instead of resizing in place: numpy views of the old
+        # ones may still be alive and array.array can't resize under them
+        extra = len(self.ids)
+        self.x = self.x + array("d", bytes(8 * extra))
+        self.y = self.y + array("d", bytes(8 * extra))
+        self.z = self.z + array("d", bytes(8 * extra))
+        self.floor = self.floor + array("i", bytes(4 * extra))
+        self.alive = self.alive + array("b", bytes(extra))
+        self.quarantined = self.quarantined + array("b", bytes(extra))
+        self.ids.extend([None] * extra)
+
+
+class PairGeometryCache():
+    """Geometry of the pairs of rows of a Registry, for find_position.
+
+    Maps (first row, second row) to (dist, ux, uy, nx, ny), see
+    _pair_geometry. Receivers are fixed to the walls, so the square root and
+    the divisions only run the first time a pair is the nearest one. The
+    registry drops every pair when a receiver moves or a row is released.
+    """
+    __slots__ = ("entries", "hits", "misses", "invalidations")
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0  # pairs dropped
+
+    def invalidate(self):
+        if self.entries:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        """Return the counters and the current number of cached pairs."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.entries),
+        }
+
 
 class Receiver():
-    def __init__(self, id, x, y):
+    # Thin view over a row of a Registry (receiver_registry by default)
+    __slots__ = ("id", "is_active", "_registry", "_row", "_indexes")
+
+    def __init__(self, id, x, y, registry=None, z=0.0, floor=0):
+        self._registry = receiver_registry if registry is None else registry
+        self._row = self._registry.add(id, x, y, z=z, floor=floor)
+        self._indexes = ()  # spatial indexes holding this receiver
         self.id = id
-        self.x = x
-        self.y = y
         self.is_active = False
 
+    def __del__(self):
+        registry = getattr(self, "_registry", None)
+        if registry is not None:
+            registry.release(self._row)
+
+    @property
+    def x(self):
+        return self._registry.x[self._row]
+
+    @x.setter
+    def x(self, value):
+        self._registry.x[self._row] = value
+        self._registry.moved()
+        for index in self._indexes:
+            index.refresh(self)
+
+    @property
+    def y(self):
+        return self._registry.y[self._row]
+
+    @y.setter
+    def y(self, value):
+        self._registry.y[self._row] = value
+        self._registry.moved()
+        for index in self._indexes:
+            index.refresh(self)
+
+    @property
+    def z(self):
+        return self._registry.z[self._row]
+
+    @z.setter
+    def z(self, value):
+        self._registry.z[self._row] = value
+
+    @property
+    def floor(self):
+        return self._registry.floor[self._row]
+
+    @floor.setter
+    def floor(self, value):
+        self._registry.floor[self._row] = value
+        for index in self._indexes:
+            index.refresh(self)
+
+    @property
+    def is_alive(self):
+        return bool(self._registry.alive[self._row])
+
+    @is_alive.setter
+    def is_alive(self, value):
+        self._registry.alive[self._row] = bool(value)
+        for index in self._indexes:
+            index.refresh(self)
+
+    @property
+    def is_quarantined(self):
+        # Set by the health monitor (health.py), the solvers skip the receiver
+        return bool(self._registry.quarantined[self._row])
+
+    @is_quarantined.setter
+    def is_quarantined(self, value):
+        self._registry.quarantined[self._row] = bool(value)
+        for index in self._indexes:
+            index.refresh(self)
+
 class Tracker():
-    def __init__(self, id, x = 0, y = 0):
+    # Thin view over a row of a Registry (tracker_registry by default)
+    __slots__ = ("id", "is_active", "_registry", "_row")
+
+    def __init__(self, id, x = 0, y = 0, registry=None, z=0.0, floor=0):
         # Initialize the tracker at an impossible (physical) position 
         # that could be inside a wall or outside the building (0, 0)
+        self._registry = tracker_registry if registry is None else registry
+        self._row = self._registry.add(id, x, y, z=z, floor=floor)
         self.id = id
-        self.__x = x
-        self.__y = y
         self.is_active = False
 
+    def __del__(self):
+        registry = getattr(self, "_registry", None)
+        if registry is not None:
+            registry.release(self._row)
+
+    @property
+    def x(self):
+        return self._registry.x[self._row]
+
+    @x.setter
+    def x(self, value):
+        self._registry.x[self._row] = value
+
+    @property
+    def y(self):
+        return self._registry.y[self._row]
+
+    @y.setter
+    def y(self, value):
+        self._registry.y[self._row] = value
+
+    @property
+    def z(self):
+        return self._registry.z[self._row]
+
+    @z.setter
+    def z(self, value):
+        self._registry.z[self._row] = value
+
+    @property
+    def floor(self):
+        # Floor of the last 3D fix (see floors.py), or the one it was put on
+        return self._registry.floor[self._row]
+
+    @floor.setter
+    def floor(self, value):
+        self._registry.floor[self._row] = value
+
     def report(self, receiver):
         # This function will return the relative distance between
-        # the current tracker and the pointed receiver
-        return self.__measure_distance(self.__x, self.__y, receiver.x, receiver.y)
+        # the current tracker and the pointed receiver. Heights only
+        # differ on multi-floor layouts, elsewhere dist_z is 0. The receiver
+        # is read straight from its registry row, like the tracker
+        registry, row = self._registry, self._row
+        rec_registry, rec_row = receiver._registry, receiver._row
+        dist_x = registry.x[row] - rec_registry.x[rec_row]
+        dist_y = registry.y[row] - rec_registry.y[rec_row]
+        dist_z = registry.z[row] - rec_registry.z[rec_row]
+        return sqrt(dist_x * dist_x + dist_y * dist_y + dist_z * dist_z)
     
     def move_to(self, new_x, new_y):
         # Simulate tracker moving to another position
-        self.__x = new_x
-        self.__y = new_y
+        self._registry.x[self._row] = new_x
+        self._registry.y[self._row] = new_y
 
-    def find_position(self, receivers):
-        if len(receivers) < 2:
-            raise ValueError("Not enough trackers.")
+    def find_position(self, receivers, coverage=None):
+        # Raising version of locate(), kept for the callers that expect the
+        # (x, y, receivers used) tuple and a ValueError on failure
+        fix = self.locate(receivers, coverage)
+        if not fix.ok:
+            raise fix.error()
+        return (fix.x, fix.y, fix.receivers)
 
-        # Report to all the receivers and put the measures on a list
-        loc = []
-        for rec_id, rec in receivers.items():
-            dist = self.report(rec)
-            loc.append((dist, rec.x, rec.y, rec_id))
+    def locate(self, receivers, coverage=None, prior=None, readings=None):
+        # Solve the position and return a Fix. Nothing is raised and no
+        # message is formatted here, a failed solve is just another status.
+        # A CoverageMap of the layout (see coverage_map.py) replaces the
+        # fallback loop with a lookup when the third receiver can't decide.
+        # `prior` is a predicted (x, y, gate), see motion.py. `readings` are
+        # distances already measured, {receiver id: distance}, solved instead
+        # of reporting to the receivers (which only give their positions)
+        stats = _stats
+        if stats is None:
+            fix = self.__solve(receivers, coverage, prior, readings, None)
+        else:
+            stats.start()
+            fix = stats.record(self.__solve(receivers, coverage, prior, readings, stats))
+        if _fix_listeners:
+            for listener in _fix_listeners:
+                listener(self, fix)
+        return fix
 
-        # Sort the measures by distance and take the 3 lowest
-        loc = sorted(loc, key=lambda x: x[0])
+    def __solve(self, receivers, coverage, prior, readings, stats):
+        # Report to the receivers lazily, nearest first. Usually only the
+        # first 3 readings are consumed, the rest only by the fallback loop
+        loc = self.__readings(receivers, readings)
+        nearest = list(islice(loc, 2))
+        if len(nearest) < 2:
+            return Fix(Status.NOT_ENOUGH)
 
-        r0, x0, y0, id0 = loc[0] # nearest receiver
-        r1, x1, y1, id1 = loc[1] # second nearest receiver
+        (r0, x0, y0, id0, registry, row0), (r1, x1, y1, id1, registry1, row1) = nearest # two nearest receivers
+        if stats is not None:
+            stats.lap("intersect")
 
-        # Distance between the two first receivers
-        dist = sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+        # Distance between the two first receivers and the direction from the
+        # first to the second, cached by the registry of the receivers
+        pairs = registry.pairs
+        geometry = pairs.entries.get((row0, row1))
+        if geometry is None or registry1 is not registry:
+            pairs.misses += 1
+            geometry = _pair_geometry(x0, y0, x1, y1)
+            if registry1 is registry:
+                pairs.entries[row0, row1] = geometry
+        else:
+            pairs.hits += 1
+        dist, ux, uy, nx, ny = geometry
 
         # First we check the edge case
         if dist > (r0 + r1 + ABSOLUTE_TOLERANCE):
             # The circles do not intersects, it means something is very wrong
-            raise ValueError("Out of range or something is very wrong")
+            return Fix(Status.OUT_OF_RANGE)
         
         # Usually the circles should intesect in two points and one of them
         # must be our target. Let's calculate this intersection points
-        (x3_1, y3_1), (x3_2, y3_2) = self.__calculate_candidate_points(r0, x0, y0, r1, x1, y1, dist)
+        (x3_1, y3_1), (x3_2, y3_2) = self.__calculate_candidate_points(r0, x0, y0, r1, dist, ux, uy, nx, ny)
         # print(f"{self.id} is at: ({round(x3_1, 2)},{round(y3_1, 2)}) or ({round(x3_2, 2)},{round(y3_2, 2)})")
 
         # If the two candidates are the same point it means the two circles are tangent 
         # and we can calculate the position with two receivers
         if self.__compare_eq_dist(x3_1, x3_2) and self.__compare_eq_dist(y3_1, y3_2):
             # print("Tangency!!!!!!!")
-            self.__x , self.__y = x3_1, y3_1
-            return (self.__x , self.__y, (id0, id1))
+            self.move_to(x3_1, y3_1)
+            return Fix(Status.TANGENT, x3_1, y3_1, (id0, id1))
 
-        if len(receivers) < 3:
-            err_string = "\n".join([
-                    "Position not aquired. Another receiver is needed to resolve",
-                    "wich one of the two intersection points is the right one.",
-                    f"Could be ({round(x3_1, 2)},{round(y3_1, 2)}) or ({round(x3_2, 2)},{round(y3_2, 2)})"
-                    ])
-            raise ValueError(err_string, ((x3_1, x3_2), (y3_1, y3_2), (id0, id1)))
+        if stats is not None:
+            stats.lap("disambiguate")
+        if prior is not None:
+            # A prediction within `gate` of one candidate and PRIOR_MARGIN
+            # gates away from the other picks it without reading a third
+            # receiver. Nothing confirms such a fix, so it is flagged
+            # `predicted` (see motion.py)
+            px, py, gate = prior
+            dist_1 = self.__measure_distance(x3_1, y3_1, px, py)
+            dist_2 = self.__measure_distance(x3_2, y3_2, px, py)
+            if dist_1 <= gate and dist_2 > PRIOR_MARGIN * gate:
+                self.move_to(x3_1, y3_1)
+                return Fix(Status.OK, x3_1, y3_1, (id0, id1), predicted=True)
+            if dist_2 <= gate and dist_1 > PRIOR_MARGIN * gate:
+                self.move_to(x3_2, y3_2)
+                return Fix(Status.OK, x3_2, y3_2, (id0, id1), predicted=True)
 
-        r2, x2, y2, id2 = loc[2] # third nearest receiver
+        third = next(loc, None)
+        if third is None:
+            # Another receiver is needed to resolve which candidate is right
+            return Fix(Status.AMBIGUOUS, receivers=(id0, id1),
+                       candidates=((x3_1, x3_2), (y3_1, y3_2)))
+
+        r2, x2, y2, id2, _, _ = third # third nearest receiver
 
         # Measure the distance from the 3rd receiver to the 2 candidates
         test_p1 = self.__measure_distance(x3_1, y3_1, x2, y2)
@@ -80,51 +409,205 @@ class Tracker():
 
         # If the two values returned are the same we test with the other 
         # receivers until we find one that gets two different readings
+        tried = 0
+        if coverage is not None and self.__compare_eq_dist(test_p1, test_p2):
+            # The map knows which receiver resolves this pair, or that none
+            # of them does, so there is no need to go through them one by one
+            if coverage.is_dead(x3_1, y3_1, id0, id1):
+                return Fix(Status.ALIGNED, receivers=(id0, id1, id2),
+                           candidates=((x3_1, x3_2), (y3_1, y3_2)))
+            rec_id = coverage.resolver_id(x3_1, y3_1, id0, id1)
+            rec = None if rec_id is None else receivers.get(rec_id)
+            # A resolver that is down or quarantined can't be asked, nor one
+            # without a reading, the fallback loop below looks for another one
+            if rec is not None and rec.is_alive and not rec.is_quarantined:
+                reading = self.report(rec) if readings is None else readings.get(rec_id)
+                if reading is not None:
+                    r2, x2, y2, id2 = reading, rec.x, rec.y, rec_id
+                    test_p1 = self.__measure_distance(x3_1, y3_1, x2, y2)
+                    test_p2 = self.__measure_distance(x3_2, y3_2, x2, y2)
+
         if self.__compare_eq_dist(test_p1, test_p2):
-            for i in range(3, len(loc)):
-                # print(f"{id2} reported equal distance {round(test_p1, 2)}. Using other receiver: {loc[i][3]}")
-                r2, x2, y2, id2 = loc[i]
+            for tried, (r2, x2, y2, id2, _, _) in enumerate(loc, 1):
+                # print(f"Receiver reported equal distance {round(test_p1, 2)}. Using other receiver: {id2}")
                 test_p1 = self.__measure_distance(x3_1, y3_1, x2, y2)
                 test_p2 = self.__measure_distance(x3_2, y3_2, x2, y2)
                 if not self.__compare_eq_dist(test_p1, test_p2):
                     break
             else:
-                err_string = "\n".join([
-                    f"Position not aquired. The last receiver ({id2}) can't resolve",
-                    "when the two intersection points are at the same distance.",
-                    "Recommendation: Reposition the receivers or add more.",
-                    f"Could be ({round(x3_1, 2)},{round(y3_1, 2)}) or ({round(x3_2, 2)},{round(y3_2, 2)})"
-                    ])
-                raise ValueError(err_string, ((x3_1, x3_2), (y3_1, y3_2), (id0, id1, id2)))
+                # The last receiver tried can't resolve either
+                if stats is not None:
+                    stats.fallback[tried] += 1
+                return Fix(Status.ALIGNED, receivers=(id0, id1, id2),
+                           candidates=((x3_1, x3_2), (y3_1, y3_2)))
+        if stats is not None:
+            stats.fallback[tried] += 1
         
         # The one that matches the 3rd receiver measure is our taget
         if self.__compare_eq_dist(r2, test_p1):
-            self.__x , self.__y = x3_1, y3_1
+            x, y = x3_1, y3_1
         elif self.__compare_eq_dist(r2, test_p2):
-            self.__x , self.__y = x3_2, y3_2
+            x, y = x3_2, y3_2
+        else:
+            return Fix(Status.NO_MATCH, receivers=(id0, id1, id2))
+        self.move_to(x, y)
+        return Fix(Status.OK, x, y, (id0, id1, id2))
+
+    def find_position_lsq(self, receivers, k=LSQ_RECEIVERS):
+        # Raising version of locate_lsq(), returns the RMS residual and the
+        # covariance of the position after the usual tuple
+        fix = self.locate_lsq(receivers, k)
+        if not fix.ok:
+            raise fix.error()
+        return (fix.x, fix.y, fix.receivers, fix.residual, fix.covariance)
+
+    def locate_lsq(self, receivers, k=LSQ_RECEIVERS):
+        # Least-squares mode: the k nearest readings are solved together by
+        # the module locate_lsq, which tolerates noisy measures
+        fix = self.__solve_lsq(receivers, k)
+        if _fix_listeners:
+            for listener in _fix_listeners:
+                listener(self, fix)
+        return fix
+
+    def __solve_lsq(self, receivers, k):
+        readings = self.__readings(receivers)
+        loc = list(islice(readings, k))
+        while True:
+            distances = [reading[0] for reading in loc]
+            receiver_xy = [(x, y) for _, x, y, _, _, _ in loc]
+            positions, status, used, residual, covariance = locate_lsq(distances, receiver_xy, len(loc))
+            if status[0] != Status.ALIGNED:
+                break
+            # Aligned receivers take in as many readings again, until they
+            # resolve or there are none left, like the fallback loop of
+            # find_position
+            more = list(islice(readings, len(loc)))
+            if not more:
+                break
+            loc += more
+
+        ids = tuple(loc[i][3] for i in used[0] if i >= 0)
+        if status[0] != Status.OK:
+            return Fix(Status(status[0]), receivers=ids)
+        x, y = float(positions[0, 0]), float(positions[0, 1])
+        self.move_to(x, y)
+        return Fix(Status.OK, x, y, ids,
+                   residual=float(residual[0]), covariance=covariance[0])
+
+    def locate_3d(self, receivers, k=LSQ_RECEIVERS_3D, z_hint=None, floor_height=None):
+        # 3D mode for receivers at several heights (see floors.py): the k
+        # nearest readings are solved by the module locate_lsq_3d. `z_hint`
+        # picks between the two mirror positions left when those receivers
+        # are coplanar, and with `floor_height` the fix gets its floor
+        fix = self.__solve_3d(receivers, k, z_hint, floor_height)
+        if _fix_listeners:
+            for listener in _fix_listeners:
+                listener(self, fix)
+        return fix
+
+    def __solve_3d(self, receivers, k, z_hint, floor_height):
+        readings = self.__readings(receivers)
+        loc = []
+        while True:
+            # Receivers that leave the side undecided take in the next k
+            # nearest readings, like the fallback loop of find_position
+            more = list(islice(readings, k))
+            if loc and not more:
+                break
+            loc += more
+            distances = [reading[0] for reading in loc]
+            receiver_xyz = [(x, y, registry.z[row]) for _, x, y, _, registry, row in loc]
+            positions, status, used, residual = locate_lsq_3d(distances, receiver_xyz, len(loc), z_hint)
+            if status[0] != Status.ALIGNED or len(more) < k:
+                break
+
+        ids = tuple(loc[i][3] for i in used[0] if i >= 0)
+        if status[0] != Status.OK:
+            return Fix(Status(status[0]), receivers=ids)
+        x, y, z = positions[0].tolist()
+        self.move_to(x, y)
+        self.z = z
+        floor = None
+        if floor_height is not None:
+            floor = self.floor = int(z // floor_height)
+        return Fix(Status.OK, x, y, ids, residual=float(residual[0]), z=z, floor=floor)
+
+    def __readings(self, receivers, readings=None):
+        # Iterator of (distance, x, y, id, registry, row) for each receiver,
+        # nearest first
+        if readings is not None:
+            loc = list(self.__given(readings, receivers))
+        elif hasattr(receivers, "nearest"):
+            # A spatial index walks its grid outwards from the last known
+            # position and only the receivers it yields are asked to report
+            return self.__measure(receivers.nearest(self.x, self.y, self.z))
         else:
-            raise ValueError("Could not get position.")
-        return (self.__x , self.__y, (id0, id1, id2))
+            loc = list(self.__measure(receivers.items(), skip_quarantined=True))
+        if len(loc) <= SORTED_READINGS:
+            # Small dicts are sorted outright, which is cheaper than a heap
+            # at this size. The sort is stable, so the position in the dict
+            # breaks ties
+            loc.sort(key=itemgetter(0))
+            return iter(loc)
+        return self.__heap_readings(loc)
+
+    def __heap_readings(self, loc):
+        # Larger dicts go to a heap so only the readings that are consumed
+        # pay for the ordering. The position in the dict breaks ties, like
+        # the sort
+        heap = [(reading[0], order) for order, reading in enumerate(loc)]
+        heapify(heap)
+        while heap:
+            yield loc[heappop(heap)[1]]
+
+    def __given(self, readings, receivers):
+        # (distance, x, y, id, registry, row) of {receiver id: distance} readings measured
+        # elsewhere, but the quarantined receivers, in the order of the dict
+        for rec_id, dist in readings.items():
+            rec = receivers[rec_id]
+            registry, row = rec._registry, rec._row
+            if not registry.quarantined[row]:
+                yield (dist, registry.x[row], registry.y[row], rec_id, registry, row)
 
-    def __calculate_candidate_points(self, r0, x0, y0, r1, x1, y1, dist):
+    def __measure(self, items, skip_quarantined=False):
+        # Yields report() of each (id, receiver) as (distance, x, y, id,
+        # registry, row), with the coordinates read straight from the registry
+        # rows: this is the hot loop of every solve and the properties cost
+        # more than the math
+        registry, row = self._registry, self._row
+        tx, ty, tz = registry.x[row], registry.y[row], registry.z[row]
+        for rec_id, rec in items:
+            rec_registry, rec_row = rec._registry, rec._row
+            if skip_quarantined and rec_registry.quarantined[rec_row]:
+                continue
+            x = rec_registry.x[rec_row]
+            y = rec_registry.y[rec_row]
+            dist_x = tx - x
+            dist_y = ty - y
+            dist_z = tz - rec_registry.z[rec_row]
+            yield (sqrt(dist_x * dist_x + dist_y * dist_y + dist_z * dist_z), x, y, rec_id, rec_registry, rec_row)
+
+    def __calculate_candidate_points(self, r0, x0, y0, r1, dist, ux, uy, nx, ny):
         # This helper calculates the two points of intersection of 2 circles
         # https://paulbourke.net/geometry/circlesphere/
         # l1 = (r0^2 - r1^2 + dist ^2) / (2*dist)
-        l1 = (r0 ** 2 - r1 ** 2 + dist ** 2) / (2 * dist)
+        l1 = (r0 * r0 - r1 * r1 + dist * dist) / (2 * dist)
 
         # l2 = sqrt(r0^2 - l1^2)
-        l2 = sqrt(abs(r0 ** 2 - l1 ** 2))
+        l2 = sqrt(abs(r0 * r0 - l1 * l1))
 
-        # p2 = p0 + l1 * (p1 - p0) / dist
-        x2 = x0 + l1 * (x1 - x0) / dist
-        y2 = y0 + l1 * (y1 - y0) / dist
+        # p2 = p0 + l1 * u, with u = (p1 - p0) / dist
+        x2 = x0 + l1 * ux
+        y2 = y0 + l1 * uy
 
-        # This are the two points candidates, the intersection of the 2 circles:
-        # x3_1 = x2 + l2 * (y1 - y0) / dist  ||  y3_1 = y2 - l2 * (x1 - x0) / dist
-        # x3_2 = x2 - l2 * (y1 - y0) / dist  ||  y3_2 = y2 + l2 * (x1 - x0) / dist 
+        # This are the two points candidates, the intersection of the 2 circles,
+        # with n = (uy, -ux) the normal to the line between the receivers:
+        # x3_1 = x2 + l2 * nx  ||  y3_1 = y2 + l2 * ny
+        # x3_2 = x2 - l2 * nx  ||  y3_2 = y2 - l2 * ny
         return (
-            (x2 + l2 * (y1 - y0) / dist, y2 - l2 * (x1 - x0) / dist),
-            (x2 - l2 * (y1 - y0) / dist, y2 + l2 * (x1 - x0) / dist)
+            (x2 + l2 * nx, y2 + l2 * ny),
+            (x2 - l2 * nx, y2 - l2 * ny)
         )
 
     def __measure_distance(self, x, y, rx, ry):
@@ -132,7 +615,7 @@ class Tracker():
         # and the given receiver position (rx, ry) 
         dist_x = x - rx
         dist_y = y - ry
-        dist = sqrt(dist_x ** 2 + dist_y ** 2)
+        dist = sqrt(dist_x * dist_x + dist_y * dist_y)
 
         return dist
 
@@ -140,4 +623,602 @@ class Tracker():
         return isclose(d1, d2, abs_tol=ABSOLUTE_TOLERANCE)
 
 
+class Fix():
+    """Outcome of a position solve.
+
+    Holds the Status, the position when it was resolved, the ids of the
+    receivers used and, for AMBIGUOUS and ALIGNED solves, the two candidate
+    points as ((x1, x2), (y1, y2)). The least-squares mode also fills the
+    residual and the covariance, and the 3D mode the height `z` and the
+    `floor`. `predicted` fixes were picked by a prior without a third
+    reading to confirm them. The human readable message is only built when
+    `message` is read.
+    """
+    __slots__ = ("status", "x", "y", "receivers", "candidates", "residual", "covariance", "z", "floor",
+                 "predicted")
+
+    def __init__(self, status, x=None, y=None, receivers=(), candidates=None,
+                 residual=None, covariance=None, z=None, floor=None, predicted=False):
+        self.status = status
+        self.x = x
+        self.y = y
+        self.receivers = receivers
+        self.candidates = candidates
+        self.residual = residual
+        self.covariance = covariance
+        self.z = z
+        self.floor = floor
+        self.predicted = predicted
+
+    @property
+    def ok(self):
+        return self.status <= Status.TANGENT
+
+    @property
+    def message(self):
+        if self.ok:
+            return f"Position aquired at ({round(self.x, 2)},{round(self.y, 2)})"
+        if self.status == Status.NOT_ENOUGH:
+            return "Not enough trackers."
+        if self.status == Status.OUT_OF_RANGE:
+            return "Out of range or something is very wrong"
+        if self.status == Status.NO_MATCH:
+            return "Could not get position."
+        if self.candidates is None:
+            # Least-squares fixes have no candidate points
+            if self.status == Status.AMBIGUOUS:
+                return "Position not aquired. At least three receivers are needed."
+            return "Position not aquired. The nearest receivers are aligned."
+
+        (x3_1, x3_2), (y3_1, y3_2) = self.candidates
+        could_be = f"Could be ({round(x3_1, 2)},{round(y3_1, 2)}) or ({round(x3_2, 2)},{round(y3_2, 2)})"
+        if self.status == Status.AMBIGUOUS:
+            return "\n".join([
+                "Position not aquired. Another receiver is needed to resolve",
+                "wich one of the two intersection points is the right one.",
+                could_be
+                ])
+        return "\n".join([
+            f"Position not aquired. The last receiver ({self.receivers[-1]}) can't resolve",
+            "when the two intersection points are at the same distance.",
+            "Recommendation: Reposition the receivers or add more.",
+            could_be
+            ])
+
+    def error(self):
+        """Return the ValueError find_position raises for this fix."""
+        if self.candidates is None:
+            return ValueError(self.message)
+        return ValueError(self.message, self.candidates + (self.receivers,))
+
+    def __repr__(self):
+        return f"Fix({self.status.name}, x={self.x}, y={self.y}, receivers={self.receivers})"
+
+
+class SolverStats():
+    """Counters and stage timings of Tracker.locate (and find_position).
+
+    Collected only while enabled with enable_stats(). `exits` counts the
+    solves per Status, `fallback` is a histogram of how many receivers the
+    fallback loop went through once the third one couldn't decide, and
+    `stage_ns` splits the time between selecting the nearest receivers,
+    intersecting their circles and disambiguating the candidates.
+    """
+    STAGES = ("select", "intersect", "disambiguate")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.exits = Counter()
+        self.fallback = Counter()
+        self.stage_ns = dict.fromkeys(self.STAGES, 0)
+        self.__stage = "select"
+        self.__last = 0
+
+    def start(self):
+        self.__stage = "select"
+        self.__last = perf_counter_ns()
+
+    def lap(self, stage):
+        # Close the running stage and start timing `stage`
+        now = perf_counter_ns()
+        self.stage_ns[self.__stage] += now - self.__last
+        self.__stage = stage
+        self.__last = now
+
+    def record(self, fix):
+        self.stage_ns[self.__stage] += perf_counter_ns() - self.__last
+        self.exits[fix.status] += 1
+        return fix
+
+    def snapshot(self):
+        solves = sum(self.exits.values())
+        return {
+            "solves": solves,
+            "exits": {status.name: self.exits[status] for status in Status},
+            "fallback_iterations": dict(sorted(self.fallback.items())),
+            "stage_seconds": {stage: ns / 1e9 for stage, ns in self.stage_ns.items()},
+            "stage_mean_us": {stage: (ns / solves / 1e3 if solves else 0.0)
+                              for stage, ns in self.stage_ns.items()},
+        }
+
+
+# The collector, and the one locate() writes to (None while disabled, so the
+# only cost left in the solver is reading this global)
+_collector = SolverStats()
+_stats = None
+
+
+def enable_stats(enabled=True):
+    """Turn the solver instrumentation on or off, the counters are kept."""
+    global _stats
+    _stats = _collector if enabled else None
+
+
+def stats(reset=False):
+    """Return a snapshot of the solver counters, optionally clearing them."""
+    snapshot = _collector.snapshot()
+    snapshot["enabled"] = _stats is not None
+    snapshot["pair_geometry"] = receiver_registry.pairs.stats()
+    if reset:
+        _collector.reset()
+    return snapshot
+
+
+# Callables taking (tracker, fix), called after every Tracker.locate and
+# locate_lsq. A tuple, so the solver only pays for a truth test when empty
+_fix_listeners = ()
+
+
+def add_fix_listener(listener):
+    """Call `listener(tracker, fix)` after every solve of a Tracker."""
+    global _fix_listeners
+    _fix_listeners = _fix_listeners + (listener,)
+
+
+def remove_fix_listener(listener):
+    global _fix_listeners
+    _fix_listeners = tuple(other for other in _fix_listeners if other != listener)
+
+
+# Default registries of the Receiver and Tracker views
+receiver_registry = Registry()
+tracker_registry = Registry()
+
+
+def receiver_table(receivers):
+    """Flatten a receivers dict into (ids, Mx2 coordinates array) for locate_batch."""
+    ids = list(receivers)
+    recs = receivers.values()
+    registry = _shared_registry(recs)
+    if registry is not None:
+        # Gather the columns straight from the registry arrays
+        return ids, registry.xy(registry.rows(recs))
+    xy = np.array([(rec.x, rec.y) for rec in recs], dtype=float)
+    return ids, xy.reshape(len(ids), 2)
+
+
+def quarantine_mask(receivers):
+    """Boolean mask of the quarantined receivers of a dict, in the order of receiver_table.
+
+    The batch solvers only see distances, so the callers holding the
+    receivers set these columns to NaN, the way Tracker.locate skips them.
+    """
+    recs = receivers.values()
+    registry = _shared_registry(recs)
+    if registry is not None:
+        quarantined = np.frombuffer(registry.quarantined, dtype=np.int8, count=registry.size).view(bool)
+        return quarantined[registry.rows(recs)]
+    return np.array([rec.is_quarantined for rec in recs], dtype=bool)
+
+
+def distance_matrix(trackers, receivers):
+    """Simulated NxM readings of `trackers` (a list) to `receivers` (a dict).
+
+    The batch counterpart of Tracker.report, computed on the registry arrays.
+    """
+    recs = receivers.values()
+    receiver_registry = _shared_registry(recs)
+    if receiver_registry is not None:
+        receiver_xyz = receiver_registry.xyz(receiver_registry.rows(recs))
+    else:
+        receiver_xyz = np.array([(rec.x, rec.y, rec.z) for rec in recs], dtype=float).reshape(-1, 3)
+    registry = _shared_registry(trackers)
+    if registry is not None:
+        tracker_xyz = registry.xyz(registry.rows(trackers))
+    else:
+        tracker_xyz = np.array([(t.x, t.y, t.z) for t in trackers], dtype=float).reshape(-1, 3)
+    dist_x = tracker_xyz[:, None, 0] - receiver_xyz[None, :, 0]
+    dist_y = tracker_xyz[:, None, 1] - receiver_xyz[None, :, 1]
+    dist_z = tracker_xyz[:, None, 2] - receiver_xyz[None, :, 2]
+    return np.sqrt(dist_x * dist_x + dist_y * dist_y + dist_z * dist_z)
+
+
+def _shared_registry(objects):
+    # The registry all the objects are views of, None if there is no such one
+    registry = None
+    for obj in objects:
+        obj_registry = getattr(obj, "_registry", None)
+        if obj_registry is None or (registry is not None and obj_registry is not registry):
+            return None
+        registry = obj_registry
+    return registry
+
+
+def locate_batch(distances, receiver_xy):
+    """Locate N trackers at once from an NxM matrix of receiver distances.
+
+    Column j of `distances` is the reading of the receiver at `receiver_xy[j]`,
+    NaN meaning the receiver did not report. Returns (positions, status, used):
+    an Nx2 array (NaN when unresolved), an array of Status codes and an Nx3
+    array with the columns of the receivers used (-1 when unused).
+    """
+    d, xy = _batch_arrays(distances, receiver_xy)
+    n, m = d.shape
+
+    positions = np.full((n, 2), np.nan)
+    status = np.full(n, Status.NOT_ENOUGH, dtype=np.int8)
+    used = np.full((n, 3), -1, dtype=np.intp)
+    if n == 0 or m < 2:
+        return positions, status, used
+
+    # Missing readings are pushed to the end so they are never selected
+    valid = ~np.isnan(d)
+    count = valid.sum(axis=1)
+    key = np.where(valid, d, np.inf)
+    rows = np.arange(n)
+
+    # Nearest-k selection without a full sort. argmin returns the first of
+    # equal values, so ties are broken like the stable sort of the scalar path
+    i0 = key.argmin(axis=1)
+    key[rows, i0] = np.inf
+    i1 = key.argmin(axis=1)
+    key[rows, i1] = np.inf
+    i2 = key.argmin(axis=1) if m > 2 else i1
+
+    live = count >= 2
+    used[live, 0] = i0[live]
+    used[live, 1] = i1[live]
+
+    r0, r1, r2 = d[rows, i0], d[rows, i1], d[rows, i2]
+    x0, y0 = xy[i0, 0], xy[i0, 1]
+    x1, y1 = xy[i1, 0], xy[i1, 1]
+    x2, y2 = xy[i2, 0], xy[i2, 1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Distance between the two first receivers
+        dist = _distance(x0, y0, x1, y1)
+        ux = (x1 - x0) / dist
+        uy = (y1 - y0) / dist
+
+        out = live & (dist > (r0 + r1 + ABSOLUTE_TOLERANCE))
+        status[out] = Status.OUT_OF_RANGE
+        live &= ~out
+
+        (x3_1, y3_1), (x3_2, y3_2) = _candidate_points(r0, x0, y0, r1, dist, ux, uy, uy, -ux)
+
+        tangent = live & _isclose(x3_1, x3_2) & _isclose(y3_1, y3_2)
+        positions[tangent, 0] = x3_1[tangent]
+        positions[tangent, 1] = y3_1[tangent]
+        status[tangent] = Status.TANGENT
+        live &= ~tangent
+
+        ambiguous = live & (count < 3)
+        status[ambiguous] = Status.AMBIGUOUS
+        live &= ~ambiguous
+
+        # Measure the distance from the 3rd receiver to the 2 candidates
+        test_p1 = _distance(x3_1, y3_1, x2, y2)
+        test_p2 = _distance(x3_2, y3_2, x2, y2)
+
+        # Rows where the 3rd receiver can't tell the candidates apart fall back
+        # to the remaining receivers, in distance order, like the scalar loop
+        fallback = np.flatnonzero(live & _isclose(test_p1, test_p2))
+        if fallback.size:
+            order = np.argsort(np.where(valid[fallback], d[fallback], np.inf),
+                               axis=1, kind="stable")[:, 3:]
+            rest = order.shape[1]
+            fx, fy = xy[order, 0], xy[order, 1]
+            t1 = _distance(x3_1[fallback, None], y3_1[fallback, None], fx, fy)
+            t2 = _distance(x3_2[fallback, None], y3_2[fallback, None], fx, fy)
+            in_range = np.arange(rest) < (count[fallback, None] - 3)
+            differs = in_range & ~_isclose(t1, t2)
+            found = differs.any(axis=1)
+            first = differs.argmax(axis=1) if rest else np.zeros(fallback.size, dtype=np.intp)
+
+            hit, miss = fallback[found], fallback[~found]
+            pick = order[found, first[found]]
+            i2[hit] = pick
+            r2[hit] = d[hit, pick]
+            test_p1[hit] = t1[found, first[found]]
+            test_p2[hit] = t2[found, first[found]]
+
+            # The last receiver tried is reported, as in the scalar error
+            if rest:
+                last = count[miss] - 1
+                tried = order[~found, np.maximum(last - 3, 0)]
+                i2[miss] = np.where(last >= 3, tried, i2[miss])
+            status[miss] = Status.ALIGNED
+            used[miss, 2] = i2[miss]
+            live[miss] = False
+
+        used[live, 2] = i2[live]
+
+        # The one that matches the 3rd receiver measure is our target
+        match_1 = live & _isclose(r2, test_p1)
+        match_2 = live & ~match_1 & _isclose(r2, test_p2)
+        positions[match_1, 0] = x3_1[match_1]
+        positions[match_1, 1] = y3_1[match_1]
+        positions[match_2, 0] = x3_2[match_2]
+        positions[match_2, 1] = y3_2[match_2]
+        status[match_1 | match_2] = Status.OK
+        status[live & ~(match_1 | match_2)] = Status.NO_MATCH
+
+    return positions, status, used
+
+
+def locate_lsq(distances, receiver_xy, k=LSQ_RECEIVERS):
+    """Least-squares multilateration of N trackers over their k nearest receivers.
+
+    Takes the same inputs as locate_batch. The circle equations of the k
+    nearest readings are linearized against the nearest one and solved in
+    closed form, so noisy readings still give a position instead of an
+    ambiguous or inconsistent fix. Returns (positions, status, used,
+    residual, covariance): residual is the RMS range error of the fix and
+    covariance the Nx2x2 position covariance estimated from it.
+
+    Rows whose k nearest receivers are aligned take in as many readings
+    again, until they resolve or run out of readings, like the fallback loop
+    of find_position. `used` is as wide as the most readings a row took,
+    padded with -1.
+    """
+    d, xy = _batch_arrays(distances, receiver_xy)
+    m = d.shape[1]
+    k = min(k, m)
+    positions, status, used, residual, covariance = _locate_lsq(d, xy, k)
+
+    readings = (~np.isnan(d)).sum(axis=1)
+    width = k
+    rows = np.flatnonzero((status == Status.ALIGNED) & (readings > width))
+    while len(rows):
+        used = np.pad(used, ((0, 0), (0, min(2 * width, m) - width)), constant_values=-1)
+        width = used.shape[1]
+        more = _locate_lsq(d[rows], xy, width)
+        positions[rows], status[rows], used[rows], residual[rows], covariance[rows] = more
+        rows = rows[(more[1] == Status.ALIGNED) & (readings[rows] > width)]
+    return positions, status, used, residual, covariance
+
+
+def _locate_lsq(d, xy, k):
+    # locate_lsq over exactly the k nearest readings of each row
+    n = d.shape[0]
+
+    positions = np.full((n, 2), np.nan)
+    status = np.full(n, Status.NOT_ENOUGH, dtype=np.int8)
+    used = np.full((n, k), -1, dtype=np.intp)
+    residual = np.full(n, np.nan)
+    covariance = np.full((n, 2, 2), np.nan)
+    if n == 0 or k < 2:
+        return positions, status, used, residual, covariance
+
+    # The k nearest readings in order, the nearest is the reference
+    nearest, r, valid, count = _nearest_readings(d, k)
+    used[valid] = nearest[valid]
+
+    # Subtracting the reference circle from the others leaves one linear
+    # equation per receiver, relative to the reference position p0:
+    # 2 * (pi - p0) . (p - p0) = r0^2 - ri^2 + |pi - p0|^2
+    px, py = xy[nearest, 0], xy[nearest, 1]
+    dx = px[:, 1:] - px[:, :1]
+    dy = py[:, 1:] - py[:, :1]
+    weight = valid[:, 1:]
+    with np.errstate(invalid="ignore"):
+        ax = np.where(weight, 2 * dx, 0)
+        ay = np.where(weight, 2 * dy, 0)
+        b = np.where(weight, r[:, :1] * r[:, :1] - r[:, 1:] * r[:, 1:] + dx * dx + dy * dy, 0)
+
+    # Normal equations of the 2 unknowns, solved in closed form
+    sxx = (ax * ax).sum(axis=1)
+    sxy = (ax * ay).sum(axis=1)
+    syy = (ay * ay).sum(axis=1)
+    sxb = (ax * b).sum(axis=1)
+    syb = (ay * b).sum(axis=1)
+    det = sxx * syy - sxy * sxy
+
+    # Aligned receivers leave the mirror image undecided, like in find_position
+    aligned = det <= LSQ_CONDITION * (sxx + syy) ** 2
+    status[count == 2] = Status.AMBIGUOUS
+    status[(count > 2) & aligned] = Status.ALIGNED
+    solved = (count > 2) & ~aligned
+    status[solved] = Status.OK
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = px[:, 0] + (syy * sxb - sxy * syb) / det
+        y = py[:, 0] + (sxx * syb - sxy * sxb) / det
+
+        # Range residuals at the solution and their Jacobian (the unit
+        # vectors from the receivers) give the covariance of the fix
+        ex = x[:, None] - px
+        ey = y[:, None] - py
+        rng = _distance(ex, ey, 0, 0)
+        err = np.where(valid, rng - r, 0)
+        jx = np.where(valid, ex / rng, 0)
+        jy = np.where(valid, ey / rng, 0)
+        sq = (err * err).sum(axis=1)
+        variance = sq / np.maximum(count - 2, 1)
+        jxx = (jx * jx).sum(axis=1)
+        jxy = (jx * jy).sum(axis=1)
+        jyy = (jy * jy).sum(axis=1)
+        jdet = jxx * jyy - jxy * jxy
+        cov = np.empty((n, 2, 2))
+        cov[:, 0, 0] = variance * jyy / jdet
+        cov[:, 0, 1] = cov[:, 1, 0] = -variance * jxy / jdet
+        cov[:, 1, 1] = variance * jxx / jdet
+
+    positions[solved, 0] = x[solved]
+    positions[solved, 1] = y[solved]
+    residual[solved] = np.sqrt(sq[solved] / count[solved])
+    covariance[solved] = cov[solved]
+    return positions, status, used, residual, covariance
+
+
+def locate_lsq_3d(distances, receiver_xyz, k=LSQ_RECEIVERS_3D, z_hint=None):
+    """Least-squares multilateration in 3D over the k nearest receivers.
+
+    Like locate_lsq with Mx3 receiver coordinates. The sphere equations are
+    linearized against the nearest one and the 3x3 normal equations are
+    solved through their eigenvectors. Receivers on a single plane (one
+    floor, or any three) leave the offset along its normal to the nearest
+    reading, which has two roots: the one nearest to `z_hint` (a scalar or
+    one per row) is taken, the lower one without a hint. Returns
+    (positions Nx3, status, used, residual).
+    """
+    d, xyz = _batch_arrays(distances, receiver_xyz, 3)
+    n, m = d.shape
+    k = min(k, m)
+
+    positions = np.full((n, 3), np.nan)
+    status = np.full(n, Status.NOT_ENOUGH, dtype=np.int8)
+    used = np.full((n, k), -1, dtype=np.intp)
+    residual = np.full(n, np.nan)
+    if n == 0 or k < 2:
+        return positions, status, used, residual
+
+    # The k nearest readings in order, the nearest is the reference
+    nearest, r, valid, count = _nearest_readings(d, k)
+    used[valid] = nearest[valid]
+
+    # 2 * (pi - p0) . (p - p0) = r0^2 - ri^2 + |pi - p0|^2, as in locate_lsq
+    p = xyz[nearest]
+    delta = p[:, 1:] - p[:, :1]
+    weight = valid[:, 1:]
+    with np.errstate(invalid="ignore"):
+        a = np.where(weight[..., None], 2 * delta, 0)
+        b = np.where(weight, r[:, :1] * r[:, :1] - r[:, 1:] * r[:, 1:] + (delta * delta).sum(axis=2), 0)
+    normal = np.einsum("nki,nkj->nij", a, a)
+    rhs = np.einsum("nki,nk->ni", a, b)
+
+    # Eigenvalues in ascending order. A small first one means coplanar
+    # receivers, a small second one receivers on a line
+    values, vectors = np.linalg.eigh(normal)
+    scale = values[:, 2:]
+    flat = values[:, :2] <= LSQ_CONDITION * scale
+    coplanar = flat[:, 0] & ~flat[:, 1]
+    aligned = flat[:, 1]
+    status[count == 2] = Status.AMBIGUOUS
+    status[(count > 2) & aligned] = Status.ALIGNED
+    solved = (count > 2) & ~aligned
+    status[solved] = Status.OK
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coef = np.einsum("nij,ni->nj", vectors, rhs) / values
+        coef[:, :2][flat] = 0
+        offset = np.einsum("nij,nj->ni", vectors, coef)
+
+        # Along the normal of a plane of receivers the nearest sphere gives
+        # +-t, the rest of the offset lies in the plane
+        axis = vectors[:, :, 0]
+        t = np.sqrt(np.maximum(r[:, 0] * r[:, 0] - (offset * offset).sum(axis=1), 0))
+        up = p[:, 0] + offset + t[:, None] * axis
+        down = p[:, 0] + offset - t[:, None] * axis
+        if z_hint is None:
+            pick_up = up[:, 2] < down[:, 2]
+        else:
+            hint = np.broadcast_to(np.asarray(z_hint, dtype=float), (n,))
+            pick_up = np.abs(up[:, 2] - hint) < np.abs(down[:, 2] - hint)
+        solution = np.where(coplanar[:, None], np.where(pick_up[:, None], up, down), p[:, 0] + offset)
+
+    # A plane of receivers standing up (one column of a grid over two
+    # floors) mirrors sideways, the height can't pick a side
+    undecided = solved & coplanar & (np.abs(axis[:, 2]) < LSQ_PLANE_SLOPE) & (t > ABSOLUTE_TOLERANCE)
+    status[undecided] = Status.ALIGNED
+    solved &= ~undecided
+
+    with np.errstate(invalid="ignore"):
+        diff = solution[:, None, :] - p
+        err = np.where(valid, np.sqrt((diff * diff).sum(axis=2)) - r, 0)
+        sq = (err * err).sum(axis=1)
+
+    positions[solved] = solution[solved]
+    residual[solved] = np.sqrt(sq[solved] / count[solved])
+    return positions, status, used, residual
+
+
+def batch_fixes(ids, positions, status, used):
+    """Turn the arrays of locate_batch into a list of Fix, `ids` naming the columns."""
+    fixes = []
+    for (x, y), code, cols in zip(positions.tolist(), status.tolist(), used.tolist()):
+        receivers = tuple(ids[col] for col in cols if col >= 0)
+        if code <= Status.TANGENT:
+            fixes.append(Fix(Status(code), x, y, receivers))
+        else:
+            fixes.append(Fix(Status(code), receivers=receivers))
+    return fixes
+
+
+def _batch_arrays(distances, receiver_xy, dims=2):
+    # Normalize the inputs of the batch solvers to float arrays, the
+    # receivers having `dims` coordinates
+    d = np.asarray(distances, dtype=float)
+    if d.ndim == 1:
+        d = d.reshape(1, -1)
+    xy = np.asarray(receiver_xy, dtype=float).reshape(-1, dims)
+    if xy.shape[0] != d.shape[1]:
+        raise ValueError("Distances and receivers do not match.")
+    return d, xy
+
+
+def _nearest_readings(d, k):
+    # Columns and distances of the k nearest readings of each row, nearest
+    # first (the position in the row breaks ties), with the mask of the ones
+    # that aren't missing and their count. Missing readings sort last as inf
+    n, m = d.shape
+    key = np.where(np.isnan(d), np.inf, d)
+    if k < m:
+        nearest = np.argpartition(key, k - 1, axis=1)[:, :k]
+    else:
+        nearest = np.broadcast_to(np.arange(m), (n, m))
+    r = np.take_along_axis(key, nearest, axis=1)
+    order = np.argsort(r, axis=1, kind="stable")
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    r = np.take_along_axis(r, order, axis=1)
+    valid = np.isfinite(r)
+    return nearest, r, valid, valid.sum(axis=1)
+
+
+def _pair_geometry(x0, y0, x1, y1):
+    # (dist, ux, uy, nx, ny): distance between two receivers, the unit vector
+    # from the first to the second and its normal
+    dist_x = x1 - x0
+    dist_y = y1 - y0
+    dist = sqrt(dist_x * dist_x + dist_y * dist_y)
+    ux = dist_x / dist
+    uy = dist_y / dist
+    return dist, ux, uy, uy, -ux
+
+
+def _candidate_points(r0, x0, y0, r1, dist, ux, uy, nx, ny):
+    # Array version of Tracker.__calculate_candidate_points. The operations
+    # are kept in the same order (and squares are plain products, as pow()
+    # and numpy's square may round differently) so both paths agree bitwise
+    l1 = (r0 * r0 - r1 * r1 + dist * dist) / (2 * dist)
+    l2 = np.sqrt(np.abs(r0 * r0 - l1 * l1))
+    x2 = x0 + l1 * ux
+    y2 = y0 + l1 * uy
+    return (
+        (x2 + l2 * nx, y2 + l2 * ny),
+        (x2 - l2 * nx, y2 - l2 * ny)
+    )
+
+
+def _distance(x, y, rx, ry):
+    dist_x = x - rx
+    dist_y = y - ry
+    return np.sqrt(dist_x * dist_x + dist_y * dist_y)
+
 
+def _isclose(d1, d2):
+    # Element-wise math.isclose(d1, d2, abs_tol=ABSOLUTE_TOLERANCE)
+    tol = np.maximum(RELATIVE_TOLERANCE * np.maximum(np.abs(d1), np.abs(d2)), ABSOLUTE_TOLERANCE)
+    return (d1 == d2) | (np.abs(d1 - d2) <= tol)
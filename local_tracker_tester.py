@@ -1,5 +1,9 @@
+import argparse
+import random
 import tkinter as tk
-from local_tracker import Receiver, Tracker
+from local_tracker import Receiver, Status, Tracker, distance_matrix, locate_batch, receiver_table
+from replay import Recorder
+from simulate import RandomWalk
 
 # Constants
 CANVAS_WIDTH = 800
@@ -8,6 +12,8 @@ WINDOW_WIDTH = 900
 WINDOW_HEIGHT = 700
 TRACKER_RADIUS = 8
 STEP_SIZE = 2
+CROWD_RADIUS = 4
+FRAME_MS = 16  # milliseconds per animation frame, moves in between are coalesced
 
 
 def init_receivers():
@@ -22,17 +28,56 @@ def init_receivers():
     }
 
 
-def draw_circle(cx, cy, radius, fill=None, outline=None, tag="temp"):
-    """Draw a circle on the canvas."""
-    canvas.create_oval(
-        cx - radius, cy - radius, cx + radius, cy + radius,
-        outline=outline, fill=fill, tags=tag
-    )
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local Tracker Tester")
+    parser.add_argument("--trackers", type=int, default=0,
+                        help="extra random-walking trackers, solved together every frame")
+    parser.add_argument("--record", help="log the solves and layout changes for replay.py to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def create_circle(fill=None, outline=None, tag="temp"):
+    """Create a hidden circle on the canvas, place_circle() shows it."""
+    return canvas.create_oval(0, 0, 0, 0, outline=outline, fill=fill, tags=tag, state="hidden")
+
+
+def place_circle(item, cx, cy, radius):
+    """Move a circle of the canvas and show it."""
+    canvas.coords(item, cx - radius, cy - radius, cx + radius, cy + radius)
+    configure(item, state="normal")
+
+
+def configure(item, **options):
+    """itemconfig only the options that changed since the last call."""
+    current = item_options.setdefault(item, {})
+    changed = {key: value for key, value in options.items() if current.get(key) != value}
+    if changed:
+        canvas.itemconfig(item, **changed)
+        current.update(changed)
+
+
+def configure_label(label, **options):
+    """The same for a label widget."""
+    current = item_options.setdefault(label, {})
+    changed = {key: value for key, value in options.items() if current.get(key) != value}
+    if changed:
+        label.config(**changed)
+        current.update(changed)
+
+
+def hide(*items):
+    for item in items:
+        configure(item, state="hidden")
 
 
 def move_with_arrows(event):
-    """Handle tracker movement with arrow keys."""
-    global xpos, ypos
+    """Handle tracker movement with arrow keys.
+
+    Only the position changes here, the solve and the drawing wait for the
+    next frame so key repeats never queue up behind them.
+    """
+    global xpos, ypos, tracker_moved
     key_actions = {
         "Left": (-STEP_SIZE, 0),
         "Right": (STEP_SIZE, 0),
@@ -43,13 +88,32 @@ def move_with_arrows(event):
     dx, dy = key_actions.get(event.keysym, (0, 0))
     xpos = max(0, min(CANVAS_WIDTH, xpos + dx))
     ypos = max(0, min(CANVAS_HEIGHT, ypos + dy))
-
-    xpos_entry.delete(0, tk.END)
-    ypos_entry.delete(0, tk.END)
-    xpos_entry.insert(0, str(xpos))
-    ypos_entry.insert(0, str(ypos))
-
-    update_tracker_position()
+    tracker_moved = True
+    request_frame()
+
+
+def request_frame():
+    """Schedule run_frame() unless it already is."""
+    global frame_pending
+    if frame_pending is None:
+        frame_pending = root.after(FRAME_MS, run_frame)
+
+
+def run_frame():
+    """Apply what changed since the last frame: at most one solve per frame."""
+    global frame_pending, tracker_moved
+    frame_pending = None
+    if tracker_moved:
+        tracker_moved = False
+        xpos_entry.delete(0, tk.END)
+        ypos_entry.delete(0, tk.END)
+        xpos_entry.insert(0, str(xpos))
+        ypos_entry.insert(0, str(ypos))
+        draw_tracker()
+        move()
+    if crowd:
+        step_crowd(FRAME_MS / 1000)
+        request_frame()
 
 
 def update_tracker_position():
@@ -62,120 +126,169 @@ def update_tracker_position():
         ypos = max(0, min(CANVAS_HEIGHT, ypos))
 
     except ValueError as e:
-        handle_error(e)
+        handle_error(e.args[0])
         return
 
-    canvas.delete("tracker")
-    draw_circle(xpos, ypos, TRACKER_RADIUS, fill="red", outline="red", tag="tracker")
-    tracker_label.place(x=xpos + 10, y=ypos + 10)
-    tracker_label.config(text=tracker.id)
-    
+    draw_tracker()
     move()
 
 
+def draw_tracker():
+    place_circle(tracker_item, xpos, ypos, TRACKER_RADIUS)
+    tracker_label.place(x=xpos + 10, y=ypos + 10)
+
+
 def move():
     """Recalculate and display the tracker's position."""
-    try:
-        print("moving to: ", xpos, ",", ypos)
-        tracker.move_to(xpos, ypos)
-        calculated_x, calculated_y, receivers_used = tracker.find_position(active_receivers)
+    print("moving to: ", xpos, ",", ypos)
+    tracker.move_to(xpos, ypos)
+    fix = tracker.locate(active_receivers) if recorder is None else recorder.locate(tracker, active_receivers)
 
-    except ValueError as e:
-        handle_error(e)
+    if not fix.ok:
+        handle_error(fix.message, fix.candidates, fix.receivers)
         return
 
-    draw_receiver_data(calculated_x, calculated_y, receivers_used)
-    update_coord_labels(calculated_x, calculated_y)
+    draw_receiver_data(fix.x, fix.y, fix.receivers)
+    update_coord_labels(fix.x, fix.y)
 
 
-def handle_error(e):
+def handle_error(message, candidates=None, receivers_used=()):
     """Handle errors during position calculation."""
-    print(f"Error: {e.args[0]}")
-    text_label.config(bg="red")
-    error_label.config(text=e.args[0], font=("Arial", 11))
+    print(f"Error: {message}")
+    configure_label(text_label, bg="red")
+    configure_label(error_label, text=message, font=("Arial", 11))
     error_label.grid()
 
-    x_label.config(text="x = ?")
-    y_label.config(text="y = ?")
+    configure_label(x_label, text="x = ?")
+    configure_label(y_label, text="y = ?")
     
-    if len(e.args) > 1:
-        calculated_x, calculated_y, receivers_used = e.args[1]
+    if candidates is not None:
+        calculated_x, calculated_y = candidates
         draw_receiver_data(calculated_x, calculated_y, receivers_used)
     else:
-        canvas.delete("temp")
+        hide(fix_item, *candidate_items, *(item for items in line_items.values() for item in items),
+             *range_items.values())
 
 
 def update_coord_labels(calculated_x, calculated_y):
     """Update the coordinate labels."""
     error_label.grid_remove()
-    x_label.config(text=f"x = {calculated_x:.2f}")
-    y_label.config(text=f"y = {calculated_y:.2f}")
+    configure_label(x_label, text=f"x = {calculated_x:.2f}")
+    configure_label(y_label, text=f"y = {calculated_y:.2f}")
 
     if round(calculated_x, 2) != xpos or round(calculated_y, 2) != ypos:
-        text_label.config(bg="red")
+        configure_label(text_label, bg="red")
     else:
-        text_label.config(bg="black")
+        configure_label(text_label, bg="black")
 
 
 def draw_receiver_data(tx, ty, receivers_used):
-    """Draw the receiver data and connections on the canvas."""
-    canvas.delete("temp")
+    """Move the fix, the lines and the circles of the receivers used."""
     if isinstance(tx, tuple):  # Indeterminate position case
-        for sub_x, sub_y in zip(tx, ty):
-            draw_circle(sub_x, sub_y, 10, fill="red", outline="red")
+        points = list(zip(tx, ty))
+        hide(fix_item)
+        for item, (sub_x, sub_y) in zip(candidate_items, points):
+            place_circle(item, sub_x, sub_y, 10)
     else:
-        draw_circle(tx, ty, 10, fill="blue", outline="blue")
+        points = [(tx, ty)]
+        hide(*candidate_items)
+        place_circle(fix_item, tx, ty, 10)
 
     # Update each receiver's display
-    for rec_id, rec in active_receivers.items():
+    for rec_id, rec in receivers.items():
+        lines = line_items[rec_id]
+        if rec_id not in active_receivers:
+            hide(rec_items[rec_id], range_items[rec_id], *lines)
+            continue
         distance = tracker.report(rec)
+        used = rec_id in receivers_used
 
-        if rec_id in receivers_used:
-            # Draw line between tracker and receiver
-            if isinstance(tx, tuple):  # Indeterminate position
-                for sub_x, sub_y in zip(tx, ty):
-                    canvas.create_line(sub_x, sub_y, rec.x, rec.y, fill="blue", tags="temp")
+        for i, line in enumerate(lines):
+            if used and i < len(points):
+                # Line between tracker and receiver
+                canvas.coords(line, *points[i], rec.x, rec.y)
+                configure(line, state="normal")
             else:
-                canvas.create_line(tx, ty, rec.x, rec.y, fill="blue", tags="temp")
-            
-            if rec_id == receivers_used[0] or rec_id == receivers_used[1]:
-                draw_circle(rec.x, rec.y, distance, outline="blue")
+                hide(line)
 
-        receiver_labels[rec_id].config(
-            text=f"{rec_id}: {distance:.2f}", 
-            bg="orange" if rec_id in receivers_used else "green",
-            fg="black" if rec_id in receivers_used else "white"
-        )
+        if rec_id in receivers_used[0:2]:
+            place_circle(range_items[rec_id], rec.x, rec.y, distance)
+        else:
+            hide(range_items[rec_id])
 
-        draw_circle(
-            receivers[rec_id].x, 
-            receivers[rec_id].y, 
-            8,
-            fill="orange" if rec_id in receivers_used else "green", 
-            outline="orange" if rec_id in receivers_used else "green", 
-            tag="rec"
+        configure_label(
+            receiver_labels[rec_id],
+            text=f"{rec_id}: {distance:.2f}", 
+            bg="orange" if used else "green",
+            fg="black" if used else "white"
         )
+        configure(rec_items[rec_id], state="normal",
+                  fill="orange" if used else "green",
+                  outline="orange" if used else "green")
 
 
 def update_receiver_status():
     """Update active receivers based on checkbutton states."""
+    global tracker_moved
     active_receivers.clear()
-    canvas.delete("rec")
     for rec_id, var in receiver_vars.items():
         if var.get() == 1:
             active_receivers[rec_id] = receivers[rec_id]
             receiver_labels[rec_id].place(x=receivers[rec_id].x + 15, y=receivers[rec_id].y - 30)
+            configure(rec_items[rec_id], state="normal")
         else:
             receiver_labels[rec_id].place_forget()
-
-    move()
+            hide(rec_items[rec_id])
+    if recorder is not None:
+        recorder.layout(active_receivers)
+
+    tracker_moved = True
+    request_frame()
+
+
+def init_crowd(count, seed):
+    """The extra trackers of the multi-tracker mode, each with its walk and its dot."""
+    rng = random.Random(seed)
+    for i in range(count):
+        walk = RandomWalk(rng, width=CANVAS_WIDTH, height=CANVAS_HEIGHT)
+        crowd.append(Tracker(f"T{i + 1}", walk.x, walk.y))
+        crowd_walks.append(walk)
+        crowd_items.append(create_circle(fill="purple", outline="purple", tag="crowd"))
+
+
+def step_crowd(dt):
+    """Walk the extra trackers and solve them all in one batch."""
+    for crowd_tracker, walk in zip(crowd, crowd_walks):
+        crowd_tracker.move_to(*walk.step(dt))
+    _, receiver_xy = receiver_table(active_receivers)
+    positions, status, _ = locate_batch(distance_matrix(crowd, active_receivers), receiver_xy)
+
+    unresolved = 0
+    for item, crowd_tracker, (x, y), code in zip(crowd_items, crowd, positions.tolist(), status.tolist()):
+        if code <= Status.TANGENT:
+            place_circle(item, x, y, CROWD_RADIUS)
+            configure(item, fill="purple", outline="purple")
+        else:
+            # Unresolved, an empty red circle where the tracker really is
+            unresolved += 1
+            place_circle(item, crowd_tracker.x, crowd_tracker.y, CROWD_RADIUS)
+            configure(item, fill="", outline="red")
+    configure_label(crowd_label, text=f"{len(crowd)} trackers\n{unresolved} unresolved")
 
 
 # Initialize
+args = parse_args()
 receivers = init_receivers()
 active_receivers = receivers.copy()
 tracker = Tracker("John", 0, 0)
+recorder = Recorder(args.record) if args.record else None
 xpos, ypos = 550, 50  # Initial position
+tracker_moved = False
+frame_pending = None
+item_options = {}  # canvas item or label -> options last set
+crowd = []         # extra trackers of the multi-tracker mode
+crowd_walks = []
+crowd_items = []
 
 # Tkinter UI setup
 root = tk.Tk()
@@ -191,9 +304,18 @@ canvas = tk.Canvas(root, width=CANVAS_WIDTH, height=CANVAS_HEIGHT)
 canvas.pack(side="top", fill=tk.BOTH)
 canvas.create_image(0, 0, image=bg_image, anchor="nw")
 
+# Canvas items, created once and then moved with coords()
+fix_item = create_circle(fill="blue", outline="blue")
+candidate_items = [create_circle(fill="red", outline="red") for _ in range(2)]
+line_items = {rec_id: [canvas.create_line(0, 0, 0, 0, fill="blue", tags="temp", state="hidden")
+                       for _ in range(2)]
+              for rec_id in receivers}
+range_items = {rec_id: create_circle(outline="blue") for rec_id in receivers}
+rec_items = {rec_id: create_circle(fill="green", outline="green", tag="rec") for rec_id in receivers}
+tracker_item = create_circle(fill="red", outline="red", tag="tracker")
+
 tracker_label = tk.Label(canvas, text=tracker.id)
-tracker_label.place(x=xpos + 10, y=ypos + 10)
-draw_circle(xpos, ypos, TRACKER_RADIUS, fill="red", outline="red", tag="tracker")
+draw_tracker()
 
 # Bottom frame with labels and button
 bot_frame = tk.Frame(root)
@@ -250,7 +372,7 @@ for rec_id, rec in receivers.items():
     chk_y += 35
 
     receiver_labels[rec_id].place(x=rec.x + 15, y=rec.y - 30)
-    draw_circle(rec.x, rec.y, 8, fill="green", outline="green", tag="rec")
+    place_circle(rec_items[rec_id], rec.x, rec.y, 8)
 
 kb_image = tk.PhotoImage(file="images/kb_arr.png")
 kb_image_lbl = tk.Label(root, image=kb_image)
@@ -262,4 +384,13 @@ root.bind('<Right>', move_with_arrows)
 root.bind('<Up>', move_with_arrows)
 root.bind('<Down>', move_with_arrows)
 
-root.mainloop()
\ No newline at end of file
+# Multi-tracker mode
+crowd_label = tk.Label(root, text="", fg="yellow")
+if args.trackers > 0:
+    crowd_label.place(x=CANVAS_WIDTH + 10, y=chk_y + 10)
+    init_crowd(args.trackers, args.seed)
+    request_frame()
+
+root.mainloop()
+if recorder is not None:
+    recorder.close()
\ No newline at end of file
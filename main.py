@@ -1,10 +1,25 @@
+import argparse
+import random
 import pygame
 from constants import *
-from tracker import Trackedobj
+from tracker import Trackedobj, WanderingTracker
 from receiver import Receiverobj
-from rec_update import init_receivers, update_receivers
+from rec_update import ReceiverUpdater, init_receivers
+from render import Renderer, load_background
+from simulate import RandomWalk
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=SCREEN_NAME)
+    parser.add_argument("--trackers", type=int, default=0, help="extra random-walking trackers")
+    parser.add_argument("--full-redraw", action="store_true", help="redraw the whole screen every frame")
+    parser.add_argument("--no-fps", action="store_true", help="hide the FPS overlay")
+    parser.add_argument("--epsilon", type=float, default=READING_EPSILON,
+                        help="change in a reading, in pixels, that triggers a new solve")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     pygame.init()
 
     updatable = pygame.sprite.Group()
@@ -12,16 +27,22 @@ def main():
 
     Trackedobj.containers = (updatable, drawable)
     Receiverobj.containers = (drawable)
- 
+
     screen = pygame.display.set_mode ((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption(SCREEN_NAME)
-    image = pygame.image.load('images/sample_layout.png')
+    background = load_background('images/sample_layout.png', (SCREEN_WIDTH, SCREEN_HEIGHT))
 
     clock = pygame.time.Clock()
     dt = 0
+    renderer = Renderer(screen, background, dirty=not args.full_redraw,
+                        show_fps=not args.no_fps, clock=clock)
 
     receivers = init_receivers()
+    updater = ReceiverUpdater(receivers, args.epsilon)
     tr = Trackedobj("John", SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+    rng = random.Random(args.seed)
+    for i in range(args.trackers):
+        WanderingTracker(f"T{i + 1}", RandomWalk(rng), receivers)
 
     running = True
     while running:
@@ -30,22 +51,21 @@ def main():
                 running = False
                 return
 
-        screen.fill("lightgrey")
-        screen.blit(image, (0, 0))
+        renderer.begin()
 
-        update_receivers(screen, receivers, tr)
+        renderer.add(updater.update(screen, tr))
+        renderer.info = f"{updater.skipped} solves skipped"
 
         for sprite in updatable:
             sprite.update(dt)
-        
-        for sprite in drawable:
-            sprite.Draw(screen)
 
+        for sprite in drawable:
+            renderer.add(sprite.Draw(screen))
 
-        pygame.display.flip()
+        renderer.end()
 
         dt = clock.tick(60) / 1000
-    
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+"""Temporal tracking mode.
+
+A MotionTracker keeps a constant-velocity Kalman filter per tracker. The
+predicted position is handed to Tracker.locate, which uses it to choose
+between the two candidates of the nearest receivers when one of them falls
+inside the prediction gate and the other far outside it, so the third
+receiver and the fallback loop are only needed when the prediction is
+inconclusive (first fixes, sudden turns, long gaps, trackers near the line
+of the two receivers). The filtered position smooths the jitter of the raw
+fixes.
+
+A fix picked by the prediction is flagged `predicted` and never fed back to
+the filter: a wrong pick would otherwise steer the next predictions onto the
+mirror image for good. After CONFIRM_EVERY such fixes in a row the tracker
+is solved without the prediction, and a confirmed fix outside the gate (the
+tracker was moved, or the picks went wrong) restarts its filter.
+"""
+from math import sqrt
+
+PROCESS_NOISE = 25.0     # acceleration noise, px^2 per time unit^3
+MEASUREMENT_NOISE = 1.0  # variance of a fix, px^2
+GATE_SIGMAS = 3.0        # gate radius in standard deviations of the prediction
+INITIAL_SPEED_VARIANCE = 1e6  # unknown velocity after the first fix
+CONFIRM_EVERY = 10       # predicted fixes in a row before a solve without the prediction
+
+
+class MotionFilter():
+    """Constant-velocity Kalman filter of one tracker.
+
+    Both axes use the same model and noises, so they share one covariance
+    (p00, p01, p11) over [position, velocity] and each keeps its own state.
+    """
+    __slots__ = ("x", "y", "vx", "vy", "p00", "p01", "p11", "time",
+                 "process_noise", "measurement_noise", "unconfirmed")
+
+    def __init__(self, x, y, time=0.0, process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE):
+        self.x = x
+        self.y = y
+        self.vx = 0.0
+        self.vy = 0.0
+        self.p00 = measurement_noise
+        self.p01 = 0.0
+        self.p11 = INITIAL_SPEED_VARIANCE
+        self.time = time
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.unconfirmed = 0  # predicted fixes since the last confirmed one
+
+    def predict(self, time):
+        """Advance the state to `time` and return the predicted (x, y, gate)."""
+        dt = time - self.time
+        if dt > 0:
+            q = self.process_noise
+            self.x += self.vx * dt
+            self.y += self.vy * dt
+            p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt * dt * dt / 3
+            p01 = self.p01 + dt * self.p11 + q * dt * dt / 2
+            self.p11 += q * dt
+            self.p00, self.p01 = p00, p01
+            self.time = time
+        return self.x, self.y, GATE_SIGMAS * sqrt(self.p00 + self.measurement_noise)
+
+    def update(self, x, y):
+        """Correct the predicted state with a fix."""
+        s = self.p00 + self.measurement_noise
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        dx = x - self.x
+        dy = y - self.y
+        self.x += k0 * dx
+        self.y += k0 * dy
+        self.vx += k1 * dx
+        self.vy += k1 * dy
+        self.p11 -= k1 * self.p01
+        self.p01 -= k0 * self.p01
+        self.p00 -= k0 * self.p00
+
+
+class MotionTracker():
+    """Stateful locate() for a set of trackers, keyed by tracker id.
+
+    `time` is whatever clock the caller steps the trackers with (seconds,
+    frames...). When it is omitted every call advances the clock by one.
+    """
+
+    def __init__(self, process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.filters = {}
+
+    def locate(self, tracker, receivers, time=None, coverage=None):
+        """Solve `tracker` with its predicted position as a prior and return the Fix."""
+        motion = self.filters.get(tracker.id)
+        if motion is None:
+            fix = tracker.locate(receivers, coverage)
+            if fix.ok:
+                self.filters[tracker.id] = MotionFilter(fix.x, fix.y, 0.0 if time is None else time,
+                                                        self.process_noise, self.measurement_noise)
+            return fix
+
+        if time is None:
+            time = motion.time + 1
+        px, py, gate = prior = motion.predict(time)
+        fix = tracker.locate(receivers, coverage, prior if motion.unconfirmed < CONFIRM_EVERY else None)
+        if not fix.ok:
+            return fix
+        if fix.predicted:
+            motion.unconfirmed += 1
+        elif sqrt((fix.x - px) * (fix.x - px) + (fix.y - py) * (fix.y - py)) > gate:
+            self.filters[tracker.id] = MotionFilter(fix.x, fix.y, time,
+                                                    self.process_noise, self.measurement_noise)
+        else:
+            motion.update(fix.x, fix.y)
+            motion.unconfirmed = 0
+        return fix
+
+    def find_position(self, tracker, receivers, time=None, coverage=None):
+        # Raising version of locate(), like Tracker.find_position
+        fix = self.locate(tracker, receivers, time, coverage)
+        if not fix.ok:
+            raise fix.error()
+        return (fix.x, fix.y, fix.receivers)
+
+    def position(self, tracker_id):
+        """Smoothed (x, y) of a tracker, None until it had a fix."""
+        motion = self.filters.get(tracker_id)
+        if motion is None:
+            return None
+        return motion.x, motion.y
+
+    def velocity(self, tracker_id):
+        motion = self.filters.get(tracker_id)
+        if motion is None:
+            return None
+        return motion.vx, motion.vy
+
+    def forget(self, tracker_id):
+        """Drop the state of a tracker, e.g. after it was moved by hand."""
+        self.filters.pop(tracker_id, None)
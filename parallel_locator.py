@@ -0,0 +1,145 @@
+import os
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from local_tracker import distance_matrix, locate_batch, quarantine_mask, receiver_table
+
+# Below this many trackers the pool costs more than it saves
+PARALLEL_MIN_BATCH = 20000
+# Shards per worker, so a slow shard doesn't leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+
+class ParallelLocator():
+    """Shards locate_batch over a process pool for large batches of trackers.
+
+    The receiver layout, the distance matrix and the outputs live in shared
+    memory: the workers map them by name and every task is just a row range,
+    so no array is pickled. Batches smaller than `min_batch`, or a single
+    worker, are solved in-process. Use it as a context manager, or call
+    close(), to stop the pool and free the shared memory.
+    """
+
+    def __init__(self, receivers, workers=None, min_batch=PARALLEL_MIN_BATCH):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.min_batch = min_batch
+        self.__pool = None
+        self.__buffers = {}
+        self.set_receivers(receivers)
+
+    def set_receivers(self, receivers):
+        """Publish a new receiver layout to the workers."""
+        self.receivers = receivers
+        self.ids, xy = receiver_table(receivers)
+        self.receiver_xy = None  # let go of the old buffer before it is replaced
+        self.receiver_xy = self.__shared("xy", xy.shape, np.float64)
+        self.receiver_xy[:] = xy
+
+    def locate(self, distances):
+        """Same as locate_batch(distances, receiver_xy), on the pool when worth it."""
+        d = np.asarray(distances, dtype=float)
+        if d.ndim == 1:
+            d = d.reshape(1, -1)
+        n, m = d.shape
+        if m != len(self.ids):
+            raise ValueError("Distances and receivers do not match.")
+        quarantined = quarantine_mask(self.receivers)
+        if quarantined.any():
+            # Readings of the receivers quarantined by the health monitor are
+            # ignored, like Tracker.locate does (on a copy, `distances` is the caller's)
+            d = np.where(quarantined, np.nan, d)
+        if self.workers <= 1 or n < self.min_batch:
+            return locate_batch(d, self.receiver_xy)
+
+        shared_d = self.__shared("d", (n, m), np.float64)
+        shared_d[:] = d
+        positions = self.__shared("positions", (n, 2), np.float64)
+        status = self.__shared("status", (n,), np.int8)
+        used = self.__shared("used", (n, 3), np.intp)
+
+        layout = {name: (shm.name, shape, dtype) for name, (shm, shape, dtype) in self.__buffers.items()}
+        step = -(-n // (self.workers * SHARDS_PER_WORKER))
+        tasks = [(layout, start, min(start + step, n)) for start in range(0, n, step)]
+        self.__get_pool().map(_solve_shard, tasks)
+
+        # Copies, the shared buffers are overwritten by the next batch
+        return positions.copy(), status.copy(), used.copy()
+
+    def locate_trackers(self, trackers):
+        """Solve the simulated readings of `trackers` and move them to their fixes.
+
+        Returns (positions, status, used) like locate, with the receiver ids
+        used instead of their columns.
+        """
+        positions, status, used = self.locate(distance_matrix(trackers, self.receivers))
+        solved = ~np.isnan(positions[:, 0])
+        for tracker, (x, y) in zip(np.asarray(trackers, dtype=object)[solved], positions[solved]):
+            tracker.move_to(x, y)
+        ids = [tuple(self.ids[i] for i in row if i >= 0) for row in used]
+        return positions, status, ids
+
+    def close(self):
+        """Stop the workers and release the shared memory."""
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool.join()
+            self.__pool = None
+        self.receiver_xy = np.array(self.receiver_xy)
+        for shm, _, _ in self.__buffers.values():
+            shm.close()
+            shm.unlink()
+        self.__buffers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __get_pool(self):
+        if self.__pool is None:
+            self.__pool = get_context().Pool(self.workers)
+        return self.__pool
+
+    def __shared(self, name, shape, dtype):
+        # Array `name` in shared memory. Buffers are reused while the data
+        # fits in them and replaced when it doesn't
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        current = self.__buffers.get(name)
+        if current is None or current[0].size < nbytes:
+            if current is not None:
+                current[0].close()
+                current[0].unlink()
+            shm = SharedMemory(create=True, size=nbytes)
+        else:
+            shm = current[0]
+        self.__buffers[name] = (shm, shape, dtype)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+# Shared memory blocks mapped by this worker, by buffer name
+_attached = {}
+
+
+def _solve_shard(task):
+    layout, start, stop = task
+    arrays = {name: _attach(name, *spec) for name, spec in layout.items()}
+    positions, status, used = locate_batch(arrays["d"][start:stop], arrays["xy"])
+    arrays["positions"][start:stop] = positions
+    arrays["status"][start:stop] = status
+    arrays["used"][start:stop] = used
+    return stop - start
+
+
+def _attach(name, shm_name, shape, dtype):
+    shm = _attached.get(name)
+    if shm is None or shm.name != shm_name:
+        # The parent owns the blocks and unlinks them, workers only map them
+        # and unmap the ones the parent has replaced
+        if shm is not None:
+            shm.close()
+        shm = SharedMemory(name=shm_name)
+        _attached[name] = shm
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
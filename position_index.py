@@ -0,0 +1,155 @@
+import heapq
+from math import floor, sqrt
+
+import numpy as np
+
+from local_tracker import add_fix_listener, remove_fix_listener
+
+DEFAULT_CELL_SIZE = 50  # pixels, about a room of the sample layout
+
+
+class PositionIndex():
+    """Spatial hash of the last known position of each tracker.
+
+    A tracker only changes bucket when it crosses a cell boundary, moves
+    inside its cell just overwrite the position. attach() hooks the index to
+    every Tracker.locate/locate_lsq so it follows the fixes by itself, and
+    update_many() takes the positions of a batch solve. nearest() and
+    within() only look at the cells around the query point.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.__positions = {}  # tracker id -> (x, y, cell)
+        self.__cells = {}      # cell -> set of tracker ids
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def __contains__(self, tracker_id):
+        return tracker_id in self.__positions
+
+    def position(self, tracker_id):
+        """Last (x, y) of a tracker, None if it isn't in the index."""
+        entry = self.__positions.get(tracker_id)
+        return None if entry is None else entry[:2]
+
+    def update(self, tracker_id, x, y):
+        cell = (floor(x / self.cell_size), floor(y / self.cell_size))
+        entry = self.__positions.get(tracker_id)
+        if entry is not None and entry[2] != cell:
+            self.__leave(tracker_id, entry[2])
+        if entry is None or entry[2] != cell:
+            self.__cells.setdefault(cell, set()).add(tracker_id)
+        self.__positions[tracker_id] = (x, y, cell)
+
+    def update_many(self, tracker_ids, positions):
+        """Bulk update from a batch solve, rows with NaN (unresolved) are skipped."""
+        xy = np.asarray(positions, dtype=float).reshape(-1, 2)
+        resolved = ~np.isnan(xy).any(axis=1)
+        cells = np.floor(xy[resolved] / self.cell_size).astype(np.int64).tolist()
+        ids = [tracker_id for tracker_id, ok in zip(tracker_ids, resolved.tolist()) if ok]
+        positions = self.__positions
+        for tracker_id, (x, y), (cx, cy) in zip(ids, xy[resolved].tolist(), cells):
+            cell = (cx, cy)
+            entry = positions.get(tracker_id)
+            if entry is None or entry[2] != cell:
+                if entry is not None:
+                    self.__leave(tracker_id, entry[2])
+                self.__cells.setdefault(cell, set()).add(tracker_id)
+            positions[tracker_id] = (x, y, cell)
+
+    def remove(self, tracker_id):
+        entry = self.__positions.pop(tracker_id, None)
+        if entry is not None:
+            self.__leave(tracker_id, entry[2])
+
+    def within(self, x, y, radius):
+        """[(tracker_id, distance)] of the trackers within `radius` of (x, y), nearest first."""
+        c0 = floor((x - radius) / self.cell_size)
+        c1 = floor((x + radius) / self.cell_size)
+        r0 = floor((y - radius) / self.cell_size)
+        r1 = floor((y + radius) / self.cell_size)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self.__cells):
+            # A wide radius covers more cells than there are occupied ones
+            cells = [members for (col, row), members in self.__cells.items()
+                     if c0 <= col <= c1 and r0 <= row <= r1]
+        else:
+            cells = [self.__cells[cell] for cell in ((col, row) for row in range(r0, r1 + 1)
+                                                     for col in range(c0, c1 + 1)) if cell in self.__cells]
+        found = []
+        for members in cells:
+            for tracker_id in members:
+                tx, ty, _ = self.__positions[tracker_id]
+                dist_x = tx - x
+                dist_y = ty - y
+                dist = sqrt(dist_x * dist_x + dist_y * dist_y)
+                if dist <= radius:
+                    found.append((dist, tracker_id))
+        found.sort(key=lambda item: item[0])
+        return [(tracker_id, dist) for dist, tracker_id in found]
+
+    def nearest(self, x, y, k=1):
+        """[(tracker_id, distance)] of the k trackers nearest to (x, y)."""
+        if k <= 0 or not self.__positions:
+            return []
+        cx = floor(x / self.cell_size)
+        cy = floor(y / self.cell_size)
+        heap = []
+        found = []
+        order = 0  # breaks distance ties without comparing ids
+        ring = 0
+        while len(found) < k:
+            if 8 * ring >= len(self.__cells):
+                # The next rings have more cells than there are occupied ones,
+                # so take everything not seen yet at once
+                cells = [members for (col, row), members in self.__cells.items()
+                         if max(abs(col - cx), abs(row - cy)) >= ring]
+                bound = float("inf")
+            else:
+                cells = [self.__cells[cell] for cell in self.__ring(cx, cy, ring) if cell in self.__cells]
+                bound = ring * self.cell_size
+            for members in cells:
+                for tracker_id in members:
+                    tx, ty, _ = self.__positions[tracker_id]
+                    dist_x = tx - x
+                    dist_y = ty - y
+                    heapq.heappush(heap, (sqrt(dist_x * dist_x + dist_y * dist_y), order, tracker_id))
+                    order += 1
+            # Anything not queued yet is at least `bound` away
+            while heap and heap[0][0] <= bound and len(found) < k:
+                dist, _, tracker_id = heapq.heappop(heap)
+                found.append((tracker_id, dist))
+            if bound == float("inf"):
+                break
+            ring += 1
+        return found
+
+    def attach(self):
+        """Follow the fixes of every Tracker from now on."""
+        add_fix_listener(self.on_fix)
+
+    def detach(self):
+        remove_fix_listener(self.on_fix)
+
+    def on_fix(self, tracker, fix):
+        if fix.ok:
+            self.update(tracker.id, fix.x, fix.y)
+
+    def __leave(self, tracker_id, cell):
+        members = self.__cells[cell]
+        members.discard(tracker_id)
+        if not members:
+            del self.__cells[cell]
+
+    def __ring(self, cx, cy, ring):
+        # Cells at Chebyshev distance `ring` from (cx, cy)
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for col in range(cx - ring, cx + ring + 1):
+            yield (col, cy - ring)
+            yield (col, cy + ring)
+        for row in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, row)
+            yield (cx + ring, row)
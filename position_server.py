@@ -0,0 +1,215 @@
+"""Position service over TCP or a Unix socket.
+
+Clients send batches of readings in binary frames and subscribers get the
+position updates back. Every frame is a header followed by `count` fixed
+size little-endian records:
+
+    header      kind (u8), count (u32)
+    READINGS    receiver column (u16), tracker id (u32), distance (f64), timestamp (f64)
+    POSITIONS   tracker id (u32), status (u8), x (f64), y (f64), timestamp (f64)
+    LAYOUT      x (f64), y (f64), one per receiver column
+    SUBSCRIBE   no records
+
+A client sends READINGS frames, LAYOUT (count 0) to get the receiver
+columns back and SUBSCRIBE to have POSITIONS frames pushed to it. Readings
+go through stream.ReadingWindows, which leaves out the receivers quarantined
+at solve time, and all the frames that queued up while the previous batch
+was solved are solved together. x and y are NaN when the
+solve failed, status is the local_tracker Status.
+
+    python position_server.py --tcp 127.0.0.1:7400
+    python position_server.py --unix /tmp/local_tracker.sock
+"""
+import argparse
+import asyncio
+import struct
+
+import numpy as np
+
+from layouts import sample_layout
+from stream import BATCH_SIZE, MIN_READINGS, QUEUE_SIZE, WINDOW, Reading, ReadingWindows
+
+READINGS = 1
+POSITIONS = 2
+LAYOUT = 3
+SUBSCRIBE = 4
+
+HEADER = struct.Struct("<BI")
+READING_DTYPE = np.dtype([("receiver", "<u2"), ("tracker", "<u4"), ("distance", "<f8"), ("timestamp", "<f8")])
+POSITION_DTYPE = np.dtype([("tracker", "<u4"), ("status", "u1"), ("x", "<f8"), ("y", "<f8"), ("timestamp", "<f8")])
+LAYOUT_DTYPE = np.dtype([("x", "<f8"), ("y", "<f8")])
+RECORD_DTYPES = {READINGS: READING_DTYPE, POSITIONS: POSITION_DTYPE, LAYOUT: LAYOUT_DTYPE, SUBSCRIBE: None}
+
+MAX_RECORDS = 65536                  # larger frames are a protocol error
+SUBSCRIBER_BUFFER = 4 * 1024 * 1024  # subscribers further behind are dropped
+
+
+def encode_frame(kind, records=None):
+    """Header and records of a frame, as bytes."""
+    if records is None:
+        return HEADER.pack(kind, 0)
+    return HEADER.pack(kind, len(records)) + records.tobytes()
+
+
+async def read_frame(reader):
+    """Read the next frame. Returns (kind, records), records None for SUBSCRIBE.
+
+    Raises asyncio.IncompleteReadError when the peer closes and ValueError on
+    an unknown kind or an oversized frame.
+    """
+    kind, count = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if kind not in RECORD_DTYPES or count > MAX_RECORDS:
+        raise ValueError(f"Bad frame header ({kind}, {count})")
+    dtype = RECORD_DTYPES[kind]
+    if dtype is None:
+        return kind, None
+    return kind, np.frombuffer(await reader.readexactly(count * dtype.itemsize), dtype=dtype)
+
+
+class PositionServer():
+    """Solves the READINGS frames of its clients and pushes POSITIONS to subscribers.
+
+    Connections are handled by asyncio streams. Decoded frames wait in a
+    bounded queue for the solver task; while it is full the connections stop
+    reading, so the backpressure reaches the clients through their sockets.
+    Subscribers are written to without waiting, and dropped if they fall
+    more than SUBSCRIBER_BUFFER bytes behind.
+    """
+
+    def __init__(self, receivers, window=WINDOW, min_readings=MIN_READINGS,
+                 batch=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.windows = ReadingWindows(receivers, window, min_readings)
+        self.batch = batch
+        self.frames = 0
+        self.readings = 0
+        self.updates = 0
+        self.__queue = asyncio.Queue(queue_size)
+        self.__subscribers = set()
+        self.__connections = {}  # writer -> handler task
+        self.__servers = []
+        self.__solver = None
+
+    async def start_tcp(self, host="127.0.0.1", port=0):
+        """Listen on TCP, returns the (host, port) bound."""
+        server = await asyncio.start_server(self.__handle, host, port)
+        self.__start(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        self.__start(await asyncio.start_unix_server(self.__handle, path))
+
+    async def serve_forever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self.__servers))
+
+    async def close(self):
+        for server in self.__servers:
+            server.close()
+        # Handlers may be blocked on the full queue, which nothing drains once
+        # the solver is gone, so they are cancelled rather than waited for
+        tasks = list(self.__connections.values())
+        if self.__solver is not None:
+            tasks.append(self.__solver)
+            self.__solver = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for server in self.__servers:
+            await server.wait_closed()
+        self.__servers.clear()
+
+    def __start(self, server):
+        self.__servers.append(server)
+        if self.__solver is None:
+            self.__solver = asyncio.create_task(self.__solve_loop())
+
+    async def __handle(self, reader, writer):
+        self.__connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                kind, records = await read_frame(reader)
+                if kind == READINGS:
+                    self.frames += 1
+                    await self.__queue.put(records)
+                elif kind == SUBSCRIBE:
+                    self.__subscribers.add(writer)
+                elif kind == LAYOUT:
+                    layout = np.empty(len(self.windows.ids), dtype=LAYOUT_DTYPE)
+                    layout["x"] = self.windows.receiver_xy[:, 0]
+                    layout["y"] = self.windows.receiver_xy[:, 1]
+                    writer.write(encode_frame(LAYOUT, layout))
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # close(), the handler just ends (asyncio.streams logs a
+            # cancelled handler task as an error)
+            pass
+        finally:
+            self.__subscribers.discard(writer)
+            self.__connections.pop(writer, None)
+            writer.close()
+
+    async def __solve_loop(self):
+        windows = self.windows
+        ids = windows.ids
+        while True:
+            # Wait for a frame, then take the ones that queued up meanwhile
+            frames = [await self.__queue.get()]
+            while len(frames) < self.batch and not self.__queue.empty():
+                frames.append(self.__queue.get_nowait())
+
+            for records in frames:
+                self.readings += len(records)
+                for col, tracker, distance, timestamp in records.tolist():
+                    if col < len(ids):
+                        windows.add(Reading(ids[col], tracker, distance, timestamp))
+            results = windows.solve()
+            if results:
+                self.__publish(results)
+            # Let the connections run between batches
+            await asyncio.sleep(0)
+
+    def __publish(self, results):
+        positions = np.empty(len(results), dtype=POSITION_DTYPE)
+        positions["tracker"] = [tracker_id for tracker_id, _, _ in results]
+        positions["status"] = [fix.status for _, _, fix in results]
+        positions["x"] = [np.nan if fix.x is None else fix.x for _, _, fix in results]
+        positions["y"] = [np.nan if fix.y is None else fix.y for _, _, fix in results]
+        positions["timestamp"] = [timestamp for _, timestamp, _ in results]
+        self.updates += len(results)
+
+        frame = encode_frame(POSITIONS, positions)
+        for writer in list(self.__subscribers):
+            if writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER:
+                self.__subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(frame)
+
+
+async def serve(args):
+    server = PositionServer(sample_layout(), args.window, args.min_readings)
+    if args.unix:
+        await server.start_unix(args.unix)
+        print(f"Listening on {args.unix}")
+    else:
+        host, port = args.tcp.rsplit(":", 1)
+        print("Listening on {}:{}".format(*await server.start_tcp(host, int(port))))
+    await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve positions of the sample layout.")
+    parser.add_argument("--tcp", default="127.0.0.1:7400", help="host:port to listen on")
+    parser.add_argument("--unix", help="Unix socket path to listen on instead of TCP")
+    parser.add_argument("--window", type=float, default=WINDOW, help="staleness window of readings")
+    parser.add_argument("--min-readings", type=int, default=MIN_READINGS)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
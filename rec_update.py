@@ -1,4 +1,5 @@
 import pygame
+from constants import READING_EPSILON
 from receiver import Receiverobj
 from tracker import Trackedobj
 
@@ -14,26 +15,61 @@ def init_receivers():
         "Rec6": Receiverobj("Rec6", 600, 400),
     }
 
-def update_receivers(screen, receivers, tracked):
-    for rec in receivers.values():
-        rec.is_alive = True
-    
-    try:
-        calculated_x, calculated_y, receivers_used = tracked.find_position(receivers)
-    except ValueError as e:
-        print(f"error: {e.args[0]}")
-        return
-    
-    for rec in receivers.values():
-        if not rec.is_alive:
-            continue
-        rec.is_active = False
-        rec.is_primary = False
-        rec.locate(tracked)
-        if rec.name in receivers_used:
-            rec.is_active = True
-            pygame.draw.line(screen, "white", (calculated_x, calculated_y), (rec.x, rec.y), 1)
-        if rec.name in receivers_used[0:2]:
-            rec.is_primary = True
-            pygame.draw.circle(screen, "white", (rec.x, rec.y), int(tracked.report(rec)), 1)
-    return
\ No newline at end of file
+
+class ReceiverUpdater():
+    """Per-frame update of the receivers around a tracked object.
+
+    The distances to the receivers are measured once per frame. The position
+    is only solved again when one of them moved more than `epsilon` (or a
+    receiver came or went); otherwise the last fix and its overlays are
+    reused and the frame is counted in `skipped`.
+    """
+
+    def __init__(self, receivers, epsilon=READING_EPSILON):
+        self.receivers = receivers
+        self.epsilon = epsilon
+        self.solved = 0
+        self.skipped = 0
+        self.__readings = None
+        self.__overlays = []  # (draw function, arguments after the screen)
+
+    def update(self, screen, tracked):
+        # Returns the rects drawn, for the dirty-rect renderer
+        readings = {name: tracked.report(rec) for name, rec in self.receivers.items() if rec.is_alive}
+        if self.__changed(readings):
+            self.__solve(tracked, readings)
+        else:
+            self.skipped += 1
+        return [draw(screen, *args) for draw, *args in self.__overlays]
+
+    def __changed(self, readings):
+        last = self.__readings
+        if last is None or last.keys() != readings.keys():
+            return True
+        epsilon = self.epsilon
+        return any(abs(dist - last[name]) > epsilon for name, dist in readings.items())
+
+    def __solve(self, tracked, readings):
+        self.__readings = readings
+        self.__overlays = []
+        self.solved += 1
+        # Solved from the readings just taken, each receiver is measured once per frame
+        fix = tracked.locate(self.receivers, readings=readings)
+        if not fix.ok:
+            print(f"error: {fix.message}")
+            return
+        calculated_x, calculated_y, receivers_used = fix.x, fix.y, fix.receivers
+
+        for rec in self.receivers.values():
+            if not rec.is_alive:
+                continue
+            rec.is_active = False
+            rec.is_primary = False
+            distance = readings[rec.name]
+            rec.locate(distance)
+            if rec.name in receivers_used:
+                rec.is_active = True
+                self.__overlays.append((pygame.draw.line, "white", (calculated_x, calculated_y), (rec.x, rec.y), 1))
+            if rec.name in receivers_used[0:2]:
+                rec.is_primary = True
+                self.__overlays.append((pygame.draw.circle, "white", (rec.x, rec.y), int(distance), 1))
@@ -2,16 +2,18 @@ import pygame
 from constants import *
 from circleshape import CircleShape
 from local_tracker import Receiver
+from render import labels
 
 class Receiverobj(CircleShape, Receiver):
     def __init__(self, name, x, y, color="green"):
+        # The Receiver view has to exist before CircleShape sets x and y
+        Receiver.__init__(self, name, x, y)
         super().__init__(name, x, y)
         self.color = color
         self.radius = RECEIVER_RADIUS
         self.is_alive = True
         self.is_active = False
         self.is_primary = False
-        self.font = pygame.font.Font('freesansbold.ttf', 16)
         self.text = self.name
 
     def Draw(self, screen):
@@ -21,15 +23,13 @@ class Receiverobj(CircleShape, Receiver):
             self.color = "orange"
         else:
             self.color = "green"
-        pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius)
-        label = self.font.render(self.text, True, self.color)
-        textRect = label.get_rect()
-        textRect.topleft = (self.x + 10, self.y - 15)
-        screen.blit(label, textRect)
+        # Returns the area drawn, for the dirty-rect renderer
+        rect = pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius)
+        return rect.union(labels.blit(screen, self.text, self.color, (self.x + 10, self.y - 15)))
 
     def update(self, dt):
         pass
 
-    def locate(self, tracked):
-        self.text = f"{self.name}: {tracked.report(self):.2f}"
-        return
+    def locate(self, distance):
+        # Label with the distance the tracked object reported to this receiver
+        self.text = f"{self.name}: {distance:.2f}"
@@ -0,0 +1,200 @@
+from collections.abc import MutableMapping
+from heapq import heappush, heappop
+from math import floor, sqrt
+
+DEFAULT_CELL_SIZE = 200  # used until there are receivers to size the cells from
+
+
+class ReceiverIndex(MutableMapping):
+    """Receivers dict that keeps a uniform grid of the live receivers.
+
+    It can be passed to Tracker.find_position in place of a plain dict. The
+    grid is updated when receivers are added, removed, moved or toggled
+    with `is_alive` or `is_quarantined`, so every solve only reports to the receivers around the
+    tracker instead of measuring and sorting all of them.
+
+    By default the cells are sized from the density of the receivers, about
+    one receiver per cell (the side is sqrt(area / count) over their
+    bounding box), and the grid is rebuilt whenever the number of live
+    receivers doubles or halves. A `cell_size` given in pixels is kept as is.
+    """
+
+    def __init__(self, receivers=None, cell_size=None):
+        self.cell_size = DEFAULT_CELL_SIZE if cell_size is None else cell_size
+        self.__auto = cell_size is None
+        self.__sized_for = 0  # live receivers when the cell size was last derived
+        self.__receivers = {}
+        self.__keys = {}    # id(receiver) -> key in this index
+        self.__order = {}   # key -> insertion order, breaks distance ties
+        self.__cells = {}   # (cx, cy) -> set of keys
+        self.__cell_of = {} # key -> (cx, cy) for the receivers in the grid
+        self.__bounds = None
+        self.__counter = 0
+        if receivers:
+            self.update(receivers)
+
+    def __getitem__(self, rec_id):
+        return self.__receivers[rec_id]
+
+    def __setitem__(self, rec_id, rec):
+        if rec_id in self.__receivers:
+            del self[rec_id]
+        self.__receivers[rec_id] = rec
+        self.__keys[id(rec)] = rec_id
+        self.__order[rec_id] = self.__counter
+        self.__counter += 1
+        rec._indexes = rec._indexes + (self,)
+        self.refresh(rec)
+
+    def __delitem__(self, rec_id):
+        rec = self.__receivers.pop(rec_id)
+        del self.__keys[id(rec)]
+        del self.__order[rec_id]
+        rec._indexes = tuple(index for index in rec._indexes if index is not self)
+        self.__unplace(rec_id)
+
+    def __iter__(self):
+        return iter(self.__receivers)
+
+    def __len__(self):
+        return len(self.__receivers)
+
+    def refresh(self, rec):
+        """Re-file a receiver after its position, `is_alive` or `is_quarantined` changed."""
+        rec_id = self.__keys.get(id(rec))
+        if rec_id is None:
+            return
+        if not rec.is_alive or rec.is_quarantined:
+            self.__unplace(rec_id)
+            return
+
+        cell = self.__cell(rec.x, rec.y)
+        if self.__cell_of.get(rec_id) == cell:
+            return
+        self.__unplace(rec_id)
+        self.__cells.setdefault(cell, set()).add(rec_id)
+        self.__cell_of[rec_id] = cell
+        if self.__bounds is None:
+            self.__bounds = (cell[0], cell[1], cell[0], cell[1])
+        else:
+            min_x, min_y, max_x, max_y = self.__bounds
+            self.__bounds = (min(min_x, cell[0]), min(min_y, cell[1]),
+                             max(max_x, cell[0]), max(max_y, cell[1]))
+        if self.__auto and len(self.__cell_of) >= 2 * self.__sized_for:
+            self.__resize()
+
+    def nearest(self, x, y, z=0.0):
+        """Yield (id, receiver) for the live receivers, nearest to (x, y, z) first.
+
+        The grid is flat, but the distances are taken in 3D like the readings
+        of Tracker.report. On a single floor every z is 0 and the order is
+        the 2D one.
+        """
+        if self.__bounds is None:
+            return
+        cx, cy = self.__cell(x, y)
+
+        # Walk the grid in square rings around the cell of (x, y). After ring r
+        # is queued, every receiver not seen yet is at least r cells away, in
+        # the plane and so in 3D, so anything closer than that can already be
+        # handed out
+        heap = []
+        ring = 0
+        while True:
+            # Once the next rings have more cells than there are occupied
+            # ones, everything not seen yet is queued at once
+            everything = 8 * ring >= len(self.__cells)
+            if everything:
+                cells = [members for (col, row), members in self.__cells.items()
+                         if max(abs(col - cx), abs(row - cy)) >= ring]
+            else:
+                cells = [self.__cells[cell] for cell in self.__ring(cx, cy, ring) if cell in self.__cells]
+            for members in cells:
+                for rec_id in members:
+                    # Straight from the registry row, the properties cost more than the math
+                    rec = self.__receivers[rec_id]
+                    registry, row = rec._registry, rec._row
+                    dist_x = x - registry.x[row]
+                    dist_y = y - registry.y[row]
+                    dist_z = z - registry.z[row]
+                    dist = sqrt(dist_x * dist_x + dist_y * dist_y + dist_z * dist_z)
+                    heappush(heap, (dist, self.__order[rec_id], rec_id))
+            if everything:
+                break
+
+            bound = ring * self.cell_size
+            while heap and heap[0][0] < bound:
+                rec_id = heappop(heap)[2]
+                yield rec_id, self.__receivers[rec_id]
+            ring += 1
+
+        while heap:
+            rec_id = heappop(heap)[2]
+            yield rec_id, self.__receivers[rec_id]
+
+    def __cell(self, x, y):
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def __ring(self, cx, cy, ring):
+        # Cells at Chebyshev distance `ring` from (cx, cy), clipped to the
+        # bounding box of the occupied cells
+        min_x, min_y, max_x, max_y = self.__bounds
+        if ring == 0:
+            yield (cx, cy)
+            return
+        x_range = range(max(cx - ring, min_x), min(cx + ring, max_x) + 1)
+        for row in (cy - ring, cy + ring):
+            if min_y <= row <= max_y:
+                for col in x_range:
+                    yield (col, row)
+        y_range = range(max(cy - ring + 1, min_y), min(cy + ring - 1, max_y) + 1)
+        for col in (cx - ring, cx + ring):
+            if min_x <= col <= max_x:
+                for row in y_range:
+                    yield (col, row)
+
+    def __resize(self):
+        # Derive the cell size from the live receivers and file them again
+        placed = [(rec_id, self.__receivers[rec_id]) for rec_id in self.__cell_of]
+        self.__sized_for = len(placed)
+        if not placed:
+            return
+        xs = [rec.x for _, rec in placed]
+        ys = [rec.y for _, rec in placed]
+        width = max(xs) - min(xs)
+        height = max(ys) - min(ys)
+        if width * height > 0:
+            self.cell_size = sqrt(width * height / len(placed))
+        elif width + height > 0:
+            # Receivers along a line: their spacing along it
+            self.cell_size = (width + height) / len(placed)
+        else:
+            return
+
+        self.__cells = {}
+        self.__cell_of = {}
+        for rec_id, rec in placed:
+            cell = self.__cell(rec.x, rec.y)
+            self.__cells.setdefault(cell, set()).add(rec_id)
+            self.__cell_of[rec_id] = cell
+        cols = [cell[0] for cell in self.__cells]
+        rows = [cell[1] for cell in self.__cells]
+        self.__bounds = (min(cols), min(rows), max(cols), max(rows))
+
+    def __unplace(self, rec_id):
+        cell = self.__cell_of.pop(rec_id, None)
+        if cell is None:
+            return
+        members = self.__cells[cell]
+        members.discard(rec_id)
+        if not members:
+            del self.__cells[cell]
+            # Only an emptied cell can shrink the bounding box
+            if not self.__cells:
+                self.__bounds = None
+            elif cell[0] in (self.__bounds[0], self.__bounds[2]) or cell[1] in (self.__bounds[1], self.__bounds[3]):
+                cols = [c[0] for c in self.__cells]
+                rows = [c[1] for c in self.__cells]
+                self.__bounds = (min(cols), min(rows), max(cols), max(rows))
+        if self.__auto and len(self.__cell_of) < self.__sized_for // 2:
+            self.__resize()
@@ -0,0 +1,121 @@
+import time
+
+import pygame
+
+FONT_NAME = 'freesansbold.ttf'
+FONT_SIZE = 16
+LABEL_CACHE_SIZE = 2048  # rendered labels kept, the oldest go first
+BACKGROUND_COLOR = "lightgrey"
+OVERLAY_REFRESH = 0.5    # seconds between updates of the FPS overlay text
+
+
+class LabelCache():
+    """Rendered text surfaces by (text, color) with one shared font.
+
+    A label is only rendered again when its text or color changes, so static
+    names cost a blit per frame instead of a font.render.
+    """
+
+    def __init__(self, maxsize=LABEL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.__font = None
+        self.__surfaces = {}
+
+    @property
+    def font(self):
+        # Created on first use, pygame.font has to be initialized by then
+        if self.__font is None:
+            self.__font = pygame.font.Font(FONT_NAME, FONT_SIZE)
+        return self.__font
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.__surfaces.pop(key, None)
+        if surface is None:
+            surface = self.font.render(text, True, color)
+            if len(self.__surfaces) >= self.maxsize:
+                del self.__surfaces[next(iter(self.__surfaces))]
+        # Re-inserted so the dict stays in least recently used order
+        self.__surfaces[key] = surface
+        return surface
+
+    def blit(self, screen, text, color, topleft):
+        """Draw a label and return the Rect it covers."""
+        return screen.blit(self.render(text, color), topleft)
+
+    def __len__(self):
+        return len(self.__surfaces)
+
+
+# Shared by the receivers, the trackers and the overlay
+labels = LabelCache()
+
+
+def load_background(path, size):
+    """The floor plan over the background color, converted to the display format."""
+    background = pygame.Surface(size)
+    background.fill(BACKGROUND_COLOR)
+    background.blit(pygame.image.load(path), (0, 0))
+    return background.convert()
+
+
+class Renderer():
+    """Draws a frame over a prebuilt background, updating only what changed.
+
+    Between begin() and end() everything drawn is reported with add(). The
+    next begin() restores the background under those rects only, and end()
+    pushes the rects of both frames to the display. With dirty=False every
+    frame is a full blit and flip, for comparison.
+    """
+
+    def __init__(self, screen, background, dirty=True, show_fps=True, clock=None):
+        self.screen = screen
+        self.background = background
+        self.dirty = dirty
+        self.show_fps = show_fps
+        self.clock = clock
+        self.info = ""  # extra text for the overlay
+        self.__previous = []
+        self.__current = []
+        self.__started = 0.0
+        self.__frame_time = 0.0
+        self.__overlay = ""
+        self.__overlay_at = 0.0
+        screen.blit(background, (0, 0))
+        pygame.display.flip()
+
+    def begin(self):
+        self.__started = time.perf_counter()
+        if not self.dirty:
+            self.screen.blit(self.background, (0, 0))
+            return
+        for rect in self.__previous:
+            self.screen.blit(self.background, rect, rect)
+
+    def add(self, rects):
+        """Report a Rect, or a list of them, drawn this frame."""
+        if rects is None:
+            return
+        if isinstance(rects, pygame.Rect):
+            self.__current.append(rects)
+        else:
+            self.__current.extend(rects)
+
+    def end(self):
+        if self.show_fps:
+            self.add(self.__draw_overlay())
+        if self.dirty:
+            pygame.display.update(self.__previous + self.__current)
+        else:
+            pygame.display.flip()
+        self.__previous, self.__current = self.__current, []
+        self.__frame_time = time.perf_counter() - self.__started
+
+    def __draw_overlay(self):
+        # The text changes twice a second at most, not to churn the label cache
+        now = time.perf_counter()
+        if now - self.__overlay_at >= OVERLAY_REFRESH:
+            fps = self.clock.get_fps() if self.clock is not None else 0.0
+            self.__overlay = f"{fps:.0f} FPS  {self.__frame_time * 1000:.1f} ms/frame  {self.info}"
+            self.__overlay_at = now
+        return labels.blit(self.screen, self.__overlay, "black", (10, self.screen.get_height() - 25))
@@ -0,0 +1,259 @@
+"""Binary record and replay of measurement sessions.
+
+A Recorder solves trackers through Tracker.locate and logs, for every solve,
+the readings the tracker reported, the layout of the receivers it was given
+(whenever it changed) and the Fix. The log is a sequence of frames like the
+ones of position_server.py, a header followed by fixed size records:
+
+    header      kind (u8), count (u32)
+    NAMES       count bytes of JSON {"receivers": [...], "trackers": [...]},
+                ids seen for the first time, appended to the name tables
+    LAYOUT      receiver (u16), x (f64), y (f64), one per receiver given
+    READINGS    receiver (u16), distance (f64), of the next SOLVE
+    SOLVE       tracker (u32), time (f64), true x, y (f64), status (u8),
+                fix x, y (f64), receivers used (3 x i16, -1 when unused)
+
+replay() loads a log and runs it again as fast as possible through one of
+the solvers, Tracker.locate by default, then compares the results with the
+recorded fixes. It works as a regression test (exit status 1 on any
+mismatch) and as a benchmark on realistic data:
+
+    python local_tracker_tester.py --record session.bin
+    python simulate.py --trackers 50 --steps 200 --record session.bin
+    python replay.py session.bin --solver batch
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from local_tracker import Receiver, Status, Tracker, locate_batch, locate_lsq
+from position_server import HEADER, encode_frame
+
+NAMES = 1
+LAYOUT = 2
+READINGS = 3
+SOLVE = 4
+
+LAYOUT_DTYPE = np.dtype([("receiver", "<u2"), ("x", "<f8"), ("y", "<f8")])
+READING_DTYPE = np.dtype([("receiver", "<u2"), ("distance", "<f8")])
+SOLVE_DTYPE = np.dtype([("tracker", "<u4"), ("time", "<f8"), ("x", "<f8"), ("y", "<f8"), ("status", "u1"),
+                        ("fix_x", "<f8"), ("fix_y", "<f8"), ("used", "<i2", (3,))])
+RECORD_DTYPES = {NAMES: np.dtype("u1"), LAYOUT: LAYOUT_DTYPE, READINGS: READING_DTYPE, SOLVE: SOLVE_DTYPE}
+
+POSITION_TOLERANCE = 1e-9  # pixels a replayed fix may differ from the recorded one
+SHOWN_DIFFS = 10           # mismatches listed in the report
+
+
+class Recorder():
+    """Writes a session log, see the module docstring."""
+
+    def __init__(self, path, clock=time.time):
+        self.clock = clock
+        self.solves = 0
+        self.__file = open(path, "wb")
+        self.__receivers = {}  # receiver id -> index in the name table
+        self.__trackers = {}
+        self.__layout = None
+
+    def locate(self, tracker, receivers, **options):
+        """Tracker.locate, with its readings, layout and Fix logged.
+
+        The tracker reports to the receivers once, before it is moved to the
+        fix, and is solved from those readings (or from the `readings` given),
+        so the log holds exactly what the solver used.
+        """
+        self.layout(receivers)
+        readings = options.pop("readings", None)
+        if readings is None:
+            readings = {rec_id: tracker.report(rec) for rec_id, rec in receivers.items()
+                        if not rec.is_quarantined}
+        x, y = tracker.x, tracker.y
+        fix = tracker.locate(receivers, readings=readings, **options)
+
+        solve = np.zeros(1, dtype=SOLVE_DTYPE)
+        solve["tracker"] = self.__name(self.__trackers, "trackers", tracker.id)
+        solve["time"] = self.clock()
+        solve["x"], solve["y"] = x, y
+        solve["status"] = fix.status
+        solve["fix_x"] = np.nan if fix.x is None else fix.x
+        solve["fix_y"] = np.nan if fix.y is None else fix.y
+        used = [self.__receivers[rec_id] for rec_id in fix.receivers[:3]]
+        solve["used"] = used + [-1] * (3 - len(used))
+        records = [(self.__receivers[rec_id], dist) for rec_id, dist in readings.items()
+                   if not receivers[rec_id].is_quarantined]
+        self.__file.write(encode_frame(READINGS, np.array(records, dtype=READING_DTYPE)))
+        self.__file.write(encode_frame(SOLVE, solve))
+        self.solves += 1
+        return fix
+
+    def layout(self, receivers):
+        """Log the receivers given to the solver, if they changed since the last time."""
+        layout = [(rec_id, rec.x, rec.y) for rec_id, rec in receivers.items()]
+        if layout == self.__layout:
+            return
+        self.__layout = layout
+        records = [(self.__name(self.__receivers, "receivers", rec_id), x, y) for rec_id, x, y in layout]
+        self.__file.write(encode_frame(LAYOUT, np.array(records, dtype=LAYOUT_DTYPE)))
+
+    def close(self):
+        self.__file.close()
+
+    def __name(self, table, key, name):
+        index = table.get(name)
+        if index is None:
+            index = table[name] = len(table)
+            names = json.dumps({key: [name]}).encode()
+            self.__file.write(encode_frame(NAMES, np.frombuffer(names, dtype="u1")))
+        return index
+
+
+class Session():
+    """A log loaded in memory: the layouts, the solves and their readings."""
+
+    def __init__(self, path):
+        self.receiver_ids = []
+        self.tracker_ids = []
+        self.layouts = []     # [(receiver indexes, Mx2 coordinates)]
+        solves = []
+        layout_of = []        # layout index of each solve
+        readings = []
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            kind, count = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            dtype = RECORD_DTYPES.get(kind)
+            if dtype is None:
+                raise ValueError(f"Bad frame header ({kind}, {count}) at byte {offset - HEADER.size}")
+            records = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += count * dtype.itemsize
+            if kind == NAMES:
+                names = json.loads(records.tobytes())
+                self.receiver_ids += names.get("receivers", [])
+                self.tracker_ids += names.get("trackers", [])
+            elif kind == LAYOUT:
+                self.layouts.append((records["receiver"].astype(np.intp),
+                                     np.column_stack((records["x"], records["y"]))))
+            elif kind == READINGS:
+                readings.append(records)
+            else:
+                solves.append(records)
+                layout_of.append(len(self.layouts) - 1)
+        self.solves = np.concatenate(solves) if solves else np.zeros(0, dtype=SOLVE_DTYPE)
+        self.layout_of = np.array(layout_of, dtype=np.intp)
+        self.readings = readings
+
+    def __len__(self):
+        return len(self.solves)
+
+    def distances(self, rows, layout):
+        """Readings of the solves `rows` as a matrix over the columns of `layout`."""
+        ids, _ = self.layouts[layout]
+        columns = np.full(len(self.receiver_ids), -1)
+        columns[ids] = np.arange(len(ids))
+        matrix = np.full((len(rows), len(ids)), np.nan)
+        for i, row in enumerate(rows):
+            records = self.readings[row]
+            matrix[i, columns[records["receiver"]]] = records["distance"]
+        return matrix
+
+
+def replay_locate(session):
+    """Tracker.locate over the recorded readings, on the recorded layouts."""
+    status = np.zeros(len(session), dtype=np.int8)
+    positions = np.full((len(session), 2), np.nan)
+    tracker = Tracker("replay")
+    names = session.receiver_ids
+    layouts = [{names[i]: Receiver(names[i], x, y) for i, (x, y) in zip(ids.tolist(), xy.tolist())}
+               for ids, xy in session.layouts]
+    for row, layout in enumerate(session.layout_of.tolist()):
+        records = session.readings[row]
+        readings = {names[i]: dist for i, dist in zip(records["receiver"].tolist(), records["distance"].tolist())}
+        fix = tracker.locate(layouts[layout], readings=readings)
+        status[row] = fix.status
+        if fix.ok:
+            positions[row] = fix.x, fix.y
+    return positions, status
+
+
+def replay_batch(session, solver=locate_batch):
+    """locate_batch (or locate_lsq) over the recorded readings, a batch per layout."""
+    status = np.zeros(len(session), dtype=np.int8)
+    positions = np.full((len(session), 2), np.nan)
+    for layout, (_, receiver_xy) in enumerate(session.layouts):
+        rows = np.flatnonzero(session.layout_of == layout)
+        if len(rows):
+            positions[rows], status[rows] = solver(session.distances(rows, layout), receiver_xy)[:2]
+    return positions, status
+
+
+def replay_lsq(session):
+    return replay_batch(session, locate_lsq)
+
+
+SOLVERS = {"locate": replay_locate, "batch": replay_batch, "lsq": replay_lsq}
+
+
+class ReplayReport():
+    """Throughput of a replay and its differences with the recording."""
+
+    def __init__(self, session, positions, status, elapsed, tolerance=POSITION_TOLERANCE):
+        self.solves = len(session)
+        self.elapsed = elapsed
+        recorded = np.column_stack((session.solves["fix_x"], session.solves["fix_y"]))
+        self.recorded_status = session.solves["status"].astype(np.int8)
+        self.status = status
+        with np.errstate(invalid="ignore"):
+            moved = np.abs(positions - recorded).max(axis=1) > tolerance
+        # NaN on one side only is a difference too
+        moved |= np.isnan(positions).any(axis=1) != np.isnan(recorded).any(axis=1)
+        self.mismatches = np.flatnonzero((status != self.recorded_status) | moved)
+        self.__session = session
+        self.__positions = positions
+        self.__recorded = recorded
+
+    def summary(self):
+        lines = [f"{self.solves} solves in {self.elapsed:.3f} s: "
+                 f"{self.solves / max(self.elapsed, 1e-9):.0f} solves/s, {len(self.mismatches)} mismatches"]
+        for row in self.mismatches[:SHOWN_DIFFS].tolist():
+            solve = self.__session.solves[row]
+            tracker_id = self.__session.tracker_ids[solve["tracker"]]
+            lines.append(f"  #{row} {tracker_id} at ({solve['x']:.2f}, {solve['y']:.2f}): "
+                         f"recorded {Status(self.recorded_status[row]).name} {_point(self.__recorded[row])}, "
+                         f"replayed {Status(self.status[row]).name} {_point(self.__positions[row])}")
+        return "\n".join(lines)
+
+
+def _point(xy):
+    x, y = xy.tolist()
+    return f"({x:.4f}, {y:.4f})"
+
+
+def replay(path, solver="locate", tolerance=POSITION_TOLERANCE):
+    """Replay a log with a solver of SOLVERS, or a callable taking the Session
+    and returning (positions, status), and return a ReplayReport."""
+    session = Session(path)
+    solve = SOLVERS[solver] if isinstance(solver, str) else solver
+    start = time.perf_counter()
+    positions, status = solve(session)
+    elapsed = time.perf_counter() - start
+    return ReplayReport(session, positions, status, elapsed, tolerance)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session and compare the fixes.")
+    parser.add_argument("path")
+    parser.add_argument("--solver", default="locate", choices=list(SOLVERS))
+    parser.add_argument("--tolerance", type=float, default=POSITION_TOLERANCE, help="pixels")
+    args = parser.parse_args(argv)
+    report = replay(args.path, args.solver, args.tolerance)
+    print(report.summary())
+    return 1 if len(report.mismatches) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
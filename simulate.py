@@ -0,0 +1,209 @@
+"""Headless multi-tracker simulation.
+
+Moves N trackers over the canvas on a fixed timestep, either random walks
+or scripted paths, locates every one of them each step and reports the
+throughput, the failures by Status and the error of the fixes against the
+true positions. Nothing here imports pygame or tkinter, so it can run as a
+soak test on a server.
+
+    python simulate.py --trackers 200 --steps 500
+    python simulate.py --layout grid --receivers 100 --index --duration 3600 --report 60
+    python simulate.py --paths paths.json   # [[[x, y], [x, y], ...], ...]
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT, TRACKER_SPEED
+from layouts import LAYOUTS, sample_layout
+from local_tracker import Status, Tracker
+from receiver_index import ReceiverIndex
+from replay import Recorder
+
+DT = 1 / 60    # seconds per step, the frame time of the demos
+TURN = 0.5     # standard deviation of the heading change of a walk, radians per second
+ERROR_BINS = 20  # error histogram bins per decade, the p95 is within about 12% of the exact one
+
+
+class RandomWalk():
+    """Walks at constant speed with a slowly drifting heading, bouncing off the edges."""
+
+    def __init__(self, rng, speed=TRACKER_SPEED, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.rng = rng
+        self.speed = speed
+        self.width = width
+        self.height = height
+        self.x = rng.uniform(0, width)
+        self.y = rng.uniform(0, height)
+        self.heading = rng.uniform(0, 2 * math.pi)
+
+    def step(self, dt):
+        self.heading += self.rng.gauss(0, TURN * math.sqrt(dt))
+        x = self.x + math.cos(self.heading) * self.speed * dt
+        y = self.y + math.sin(self.heading) * self.speed * dt
+        if not 0 <= x <= self.width:
+            self.heading = math.pi - self.heading
+        if not 0 <= y <= self.height:
+            self.heading = -self.heading
+        self.x = max(0, min(self.width, x))
+        self.y = max(0, min(self.height, y))
+        return self.x, self.y
+
+
+class PathWalk():
+    """Goes round a closed list of waypoints at constant speed."""
+
+    def __init__(self, waypoints, speed=TRACKER_SPEED, offset=0.0, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.waypoints = [(max(0, min(width, x)), max(0, min(height, y))) for x, y in waypoints]
+        self.speed = speed
+        self.x, self.y = self.waypoints[0]
+        self.target = 1 % len(self.waypoints)
+        self.step(offset)
+
+    def step(self, dt):
+        travel = self.speed * dt
+        while travel > 0 and len(self.waypoints) > 1:
+            tx, ty = self.waypoints[self.target]
+            left = math.hypot(tx - self.x, ty - self.y)
+            if left > travel:
+                self.x += (tx - self.x) * travel / left
+                self.y += (ty - self.y) * travel / left
+                break
+            self.x, self.y = tx, ty
+            travel -= left
+            self.target = (self.target + 1) % len(self.waypoints)
+        return self.x, self.y
+
+
+class Report():
+    """Running totals of a simulation.
+
+    The fix errors are kept as a sum, a maximum and a histogram with
+    ERROR_BINS logarithmic bins per decade, so a soak test runs in constant
+    memory and the summary doesn't sort every error seen.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.fixes = 0
+        self.solve_ns = 0
+        self.status = Counter()
+        self.error_count = 0
+        self.error_sum = 0.0
+        self.error_max = 0.0
+        self.error_bins = Counter()  # bin -> fixes, errors of 0 in bin None
+
+    def add(self, fix, x, y, elapsed_ns):
+        self.fixes += 1
+        self.solve_ns += elapsed_ns
+        self.status[fix.status] += 1
+        if fix.ok:
+            error = math.hypot(fix.x - x, fix.y - y)
+            self.error_count += 1
+            self.error_sum += error
+            self.error_max = max(self.error_max, error)
+            self.error_bins[math.floor(math.log10(error) * ERROR_BINS) if error > 0 else None] += 1
+
+    def error_percentile(self, fraction):
+        """Upper edge of the histogram bin holding the given fraction of the errors."""
+        rank = min(self.error_count - 1, int(self.error_count * fraction))
+        seen = self.error_bins[None]
+        if rank < seen:
+            return 0.0
+        for index in sorted(key for key in self.error_bins if key is not None):
+            seen += self.error_bins[index]
+            if rank < seen:
+                return min(10 ** ((index + 1) / ERROR_BINS), self.error_max)
+        return self.error_max
+
+    def summary(self, wall):
+        lines = [f"{self.steps} steps, {self.fixes} fixes in {wall:.1f} s: "
+                 f"{self.fixes / wall:.0f} fixes/s overall, "
+                 f"{self.fixes / max(self.solve_ns, 1) * 1e9:.0f} fixes/s in the solver"]
+        for status in Status:
+            if self.status[status]:
+                lines.append(f"  {status.name:<13}{self.status[status]:>10}  {self.status[status] / self.fixes:7.2%}")
+        if self.error_count:
+            lines.append(f"  error: mean {self.error_sum / self.error_count:.3g}, "
+                         f"p95 {self.error_percentile(0.95):.3g}, max {self.error_max:.3g} px")
+        return "\n".join(lines)
+
+
+def make_walkers(args, rng):
+    if not args.paths:
+        return [RandomWalk(rng, args.speed) for _ in range(args.trackers)]
+    with open(args.paths) as f:
+        paths = json.load(f)
+    # Trackers share the paths round-robin, spread along them
+    return [PathWalk(paths[i % len(paths)], args.speed, offset=rng.uniform(0, 60))
+            for i in range(args.trackers)]
+
+
+def make_receivers(args):
+    if args.layout == "sample":
+        receivers = sample_layout()
+    else:
+        receivers = LAYOUTS[args.layout](args.receivers, SCREEN_WIDTH, SCREEN_HEIGHT)
+    return ReceiverIndex(receivers) if args.index else receivers
+
+
+def simulate(args, out=sys.stdout):
+    rng = random.Random(args.seed)
+    receivers = make_receivers(args)
+    walkers = make_walkers(args, rng)
+    trackers = [Tracker(f"T{i}") for i in range(len(walkers))]
+    recorder = Recorder(args.record) if args.record else None
+
+    report = Report()
+    start = time.perf_counter()
+    deadline = start + args.duration if args.duration else None
+    next_report = start + args.report if args.report else None
+    while True:
+        if deadline is None and report.steps >= args.steps:
+            break
+        now = time.perf_counter()
+        if deadline is not None and now >= deadline:
+            break
+        if next_report is not None and now >= next_report:
+            print(report.summary(now - start), file=out, flush=True)
+            next_report += args.report
+
+        for walker, tracker in zip(walkers, trackers):
+            x, y = walker.step(args.dt)
+            # The solver moves the tracker to its fix, so put it back on the truth
+            tracker.move_to(x, y)
+            begin = time.perf_counter_ns()
+            fix = tracker.locate(receivers) if recorder is None else recorder.locate(tracker, receivers)
+            report.add(fix, x, y, time.perf_counter_ns() - begin)
+        report.steps += 1
+
+    print(report.summary(time.perf_counter() - start), file=out)
+    if recorder is not None:
+        recorder.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless multi-tracker simulation.")
+    parser.add_argument("--trackers", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=600, help="steps to run, unless --duration is set")
+    parser.add_argument("--duration", type=float, help="seconds to run instead of a number of steps")
+    parser.add_argument("--report", type=float, help="print the running totals every this many seconds")
+    parser.add_argument("--dt", type=float, default=DT, help="simulated seconds per step")
+    parser.add_argument("--speed", type=float, default=TRACKER_SPEED, help="pixels per simulated second")
+    parser.add_argument("--layout", default="sample", choices=["sample"] + list(LAYOUTS))
+    parser.add_argument("--receivers", type=int, default=100, help="receivers of the synthetic layouts")
+    parser.add_argument("--index", action="store_true", help="use a ReceiverIndex")
+    parser.add_argument("--paths", help="JSON file with waypoint lists, instead of random walks")
+    parser.add_argument("--record", help="log the session for replay.py to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    simulate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Streaming ingestion of receiver readings.
+
+In the field distances don't come from Tracker.report but arrive from the
+receivers as Reading events, out of step and in bursts. ReadingWindows keeps
+the latest reading of every receiver per tracker, drops the ones older than
+the time window and solves the trackers that got new readings, all of them
+in one locate_batch call. solve_stream runs it over any iterable of readings
+and StreamPipeline over bounded asyncio queues, so a fast producer is made to
+wait instead of piling readings up in memory.
+"""
+import asyncio
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+from local_tracker import batch_fixes, locate_batch, quarantine_mask, receiver_table
+
+WINDOW = 1.0        # readings older than this, in timestamp units, are stale
+MIN_READINGS = 3    # fresh readings a tracker needs before it is solved
+BATCH_SIZE = 256    # readings taken in before solving the trackers they touched
+QUEUE_SIZE = 1024   # bound of the pipeline queues
+IDLE_WINDOWS = 10   # windows without readings before a tracker is forgotten
+
+Reading = namedtuple("Reading", ["receiver_id", "tracker_id", "distance", "timestamp"])
+
+
+class ReadingWindows():
+    """Latest reading of each receiver per tracker, within a time window."""
+
+    def __init__(self, receivers, window=WINDOW, min_readings=MIN_READINGS):
+        self.window = window
+        self.min_readings = min_readings
+        self.watermark = float("-inf")  # newest timestamp seen
+        self.dropped_stale = 0
+        self.dropped_unknown = 0
+        self.expired = 0
+        self.__readings = {}  # tracker id -> {receiver column: (distance, timestamp)}
+        self.__latest = {}    # tracker id -> newest timestamp of the tracker
+        self.__ready = {}     # tracker ids with new readings, in arrival order
+        self.__swept = float("-inf")
+        self.set_receivers(receivers)
+
+    def set_receivers(self, receivers):
+        """Switch to a new receivers layout. Buffered readings are dropped."""
+        self.receivers = receivers
+        self.ids, self.receiver_xy = receiver_table(receivers)
+        self.__columns = {rec_id: i for i, rec_id in enumerate(self.ids)}
+        self.__readings.clear()
+        self.__latest.clear()
+        self.__ready.clear()
+
+    def add(self, reading):
+        """Buffer a reading. Returns False when it is dropped as stale or unknown."""
+        col = self.__columns.get(reading.receiver_id)
+        if col is None:
+            self.dropped_unknown += 1
+            return False
+        tracker_id = reading.tracker_id
+        timestamp = reading.timestamp
+        latest = self.__latest.get(tracker_id, timestamp)
+        if timestamp < latest - self.window:
+            self.dropped_stale += 1
+            return False
+
+        readings = self.__readings.setdefault(tracker_id, {})
+        previous = readings.get(col)
+        if previous is not None and previous[1] > timestamp:
+            # A newer reading of the same receiver is already there
+            self.dropped_stale += 1
+            return False
+        readings[col] = (reading.distance, timestamp)
+        if timestamp > latest:
+            latest = timestamp
+        self.__latest[tracker_id] = latest
+        if timestamp > self.watermark:
+            self.watermark = timestamp
+        if len(readings) >= self.min_readings:
+            self.__ready[tracker_id] = None
+        return True
+
+    def solve(self):
+        """Solve the trackers with new readings. Returns [(tracker_id, timestamp, Fix)]."""
+        solved = []
+        rows = []
+        for tracker_id in self.__ready:
+            readings = self.__readings[tracker_id]
+            latest = self.__latest[tracker_id]
+            horizon = latest - self.window
+            fresh = {col: reading for col, reading in readings.items() if reading[1] >= horizon}
+            self.dropped_stale += len(readings) - len(fresh)
+            self.__readings[tracker_id] = fresh
+            if len(fresh) >= self.min_readings:
+                solved.append((tracker_id, latest))
+                rows.append(fresh)
+        self.__ready.clear()
+        if self.watermark - self.__swept > self.window:
+            self.expire(self.watermark - IDLE_WINDOWS * self.window)
+        if not rows:
+            return []
+
+        # One row per tracker, NaN for the receivers without a fresh reading
+        # and for the ones quarantined by the health monitor
+        distances = np.full((len(rows), len(self.ids)), np.nan)
+        for i, fresh in enumerate(rows):
+            cols = list(fresh)
+            distances[i, cols] = [fresh[col][0] for col in cols]
+        distances[:, quarantine_mask(self.receivers)] = np.nan
+        fixes = batch_fixes(self.ids, *locate_batch(distances, self.receiver_xy))
+        return [(tracker_id, latest, fix) for (tracker_id, latest), fix in zip(solved, fixes)]
+
+    def expire(self, horizon):
+        """Forget the trackers without readings since `horizon`."""
+        # Readings are only stale relative to their own tracker, so trackers
+        # on a lagging clock are not cut off. This only bounds the memory
+        # kept for the trackers that went quiet
+        for tracker_id in [tracker_id for tracker_id, latest in self.__latest.items() if latest < horizon]:
+            del self.__readings[tracker_id]
+            del self.__latest[tracker_id]
+            self.__ready.pop(tracker_id, None)
+            self.expired += 1
+        self.__swept = self.watermark
+
+    def __len__(self):
+        return len(self.__readings)
+
+
+def solve_stream(readings, receivers, window=WINDOW, min_readings=MIN_READINGS, batch=BATCH_SIZE):
+    """Yield (tracker_id, timestamp, Fix) from an iterable of Readings.
+
+    Readings are taken `batch` at a time, so only one batch is held in memory.
+    """
+    windows = ReadingWindows(receivers, window, min_readings)
+    readings = iter(readings)
+    for chunk in iter(lambda: list(islice(readings, batch)), []):
+        for reading in chunk:
+            windows.add(reading)
+        yield from windows.solve()
+
+
+class StreamPipeline():
+    """ReadingWindows between two bounded asyncio queues.
+
+    Producers `await put(reading)`, which blocks while the queue is full, run()
+    solves what has arrived since its last pass and consumers read the fixes
+    with `async for tracker_id, timestamp, fix in pipeline.results()`. close()
+    lets run() finish the readings already queued and end the results.
+    """
+
+    def __init__(self, receivers, window=WINDOW, min_readings=MIN_READINGS,
+                 batch=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.windows = ReadingWindows(receivers, window, min_readings)
+        self.batch = batch
+        self.readings = asyncio.Queue(queue_size)
+        self.fixes = asyncio.Queue(queue_size)
+
+    async def put(self, reading):
+        await self.readings.put(reading)
+
+    async def close(self):
+        await self.readings.put(None)
+
+    async def run(self):
+        windows = self.windows
+        done = False
+        while not done:
+            # Wait for a reading, then take whatever else is already queued
+            reading = await self.readings.get()
+            taken = 0
+            while True:
+                if reading is None:
+                    done = True
+                    break
+                windows.add(reading)
+                taken += 1
+                if taken == self.batch:
+                    break
+                try:
+                    reading = self.readings.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            for result in windows.solve():
+                await self.fixes.put(result)
+        await self.fixes.put(None)
+
+    async def results(self):
+        while True:
+            result = await self.fixes.get()
+            if result is None:
+                return
+            yield result
@@ -0,0 +1,34 @@
+"""locate_batch against Tracker.locate on the layouts of layouts.py."""
+import pytest
+
+from layouts import LAYOUT_HEIGHT, LAYOUT_WIDTH, collinear_layout, grid_layout, random_layout, random_points, sample_layout
+from local_tracker import Tracker, batch_fixes, distance_matrix, locate_batch, receiver_table
+
+LAYOUTS = {
+    "sample": sample_layout,
+    "grid": lambda: grid_layout(30),
+    "random": lambda: random_layout(40),
+    "collinear": lambda: collinear_layout(10),
+    "pair": lambda: {rec_id: rec for rec_id, rec in sample_layout().items() if rec_id in ("Rec1", "Rec3")},
+}
+
+# Random points and a lattice, which lands on the tangent and aligned cases
+POINTS = random_points(300) + [(x, y) for x in range(0, LAYOUT_WIDTH + 1, 50)
+                               for y in range(0, LAYOUT_HEIGHT + 1, 50)]
+
+
+@pytest.mark.parametrize("layout", list(LAYOUTS))
+def test_batch_matches_scalar(layout):
+    receivers = LAYOUTS[layout]()
+    trackers = [Tracker(f"T{i}", x, y) for i, (x, y) in enumerate(POINTS)]
+    ids, receiver_xy = receiver_table(receivers)
+    batch = batch_fixes(ids, *locate_batch(distance_matrix(trackers, receivers), receiver_xy))
+
+    for tracker, (x, y), fix in zip(trackers, POINTS, batch):
+        expected = tracker.locate(receivers)
+        assert fix.status == expected.status, (x, y)
+        if expected.ok:
+            # Both paths do the same operations in the same order
+            assert (fix.x, fix.y) == (expected.x, expected.y), (x, y)
+            assert fix.receivers == expected.receivers, (x, y)
+
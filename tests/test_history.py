@@ -0,0 +1,45 @@
+"""HistoryStore rows of the least-squares solvers, wider than three receivers."""
+import numpy as np
+import pytest
+
+from history import HistoryStore
+from layouts import random_layout, random_points
+from local_tracker import LSQ_RECEIVERS, Tracker, distance_matrix, locate_lsq, receiver_table
+
+
+def test_append_lsq_fixes(tmp_path):
+    receivers = random_layout(30)
+    ids, receiver_xy = receiver_table(receivers)
+    trackers = [Tracker(f"T{i}", x, y) for i, (x, y) in enumerate(random_points(50))]
+    positions, status, used, _, _ = locate_lsq(distance_matrix(trackers, receivers), receiver_xy)
+    assert used.shape[1] >= LSQ_RECEIVERS
+
+    history = HistoryStore(str(tmp_path / "history"), segment_rows=32, receiver_width=used.shape[1])
+    history.append_many(10.0, [tracker.id for tracker in trackers], positions, status, used, ids)
+    fix = trackers[0].locate_lsq(receivers)
+    history.append(20.0, trackers[0].id, fix.x, fix.y, fix.status, fix.receivers)
+
+    records = history.query(trackers[0].id, 0, 30)
+    assert len(records) == 2
+    expected = [ids[i] for i in used[0] if i >= 0]
+    assert [history.receivers[i] for i in records[0]["receivers"] if i >= 0] == expected
+    assert tuple(history.receivers[i] for i in records[1]["receivers"] if i >= 0) == fix.receivers
+    history.close()
+
+    # The width is kept by the store
+    history = HistoryStore(str(tmp_path / "history"))
+    assert history.receiver_width == used.shape[1]
+    assert np.array_equal(history.query(trackers[0].id, 0, 30), records)
+    history.close()
+
+
+def test_wider_fix_is_refused(tmp_path):
+    history = HistoryStore(str(tmp_path / "history"), segment_rows=32, receiver_width=3)
+    with pytest.raises(ValueError):
+        history.append(0.0, "T", 1.0, 2.0, 0, ("A", "B", "C", "D"))
+    with pytest.raises(ValueError):
+        history.append_many(0.0, ["T"], [(1.0, 2.0)], [0], [[0, 1, 2, 3]], ["A", "B", "C", "D"])
+    # Columns of padding only are dropped
+    history.append_many(0.0, ["T"], [(1.0, 2.0)], [0], [[0, 1, -1, -1]], ["A", "B"])
+    assert history.query("T", 0, 1)["receivers"].tolist() == [[0, 1, -1]]
+    history.close()
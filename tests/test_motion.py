@@ -0,0 +1,29 @@
+"""MotionTracker against a tracker that jumps onto the mirror image of its track."""
+from layouts import sample_layout
+from local_tracker import Tracker
+from motion import CONFIRM_EVERY, MotionTracker
+
+
+def test_teleport_does_not_lock_onto_the_mirror():
+    receivers = sample_layout()
+    motion = MotionTracker()
+    tracker = Tracker("T", 300, 250)
+    for i in range(30):
+        tracker.move_to(300, 250 + i * 0.5)
+        motion.locate(tracker, receivers)
+
+    # y=135 lands on the mirror of the prediction about the Rec1-Rec3 line
+    fixes = []
+    for i in range(3 * CONFIRM_EVERY):
+        y = 135 - i * 0.5
+        tracker.move_to(300, y)
+        fix = motion.locate(tracker, receivers)
+        assert fix.ok
+        fixes.append((fix, y))
+
+    wrong = [i for i, (fix, y) in enumerate(fixes) if abs(fix.y - y) > 1e-6]
+    assert wrong and max(wrong) < CONFIRM_EVERY
+    # Only unconfirmed picks may be wrong, and they never reach the filter
+    assert all(fixes[i][0].predicted for i in wrong)
+    x, y = motion.position(tracker.id)
+    assert abs(x - 300) < 1 and abs(y - fixes[-1][1]) < 1
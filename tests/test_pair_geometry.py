@@ -0,0 +1,34 @@
+"""The pair geometry cache of a Registry against moved and released receivers."""
+from local_tracker import Receiver, Registry, Status, Tracker
+
+
+def layout(registry):
+    return {rec_id: Receiver(rec_id, x, y, registry) for rec_id, x, y in
+            (("A", 200, 200), ("B", 400, 200), ("C", 300, 400))}
+
+
+def test_cache_follows_the_receivers():
+    registry = Registry()
+    receivers = layout(registry)
+    tracker = Tracker("T", 300, 260)
+    assert tracker.locate(receivers).status == Status.OK
+    assert tracker.locate(receivers).status == Status.OK
+    assert registry.pairs.hits == 1 and registry.pairs.misses == 1
+
+    # A moved receiver drops the cached pairs, the fix follows it
+    receivers["A"].x = 100
+    tracker.move_to(300, 260)
+    fix = tracker.locate(receivers)
+    assert fix.status == Status.OK and (fix.x, fix.y) == (300, 260)
+    assert registry.pairs.invalidations == 1 and registry.pairs.misses == 2
+
+    # A new layout reusing the rows of the old one doesn't get its pairs
+    del receivers
+    receivers = layout(registry)
+    receivers["B"].y = 150
+    del receivers["C"]
+    receivers["C"] = Receiver("C", 300, 400, registry)
+    tracker.move_to(260, 300)
+    fix = tracker.locate(receivers)
+    assert fix.status == Status.OK
+    assert abs(fix.x - 260) < 1e-6 and abs(fix.y - 300) < 1e-6
@@ -0,0 +1,60 @@
+"""PositionServer on a loopback socket: layout, readings, pushed fixes and close()."""
+import asyncio
+
+import numpy as np
+
+from layouts import sample_layout
+from local_tracker import Status
+from position_server import (LAYOUT, POSITIONS, READING_DTYPE, READINGS, SUBSCRIBE, PositionServer,
+                             encode_frame, read_frame)
+
+TIMEOUT = 5.0
+
+
+async def round_trip():
+    server = PositionServer(sample_layout())
+    host, port = await server.start_tcp("127.0.0.1", 0)
+    assert port != 0
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(encode_frame(LAYOUT))
+        kind, layout = await asyncio.wait_for(read_frame(reader), TIMEOUT)
+        assert kind == LAYOUT
+        receiver_xy = np.column_stack((layout["x"], layout["y"]))
+        assert np.array_equal(receiver_xy, server.windows.receiver_xy)
+
+        # Readings of one tracker from every receiver, on the subscribed
+        # connection, come back as a single position
+        writer.write(encode_frame(SUBSCRIBE))
+        readings = np.zeros(len(receiver_xy), dtype=READING_DTYPE)
+        readings["receiver"] = np.arange(len(receiver_xy))
+        readings["tracker"] = 7
+        readings["distance"] = np.hypot(*(receiver_xy - (300.0, 260.0)).T)
+        readings["timestamp"] = 12.5
+        writer.write(encode_frame(READINGS, readings))
+        await writer.drain()
+        kind, positions = await asyncio.wait_for(read_frame(reader), TIMEOUT)
+        assert kind == POSITIONS and len(positions) == 1
+        position = positions[0]
+        assert position["tracker"] == 7 and position["status"] == Status.OK
+        assert abs(position["x"] - 300) < 1e-6 and abs(position["y"] - 260) < 1e-6
+        assert position["timestamp"] == 12.5
+        assert (server.frames, server.readings, server.updates) == (1, len(readings), 1)
+    finally:
+        await asyncio.wait_for(server.close(), TIMEOUT)
+        # The server side of the connection is closed too
+        assert await asyncio.wait_for(reader.read(), TIMEOUT) == b""
+        writer.close()
+        await writer.wait_closed()
+
+    # Nothing listens on the port anymore
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return
+    writer.close()
+    raise AssertionError("the server still accepts connections")
+
+
+def test_round_trip_and_close():
+    asyncio.run(round_trip())
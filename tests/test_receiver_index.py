@@ -0,0 +1,17 @@
+"""ReceiverIndex.nearest against a plain sort of the readings."""
+from floors import FLOOR_HEIGHT, TRACKER_HEIGHT, stacked_layout
+from layouts import random_layout, random_points
+from local_tracker import Tracker
+from receiver_index import ReceiverIndex
+
+
+def test_nearest_ranks_by_the_readings():
+    # Three floors: the receivers right above or below a tracker are nearer
+    # in the plane than in 3D
+    receivers = stacked_layout(lambda: random_layout(40), floors=3)
+    index = ReceiverIndex(receivers)
+    for i, (x, y) in enumerate(random_points(50)):
+        tracker = Tracker("T", x, y, z=(i % 3) * FLOOR_HEIGHT + TRACKER_HEIGHT)
+        readings = sorted((tracker.report(rec), rec_id) for rec_id, rec in receivers.items())
+        ranked = [rec_id for rec_id, _ in index.nearest(tracker.x, tracker.y, tracker.z)]
+        assert ranked[:10] == [rec_id for _, rec_id in readings[:10]]
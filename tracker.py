@@ -2,39 +2,19 @@ import pygame
 from constants import *
 from circleshape import CircleShape
 from local_tracker import Receiver, Tracker
+from render import labels
 
 class Trackedobj(Tracker, CircleShape):
     def __init__(self, name, x, y, color="blue"):
         super().__init__(name, x, y)
         CircleShape.__init__(self, name, x, y)
         self.radius = TRACKER_RADIUS
-        self.font = pygame.font.Font('freesansbold.ttf', 16)
         self.color = color
 
-    @property
-    def x(self):
-        return self._Tracker__x  # Access the private __x
-    
-    @x.setter
-    def x(self, value):
-        self._Tracker__x = value
-        return
-
-    @property
-    def y(self):
-        return self._Tracker__y  # Access the private __y
-    
-    @y.setter
-    def y(self, value):
-        self._Tracker__y = value
-        return
-    
     def Draw(self, screen):
-        pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius)
-        label = self.font.render(self.name, True, self.color)
-        textRect = label.get_rect()
-        textRect.topleft = (self.x + 10, self.y + 10)
-        screen.blit(label, textRect)
+        # Returns the area drawn, for the dirty-rect renderer
+        rect = pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius)
+        return rect.union(labels.blit(screen, self.name, self.color, (self.x + 10, self.y + 10)))
 
     def update(self, dt):
         keys = pygame.key.get_pressed()
@@ -51,3 +31,14 @@ class Trackedobj(Tracker, CircleShape):
         self.x = max(0, min(SCREEN_WIDTH, self.x))
         self.y = max(0, min(SCREEN_HEIGHT, self.y))
 
+
+class WanderingTracker(Trackedobj):
+    # Random-walking tracker for load testing the display, drawn at its fix
+    def __init__(self, name, walk, receivers, color="purple"):
+        super().__init__(name, walk.x, walk.y, color)
+        self.walk = walk
+        self.receivers = receivers
+
+    def update(self, dt):
+        self.move_to(*self.walk.step(dt))
+        self.locate(self.receivers)
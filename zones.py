@@ -0,0 +1,225 @@
+"""Geofences over the floor plan.
+
+A ZoneIndex files the zone polygons in a grid of bounding boxes, so the
+points of a batch are only tested against the few zones of their cell, and
+the point-in-polygon tests of the whole batch run as one array operation.
+ZoneMonitor keeps which zones each tracker is in and reports the changes
+as enter/exit events, typically fed with the positions of locate_batch:
+
+    monitor = ZoneMonitor(ZoneIndex(sample_zones()))
+    positions, status, used = locate_batch(distances, receiver_xy)
+    for event in monitor.update(tracker_ids, positions):
+        if event.entered and event.zone.restricted:
+            ...
+"""
+import json
+from collections import namedtuple
+
+import numpy as np
+
+ZONE_CELL_SIZE = 50  # pixels, a few cells per room of the sample layout
+
+# Rooms of images/sample_layout.png as (name, restricted, polygon)
+SAMPLE_ZONES = [
+    ("Conference room", False, [(10, 15), (125, 15), (125, 165), (10, 165)]),
+    ("Unit A", False, [(125, 15), (370, 15), (370, 165), (125, 165)]),
+    ("Resuscitation room 1", True, [(370, 15), (510, 15), (510, 90), (455, 90), (455, 165), (370, 165)]),
+    ("Triage", False, [(455, 90), (510, 90), (510, 165), (455, 165)]),
+    ("Reception & public waiting area", False, [(510, 15), (790, 15), (790, 160), (510, 160)]),
+    ("Doctor's room", True, [(10, 165), (80, 165), (80, 370), (10, 370)]),
+    ("Toilet west", False, [(10, 370), (80, 370), (80, 435), (10, 435)]),
+    ("Triage area", False, [(465, 165), (565, 165), (565, 245), (465, 245)]),
+    ("Control station", True, [(565, 165), (635, 165), (635, 295), (565, 295)]),
+    ("Ambulance entrance", True, [(635, 165), (790, 165), (790, 295), (635, 295)]),
+    ("Decontamination room", True, [(122, 235), (180, 235), (180, 295), (158, 295), (158, 345), (122, 345)]),
+    ("Nurse's room", True, [(158, 295), (245, 295), (245, 385), (158, 385)]),
+    ("Toilet", False, [(122, 345), (158, 345), (158, 385), (218, 385), (218, 450), (122, 450)]),
+    ("Treatment room", True, [(300, 295), (372, 295), (372, 387), (300, 387)]),
+    ("Resuscitation room 2", True, [(410, 248), (495, 248), (495, 345), (410, 345)]),
+    ("Police office", True, [(495, 248), (565, 248), (565, 320), (495, 320)]),
+    ("Toilet police", False, [(530, 320), (565, 320), (565, 345), (530, 345)]),
+    ("Isolation area", True, [(495, 345), (565, 345), (565, 445), (495, 445)]),
+    ("NPIR 1", True, [(605, 295), (685, 295), (685, 365), (605, 365)]),
+    ("Toilet NPIR 1", False, [(685, 295), (730, 295), (730, 330), (685, 330)]),
+    ("Toilet NPIR 2", False, [(685, 330), (730, 330), (730, 365), (685, 365)]),
+    ("NPIR 2", True, [(655, 365), (730, 365), (730, 435), (655, 435)]),
+    ("Linen room", True, [(10, 495), (70, 495), (70, 580), (10, 580)]),
+    ("Doctor's room south", True, [(70, 495), (125, 495), (125, 580), (70, 580)]),
+    ("Unit B", False, [(125, 495), (610, 495), (610, 585), (125, 585)]),
+]
+
+ZoneEvent = namedtuple("ZoneEvent", ["tracker_id", "zone", "entered"])
+
+
+class Zone():
+    """A named polygon, `restricted` for the zones patients should stay out of."""
+    __slots__ = ("name", "polygon", "restricted", "bounds")
+
+    def __init__(self, name, polygon, restricted=False):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=float).reshape(-1, 2)
+        self.restricted = restricted
+        self.bounds = (*self.polygon.min(axis=0).tolist(), *self.polygon.max(axis=0).tolist())
+
+    def contains(self, xy):
+        """Even-odd test of the Nx2 points `xy`, returns a boolean array."""
+        px = xy[:, 0, None]
+        py = xy[:, 1, None]
+        x0 = self.polygon[:, 0]
+        y0 = self.polygon[:, 1]
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+        # Edges crossed by the horizontal ray going right from each point.
+        # Horizontal edges never straddle, their division is masked out
+        straddles = (y0 > py) != (y1 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        return ((straddles & (px < cross_x)).sum(axis=1) & 1).astype(bool)
+
+    def __repr__(self):
+        return f"Zone({self.name!r}, restricted={self.restricted})"
+
+
+def sample_zones():
+    """The rooms of images/sample_layout.png."""
+    return [Zone(name, polygon, restricted) for name, restricted, polygon in SAMPLE_ZONES]
+
+
+def load_zones(path):
+    """Read zones from a JSON list of {"name", "polygon", "restricted"} objects."""
+    with open(path) as f:
+        return [Zone(zone["name"], zone["polygon"], zone.get("restricted", False)) for zone in json.load(f)]
+
+
+class ZoneIndex():
+    """Grid of the zones by bounding box.
+
+    The grid is kept as flat arrays (the zones of cell k are
+    `cell_zones[cell_start[k]:cell_start[k + 1]]`) and the polygons as edge
+    arrays padded to the same length, so a whole batch is tested at once.
+    """
+
+    def __init__(self, zones, cell_size=ZONE_CELL_SIZE):
+        self.zones = list(zones)
+        self.cell_size = cell_size
+        if self.zones:
+            bounds = np.array([zone.bounds for zone in self.zones])
+            self.origin = bounds[:, :2].min(axis=0)
+            self.cols, self.rows = (np.floor((bounds[:, 2:].max(axis=0) - self.origin) / cell_size) + 1).astype(int).tolist()
+        else:
+            self.origin = np.zeros(2)
+            self.cols = self.rows = 0
+
+        cells = [[] for _ in range(self.cols * self.rows)]
+        for i, zone in enumerate(self.zones):
+            min_x, min_y, max_x, max_y = zone.bounds
+            (c0, r0), (c1, r1) = self.__cell(np.array([[min_x, min_y], [max_x, max_y]])).tolist()
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    cells[row * self.cols + col].append(i)
+        self.cell_start = np.zeros(len(cells) + 1, dtype=np.intp)
+        self.cell_start[1:] = np.cumsum([len(cell) for cell in cells])
+        self.cell_zones = np.array([i for cell in cells for i in cell], dtype=np.intp)
+
+        # Edges (x0, y0) -> (x1, y1) of every zone. Shorter polygons are padded
+        # with zero length edges, which never straddle a ray
+        edges = max((len(zone.polygon) for zone in self.zones), default=0)
+        start = np.zeros((len(self.zones), edges, 2))
+        end = np.zeros((len(self.zones), edges, 2))
+        for i, zone in enumerate(self.zones):
+            n = len(zone.polygon)
+            start[i] = end[i] = zone.polygon[0]
+            start[i, :n] = zone.polygon
+            end[i, :n] = np.roll(zone.polygon, -1, axis=0)
+        self.__edges = (start[..., 0], start[..., 1], end[..., 0], end[..., 1])
+
+    def locate(self, xy):
+        """Zones of the Nx2 points `xy` as parallel arrays (point rows, zone indexes).
+
+        NaN points (unresolved fixes) and points off the grid are in no zone.
+        """
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        cells = self.__cell(np.nan_to_num(xy, nan=-np.inf))
+        rows = np.flatnonzero(((cells >= 0) & (cells < (self.cols, self.rows))).all(axis=1))
+        keys = cells[rows, 1] * self.cols + cells[rows, 0]
+
+        # (point, zone) pairs of every point with the zones of its cell
+        first = self.cell_start[keys]
+        counts = self.cell_start[keys + 1] - first
+        points = np.repeat(rows, counts)
+        offsets = np.cumsum(counts) - counts
+        zones = self.cell_zones[np.arange(len(points)) - np.repeat(offsets - first, counts)]
+
+        # Even-odd test of all the pairs, see Zone.contains
+        px = xy[points, 0, None]
+        py = xy[points, 1, None]
+        x0, y0, x1, y1 = (edge[zones] for edge in self.__edges)
+        straddles = (y0 > py) != (y1 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        inside = ((straddles & (px < cross_x)).sum(axis=1) & 1).astype(bool)
+        return points[inside], zones[inside]
+
+    def __cell(self, xy):
+        with np.errstate(invalid="ignore"):
+            cells = np.floor((xy - self.origin) / self.cell_size)
+        return np.clip(cells, -1, max(self.cols, self.rows)).astype(np.intp)
+
+
+class ZoneMonitor():
+    """Zones each tracker is in, reporting ZoneEvents when that changes.
+
+    Memberships are kept as sorted int64 keys (tracker slot * zones + zone),
+    so the changes of a whole batch are two set differences.
+    """
+
+    def __init__(self, index):
+        self.index = index if isinstance(index, ZoneIndex) else ZoneIndex(index)
+        self.__slots = {}  # tracker id -> slot
+        self.__tracker_ids = []
+        self.__keys = np.zeros(0, dtype=np.int64)
+
+    def update(self, tracker_ids, positions):
+        """Take the positions (Nx2, NaN when unresolved) of some trackers and
+        return the enter/exit events. Trackers left out of the batch, or with
+        an unresolved position, keep their zones."""
+        xy = np.asarray(positions, dtype=float).reshape(-1, 2)
+        slots = np.fromiter((self.__slot(tracker_id) for tracker_id in tracker_ids), dtype=np.int64, count=len(xy))
+        resolved = ~np.isnan(xy).any(axis=1)
+        zone_count = len(self.index.zones)
+
+        points, zones = self.index.locate(xy)
+        new = np.unique(slots[points] * zone_count + zones)
+        seen = np.isin(self.__keys // max(zone_count, 1), slots[resolved])
+        old = self.__keys[seen]
+        entered = np.setdiff1d(new, old, assume_unique=True)
+        exited = np.setdiff1d(old, new, assume_unique=True)
+        self.__keys = np.union1d(self.__keys[~seen], new)
+
+        events = [ZoneEvent(self.__tracker_ids[key // zone_count], self.index.zones[key % zone_count], False)
+                  for key in exited.tolist()]
+        events += [ZoneEvent(self.__tracker_ids[key // zone_count], self.index.zones[key % zone_count], True)
+                   for key in entered.tolist()]
+        return events
+
+    def zones_of(self, tracker_id):
+        """Zones a tracker is in at the moment."""
+        slot = self.__slots.get(tracker_id)
+        if slot is None:
+            return []
+        zone_count = len(self.index.zones)
+        keys = self.__keys[self.__keys // zone_count == slot]
+        return [self.index.zones[key % zone_count] for key in keys.tolist()]
+
+    def occupants(self, zone):
+        """Ids of the trackers in `zone`."""
+        zone_count = len(self.index.zones)
+        i = self.index.zones.index(zone)
+        return [self.__tracker_ids[key // zone_count] for key in self.__keys[self.__keys % zone_count == i].tolist()]
+
+    def __slot(self, tracker_id):
+        slot = self.__slots.get(tracker_id)
+        if slot is None:
+            slot = self.__slots[tracker_id] = len(self.__tracker_ids)
+            self.__tracker_ids.append(tracker_id)
+        return slot